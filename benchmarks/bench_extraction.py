@@ -0,0 +1,284 @@
+"""Extraction throughput benchmark against the local mock OpenAI server.
+
+Builds synthetic datasets from the texts in ``data.csv`` and runs them through
+the app's own callbacks: ``start_processing`` submits the job and
+``process_next_batch`` is polled every tick, as the progress interval would.
+Each dataset size runs in a fresh process so peak RSS is per run.
+
+    python benchmarks/bench_extraction.py --rows 1000 10000 --latency-ms 200 --concurrency 32
+
+Reports rows/s, request latency percentiles (p50/p95/p99), peak RSS and the
+bytes each tick sends to and from the browser. ``--json`` also writes the
+results, to compare a change against an earlier baseline.
+
+Dispatch policies are compared on texts of mixed lengths, with the mock's
+latency growing with the text, by the makespan (seconds until every row is
+done) and the seconds until the first results reach the grid:
+
+    python benchmarks/bench_extraction.py --rows 2000 --dispatch file shortest bucketed \
+        --long-every 25 --long-factor 40 --ms-per-1k-tokens 2000
+"""
+
+import argparse
+import csv
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_SERVER = os.path.join(ROOT, "benchmarks", "mock_openai.py")
+sys.path.insert(0, ROOT)
+
+from data_rip.scheduling import DEFAULT_DISPATCH, DISPATCH_POLICIES  # noqa: E402
+from data_rip.streaming import STREAM_MODES  # noqa: E402
+
+SCHEMA = {
+    "properties": {
+        "topic": {"type": "string", "description": "Main topic of the message"},
+        "action_items": {"type": "array", "items": {"type": "string"}, "description": "Tasks mentioned"},
+        "word_count": {"type": "integer", "description": "Number of words"},
+    },
+    "required": ["topic", "action_items", "word_count"],
+}
+
+
+def build_dataset(
+    path: str, rows: int, source: str = os.path.join(ROOT, "data.csv"), long_every: int = 0, long_factor: int = 1
+) -> None:
+    """Write ``rows`` rows cycling through the source texts, each made distinct so none are deduplicated.
+
+    With ``long_every`` every so many rows repeat their text ``long_factor`` times.
+    """
+    with open(source, newline="", encoding="utf-8") as f:
+        texts = [row["response"] for row in csv.DictReader(f)]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["UID", "response"])
+        for index in range(rows):
+            text = texts[index % len(texts)]
+            if long_every and index % long_every == 0:
+                text = "\n\n".join([text] * long_factor)
+            writer.writerow([index, f"{text}\n\nReference {index}"])
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+def payload_bytes(value: object) -> int:
+    import dash
+    from plotly.io.json import to_json_plotly
+
+    if value is dash.no_update:
+        return 0
+    return len(to_json_plotly(value).encode("utf-8"))
+
+
+def run_one(args: argparse.Namespace, base_url: str, workdir: str) -> dict:
+    """Run one dataset size and dispatch policy through the app callbacks in this process."""
+    os.environ.update(
+        {
+            "DATA_RIP_API_KEY": "mock",
+            "DATA_RIP_BASE_URL": base_url,
+            "DATA_RIP_CONCURRENCY": str(args.concurrency),
+            "DATA_RIP_RPM": str(args.client_rpm),
+            "DATA_RIP_TPM": str(args.client_tpm),
+            "DATA_RIP_CACHE_PATH": "off",
+            "DATA_RIP_JOB_DB": os.path.join(workdir, "jobs.db"),
+            "DATA_RIP_UPLOAD_DIR": workdir,
+        }
+    )
+    import httpx
+
+    from data_rip import app as data_rip_app
+    from data_rip.ingest import count_rows, file_digest
+
+    # Time every HTTP request, retries included, with httpx event hooks. A streamed request counts until its
+    # response starts, the first field is timed by the engine
+    latencies: list[float] = []
+
+    def on_request(request: httpx.Request) -> None:
+        request.extensions["started"] = time.perf_counter()
+
+    def on_response(response: httpx.Response) -> None:
+        latencies.append(time.perf_counter() - response.request.extensions["started"])
+
+    # Same pooled client as the app, with the timing hooks added, set before the engine is built around it
+    services = data_rip_app.services
+    services.client = services.backend.make_client(event_hooks={"request": [on_request], "response": [on_response]})
+    services.engine.dispatch = args.run_dispatch
+    if args.stream is not None:
+        services.engine.stream = args.stream
+
+    dataset = os.path.join(workdir, f"bench_{args.run_one}.csv")
+    build_dataset(dataset, args.run_one, long_every=args.long_every, long_factor=args.long_factor)
+    upload = {
+        "path": dataset,
+        "filename": os.path.basename(dataset),
+        "sha256": file_digest(dataset),
+        "total_rows": count_rows(dataset),
+    }
+
+    started = time.perf_counter()
+    state = data_rip_app.start_processing(1, SCHEMA, upload, "UID", "response", False, args.pack_size)[0]
+    submitted = time.perf_counter()
+
+    ticks, sent_bytes, received_bytes, first_result = 0, [], [], None
+    while state["processing"]:
+        time.sleep(args.tick_seconds)
+        sent_bytes.append(payload_bytes(state))
+        outputs = data_rip_app.process_next_batch(ticks, state)
+        received_bytes.append(sum(payload_bytes(output) for output in outputs))
+        state = outputs[5]
+        ticks += 1
+        if first_result is None and state["rows_sent"]:
+            first_result = time.perf_counter() - started
+    elapsed = time.perf_counter() - started
+
+    job_id = state["job_id"]
+    progress = services.engine.store.get_progress(job_id)
+    stats = services.engine.stats[job_id]
+    return {
+        "rows": args.run_one,
+        "dispatch": args.run_dispatch,
+        "completed": progress["completed"],
+        "failed": progress["failed"],
+        # Makespan, until every row has finished and reached the grid
+        "seconds": round(elapsed, 3),
+        "first_result_seconds": round(first_result or elapsed, 3),
+        "submit_seconds": round(submitted - started, 3),
+        "rows_per_second": round(progress["completed"] / elapsed, 2),
+        "requests": int(stats["requests"]),
+        "retries": int(stats["retries"]),
+        "http_calls": len(latencies),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        # Mean time until a streamed answer's first field closed, 0 without streaming
+        "first_field_ms": round((services.engine.throughput(job_id)["mean_first_field"] or 0) * 1000, 1),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "ticks": ticks,
+        "tick_bytes_out_mean": int(statistics.mean(received_bytes)) if received_bytes else 0,
+        "tick_bytes_out_max": max(received_bytes, default=0),
+        "tick_bytes_in_mean": int(statistics.mean(sent_bytes)) if sent_bytes else 0,
+    }
+
+
+def start_mock_server(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            MOCK_SERVER,
+            f"--latency-ms={args.latency_ms}",
+            f"--jitter-ms={args.jitter_ms}",
+            f"--error-rate={args.error_rate}",
+            f"--ms-per-1k-tokens={args.ms_per_1k_tokens}",
+            f"--rpm={args.server_rpm}",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return server, server.stdout.readline().strip()
+
+
+def run_size(args: argparse.Namespace, argv: list[str], rows: int, dispatch: str) -> dict:
+    """Run one dataset size and dispatch policy in a child process against its own mock server."""
+    server, base_url = start_mock_server(args)
+    try:
+        with tempfile.TemporaryDirectory(prefix="data_rip_bench_") as workdir:
+            child = subprocess.run(
+                [sys.executable, __file__, *argv, f"--run-one={rows}", f"--run-dispatch={dispatch}",
+                 f"--base-url={base_url}", f"--workdir={workdir}"],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            return json.loads(child.stdout.strip().splitlines()[-1])
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def print_table(results: list[dict]) -> None:
+    columns = [
+        ("rows", "rows"),
+        ("dispatch", "dispatch"),
+        ("seconds", "seconds"),
+        ("first s", "first_result_seconds"),
+        ("rows/s", "rows_per_second"),
+        ("p50 ms", "latency_p50_ms"),
+        ("p95 ms", "latency_p95_ms"),
+        ("p99 ms", "latency_p99_ms"),
+        ("1st field ms", "first_field_ms"),
+        ("failed", "failed"),
+        ("retries", "retries"),
+        ("RSS MB", "peak_rss_mb"),
+        ("bytes/tick", "tick_bytes_out_mean"),
+        ("max bytes/tick", "tick_bytes_out_max"),
+    ]
+    widths = [max(len(title), *(len(str(result[key])) for result in results)) for title, key in columns]
+    print("  ".join(title.rjust(width) for (title, _), width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[key]).rjust(width) for (_, key), width in zip(columns, widths)))
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000], help="Dataset sizes to run")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Mean mock response latency")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="Standard deviation of the mock latency")
+    parser.add_argument(
+        "--ms-per-1k-tokens", type=float, default=0.0, help="Mock latency added per 1000 tokens of row text"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock requests failing with a 500")
+    parser.add_argument("--server-rpm", type=int, default=0, help="Mock server requests per minute, 0 for no limit")
+    parser.add_argument("--client-rpm", type=int, default=1_000_000, help="Client side DATA_RIP_RPM limit")
+    parser.add_argument("--client-tpm", type=int, default=1_000_000_000, help="Client side DATA_RIP_TPM limit")
+    parser.add_argument("--concurrency", type=int, default=16, help="Extraction worker threads")
+    parser.add_argument("--pack-size", type=int, default=1, help="Rows packed into each request")
+    parser.add_argument("--tick-seconds", type=float, default=0.5, help="Progress poll interval")
+    parser.add_argument(
+        "--dispatch", nargs="+", choices=DISPATCH_POLICIES, default=[DEFAULT_DISPATCH], help="Dispatch policies to run"
+    )
+    parser.add_argument("--stream", choices=STREAM_MODES, help="Stream mode, DATA_RIP_STREAM by default")
+    parser.add_argument("--long-every", type=int, default=0, help="Make every so many rows long, 0 for none")
+    parser.add_argument("--long-factor", type=int, default=20, help="Times a long row repeats its text")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    # Set by run_size for the child process that runs a single size
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--run-dispatch", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.run_one is not None:
+        print(json.dumps(run_one(args, args.base_url, args.workdir)))
+        return
+
+    results = []
+    for rows in args.rows:
+        for dispatch in args.dispatch:
+            print(f"Running {rows} rows, {dispatch} dispatch...", file=sys.stderr)
+            results.append(run_size(args, argv, rows, dispatch))
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": {k: v for k, v in vars(args).items() if v is not None}, "results": results}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
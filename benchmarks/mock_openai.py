@@ -0,0 +1,224 @@
+"""Local fake of the OpenAI chat completions endpoint for benchmarks.
+
+Answers forced function calls with arguments generated from the tool's JSON
+schema, after a configurable latency (optionally growing with the prompt's
+length), and can inject server errors and 429 rate limits. Packed requests (a ``results`` array with ``row_id``) get one
+result per ``<row id="...">`` in the prompt. Streamed requests get the first
+half of the latency before the first event and the arguments spread over the
+rest, ``--stream-piece`` characters per event.
+
+    python benchmarks/mock_openai.py --port 8089 --latency-ms 300 --error-rate 0.01 --rpm 3000
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RateLimit:
+    """Fixed one minute window of requests, like the API's per minute limits."""
+
+    def __init__(self, rpm: int):
+        self.rpm = rpm
+        self._window = time.monotonic()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def take(self) -> tuple[bool, int, float]:
+        """Whether a request is allowed, the requests remaining and seconds until the window resets."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window >= 60:
+                self._window, self._used = now, 0
+            reset = 60 - (now - self._window)
+            if self.rpm and self._used >= self.rpm:
+                return False, 0, reset
+            self._used += 1
+            return True, max(self.rpm - self._used, 0), reset
+
+
+def fake_value(schema: dict, text: str) -> object:
+    kind = schema.get("type", "string")
+    if kind == "integer":
+        return len(text)
+    if kind == "number":
+        return len(text) / 10
+    if kind == "boolean":
+        return len(text) % 2 == 0
+    if kind == "array":
+        return [fake_value(schema.get("items", {}), word) for word in text.split()[:3]]
+    if kind == "object":
+        return {name: fake_value(prop, text) for name, prop in schema.get("properties", {}).items()}
+    return " ".join(text.split()[:4])
+
+
+def fake_arguments(parameters: dict, text: str) -> dict:
+    results = parameters["properties"].get("results", {})
+    items = results.get("items", {})
+    if results.get("type") == "array" and "row_id" in items.get("properties", {}):
+        rows = re.findall(r'<row id="(.*?)">\n(.*?)\n</row>', text, re.DOTALL)
+        return {"results": [{**fake_value(items, row_text), "row_id": row_id} for row_id, row_text in rows]}
+    return fake_value(parameters, text)
+
+
+def make_handler(args: argparse.Namespace, rate_limit: RateLimit) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *log_args: object) -> None:  # noqa: A002
+            pass
+
+        def _send(self, status: int, body: dict, headers: dict | None = None) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _stream(
+            self, request: dict, function: dict, arguments: str, usage: dict, seconds: float, headers: dict
+        ) -> None:
+            """Send the tool call as server-sent events, in chunked transfer encoding."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            completion_id, created = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+
+            def event(choices: list, **extra: object) -> bytes:
+                body = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": request["model"],
+                    "choices": choices,
+                    **extra,
+                }
+                data = f"data: {json.dumps(body)}\n\n".encode("utf-8")
+                return f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n"
+
+            size = args.stream_piece
+            pieces = [arguments[start : start + size] for start in range(0, len(arguments), size)]
+            try:
+                for index, piece in enumerate(pieces):
+                    call = {"index": 0, "function": {"arguments": piece}}
+                    if not index:
+                        call.update(id=f"call_{uuid.uuid4().hex[:24]}", type="function")
+                        call["function"]["name"] = function["name"]
+                    self.wfile.write(event([{"index": 0, "delta": {"tool_calls": [call]}, "finish_reason": None}]))
+                    self.wfile.flush()
+                    time.sleep(seconds / len(pieces))
+                self.wfile.write(event([{"index": 0, "delta": {}, "finish_reason": "tool_calls"}]))
+                if request.get("stream_options", {}).get("include_usage"):
+                    self.wfile.write(event([], usage=usage))
+                done = b"data: [DONE]\n\n"
+                self.wfile.write(f"{len(done):x}\r\n".encode("ascii") + done + b"\r\n0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading once it had the fields it needed
+                self.close_connection = True
+
+        def do_POST(self) -> None:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if not self.path.endswith("/chat/completions"):
+                self._send(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+                return
+
+            allowed, remaining, reset = rate_limit.take()
+            limit_headers = {
+                "x-ratelimit-limit-requests": str(args.rpm or 1_000_000),
+                "x-ratelimit-remaining-requests": str(remaining if args.rpm else 1_000_000),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            }
+            if not allowed:
+                self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, limit_headers)
+                return
+
+            text = "\n".join(str(message.get("content", "")) for message in request["messages"][1:])
+            latency_ms = random.gauss(args.latency_ms, args.jitter_ms)  # noqa: S311
+            # Longer prompts take longer, at about four characters per token
+            latency_ms += args.ms_per_1k_tokens * len(text) / 4000
+            streamed = request.get("stream", False)
+            seconds = max(0.0, latency_ms) / 1000
+            time.sleep(seconds / 2 if streamed else seconds)
+            if random.random() < args.error_rate:  # noqa: S311
+                self._send(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+                return
+
+            function = request["tools"][0]["function"]
+            arguments = json.dumps(fake_arguments(function["parameters"], text))
+            prompt = json.dumps(request["messages"]) + json.dumps(request["tools"])
+            usage = {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(arguments) // 4,
+                "total_tokens": len(prompt) // 4 + len(arguments) // 4,
+            }
+            if streamed:
+                self._stream(request, function, arguments, usage, seconds / 2, limit_headers)
+                return
+            self._send(
+                200,
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "tool_calls",
+                            "message": {
+                                "role": "assistant",
+                                "content": None,
+                                "tool_calls": [
+                                    {
+                                        "id": f"call_{uuid.uuid4().hex[:24]}",
+                                        "type": "function",
+                                        "function": {"name": function["name"], "arguments": arguments},
+                                    }
+                                ],
+                            },
+                        }
+                    ],
+                    "usage": usage,
+                },
+                limit_headers,
+            )
+
+    return Handler
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=0, help="Port to listen on, 0 picks a free one")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="Standard deviation of the latency")
+    parser.add_argument(
+        "--ms-per-1k-tokens", type=float, default=0.0, help="Latency added per 1000 tokens of row text"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before 429s, 0 for no limit")
+    parser.add_argument("--stream-piece", type=int, default=16, help="Argument characters per streamed event")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args, RateLimit(args.rpm)))
+    server.daemon_threads = True
+    # The benchmark reads the base URL from the first line of output
+    print(f"http://127.0.0.1:{server.server_address[1]}/v1", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
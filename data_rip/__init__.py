@@ -0,0 +1,19 @@
+import importlib
+from typing import Any
+
+__all__ = ["build_tools", "clean_schema", "extract_file", "generate_schema"]
+
+# Loaded on first access, so importing one submodule (prompts, the engine)
+# doesn't pull in pandas and the openai package through extract_file
+_EXPORTS = {
+    "build_tools": "data_rip.schema",
+    "clean_schema": "data_rip.schema",
+    "extract_file": "data_rip.extract",
+    "generate_schema": "data_rip.schema",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'data_rip' has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
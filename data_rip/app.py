@@ -1,31 +1,196 @@
-import base64
-import io
-import json
-import os
+import functools
+import threading
+import time
 
 import dash
-import dash_ag_grid as dag
-import dash_bootstrap_components as dbc
-import openai
-import pandas as pd
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
+from flask import Response, jsonify
 from collections import deque
 from datetime import datetime
 
-from data_rip.prompts import FUNCTION_CALLING_FEW_SHOTS_DICT, FUNCTION_CALLING_SYS_PROMPT
+from data_rip.backends import Backend, make_backend
+from data_rip.batch import TERMINAL_STATUSES, BatchRunner
+from data_rip.cache import make_result_cache
+from data_rip.engine import DEFAULT_MODEL, ExtractionEngine
+from data_rip.export import EXPORT_FORMATS, stream_export
+from data_rip.ingest import (
+    count_rows,
+    file_digest,
+    iter_rows,
+    prune_uploads,
+    read_columns,
+    read_page,
+    resolve_upload,
+    spool_upload,
+    upload_id,
+)
+from data_rip.jobs import RESULT_PAGE_SIZE, job_key, make_job_store
+from data_rip.metrics import MetricsRecorder
+from data_rip.near_duplicates import make_near_duplicate_finder
+from data_rip.preview import project_run, stratified_sample
+from data_rip.schema import FUNCTION_NAME, build_tools, clean_schema, generate_schema
+from data_rip.scheduling import CANCELLED, INTERACTIVE_PRIORITY, PAUSED
+from data_rip.worker import enqueue_extraction
+from data_rip.workqueue import make_work_queue
 
-# Initialize the OpenAI API
-client = openai.Client(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Initialize the Dash app
-app = dash.Dash(
-    __name__, 
-    external_stylesheets=[
-        dbc.themes.CYBORG,
-        "https://use.fontawesome.com/releases/v5.15.4/css/all.css"
-    ]  # Using CYBORG as base theme for dark mode and Font Awesome for icons
-)
+def _built_once(build):
+    # functools.cached_property, but callbacks racing on a cold start share one instance
+    @functools.wraps(build)
+    def get(self):
+        with self._lock:
+            if build.__name__ not in self.__dict__:
+                self.__dict__[build.__name__] = build(self)
+            return self.__dict__[build.__name__]
+    return functools.cached_property(get)
+
+
+class AppServices:
+    """The OpenAI client, extraction engine and runners behind the callbacks, each built on first use.
+
+    Importing the app, building it or serving the page creates none of them,
+    the first schema or extraction request does. Any of them can be set
+    before then to replace it.
+    """
+
+    def __init__(self, backend: Backend | None = None):
+        # The OpenAI API, or the OpenAI-compatible server DATA_RIP_BACKEND points at
+        self.backend = backend or make_backend()
+        self._lock = threading.RLock()
+
+    @_built_once
+    def client(self):
+        # One pooled HTTP client for every call
+        return self.backend.make_client()
+
+    @_built_once
+    def scheduler(self):
+        # Every chat completion shares one rate limited, retrying scheduler
+        return self.backend.make_scheduler(self.client)
+
+    @_built_once
+    def metrics(self):
+        return MetricsRecorder(priced=self.backend.priced)
+
+    @_built_once
+    def engine(self):
+        # Row extraction runs server-side on a pool of worker threads, results are
+        # checkpointed in a SQLite job store keyed by job id, and previously extracted
+        # rows are served from an on-disk result cache. Rows with bad answers are
+        # escalated to a stronger model, and with DATA_RIP_NEAR_DUPLICATES set
+        # near-duplicate texts are extracted once. Streamed rows show their fields as they arrive
+        return ExtractionEngine(
+            self.client,
+            store=make_job_store(),
+            max_workers=self.backend.concurrency,
+            cache=make_result_cache(),
+            scheduler=self.scheduler,
+            metrics=self.metrics,
+            prompt_cache_key=self.backend.prompt_cache_key,
+            router=self.backend.make_router(),
+            near_duplicates=make_near_duplicate_finder(),
+            stream=self.backend.stream,
+        )
+
+    @_built_once
+    def batch_runner(self):
+        # Bulk mode submits the whole queue through the Batch API instead
+        return BatchRunner(self.client, self.engine.store)
+
+    @_built_once
+    def work_queue(self):
+        # With DATA_RIP_WORK_QUEUE set, jobs are run by data-rip-worker processes and
+        # this process only reports their progress from the shared job store
+        return make_work_queue()
+
+
+services = AppServices()
+
+# Callbacks are declared next to their functions and attached to each app create_app builds
+CALLBACKS = []
+
+
+def app_callback(*args, **kwargs):
+    def register(function):
+        CALLBACKS.append((function, args, kwargs))
+        return function
+    return register
+
+
+def create_app():
+    """Build the Dash app: layout, callbacks and the metrics and export routes.
+
+    The bootstrap and ag-grid components are only imported here, pandas on
+    the first upload and the openai package with the first client.
+    """
+    import dash_bootstrap_components as dbc
+
+    app = dash.Dash(
+        __name__, 
+        external_stylesheets=[
+            dbc.themes.CYBORG,
+            "https://use.fontawesome.com/releases/v5.15.4/css/all.css"
+        ]  # Using CYBORG as base theme for dark mode and Font Awesome for icons
+    )
+    app.layout = make_layout()
+    for function, args, kwargs in CALLBACKS:
+        app.callback(*args, **kwargs)(function)
+    app.server.add_url_rule("/metrics", view_func=metrics)
+    app.server.add_url_rule("/jobs/<job_id>/trace.json", view_func=job_trace)
+    app.server.add_url_rule("/jobs/<job_id>/results.<extension>", view_func=job_results)
+    return app
+
+
+def timed_callback(function):
+    # Callback time is recorded next to API latency so the two can be compared on /metrics
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            services.metrics.observe("data_rip_callback_seconds", time.perf_counter() - started, callback=function.__name__)
+    return wrapper
+
+
+def metrics():
+    return Response(services.metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+def job_trace(job_id):
+    engine = services.engine
+    if not engine.store.has_job(job_id):
+        return Response(f"Unknown job {job_id}", status=404, mimetype="text/plain")
+    return jsonify(engine.trace(job_id))
+
+
+def job_results(job_id, extension):
+    # Streams every finished row from the job store, however many there are
+    engine = services.engine
+    if not engine.store.has_job(job_id) or extension not in EXPORT_FORMATS:
+        return Response(f"Unknown job {job_id} or format {extension}", status=404, mimetype="text/plain")
+    try:
+        chunks = stream_export(engine.store, job_id, extension)
+    except ImportError as e:
+        return Response(str(e), status=501, mimetype="text/plain")
+    return Response(
+        chunks,
+        mimetype=EXPORT_FORMATS[extension],
+        headers={"Content-Disposition": f'attachment; filename="data-rip-{job_id}.{extension}"'},
+    )
+
+
+# Rows fetched per request by the input grid's server-side row model
+INPUT_GRID_PAGE_SIZE = 100
+
+# Failed rows listed under the progress bar once a run finishes
+DEAD_LETTER_DISPLAY_LIMIT = 100
+
+# Hidden field the output grid identifies rows by, so streamed rows are updated in place once they finish
+ROW_ID_FIELD = "_row_id"
+# Hidden field holding a row's position in the input file, which the output grid is sorted by
+ROW_INDEX_FIELD = "_row_index"
 
 # Define custom styles
 VAPORWAVE_COLORS = {
@@ -49,266 +214,339 @@ ASCII_HEADER = """
  ░                                                            
 """
 
-# Define the layout
-app.layout = dbc.Container(
-    fluid=True,
-    style={
-        'background': f'linear-gradient(45deg, {VAPORWAVE_COLORS["background"]}, #330033)',
-        'minHeight': '100vh',
-        'color': VAPORWAVE_COLORS['text']
-    },
-    children=[
-        # ASCII Art Header
-        dbc.Row(
-            dbc.Col(
-                html.Pre(
-                    ASCII_HEADER,
-                    style={
-                        'color': VAPORWAVE_COLORS['primary'],
-                        'textAlign': 'center',
-                        'fontFamily': 'monospace',
-                        'whiteSpace': 'pre',
-                        'margin': '20px 0',
-                        'textShadow': f'2px 2px {VAPORWAVE_COLORS["secondary"]}',
-                        'fontSize': '0.7em',
-                        'letterSpacing': '1px',
-                        'animation': 'glow 1.5s ease-in-out infinite alternate'
-                    }
-                ),
-                className="text-center"
-            )
-        ),
-        dbc.Row([
-            dbc.Col(
-                width=4,
-                children=[
-                    html.Div(
-                        [
-                            html.H5(
-                                "Enter detailed instructions for what types of question you want answered",
-                                style={
-                                    'color': VAPORWAVE_COLORS['primary'],
-                                    'textShadow': f'2px 2px {VAPORWAVE_COLORS["secondary"]}',
-                                    'fontFamily': '"Press Start 2P", cursive',
-                                    'marginBottom': '20px'
-                                }
-                            ),
-                            dcc.Textarea(
-                                id="input-box",
-                                placeholder="Enter something...",
-                                value="I want to extract user names, and ids from this data",
-                                style={
-                                    'width': '100%',
-                                    'height': '200px',
-                                    'resize': 'vertical',
-                                    'marginBottom': '20px',
-                                    'background': 'rgba(0, 0, 51, 0.7)',
-                                    'color': VAPORWAVE_COLORS['text'],
-                                    'border': f'2px solid {VAPORWAVE_COLORS["secondary"]}',
-                                    'borderRadius': '5px',
-                                    'padding': '10px'
-                                }
-                            ),
-                            html.Button(
-                                "Submit", 
-                                id="submit-fewshot-instruct",
-                                style={
-                                    'backgroundColor': VAPORWAVE_COLORS['primary'],
-                                    'border': 'none',
-                                    'color': 'white',
-                                    'padding': '10px 20px',
-                                    'borderRadius': '5px',
-                                    'marginBottom': '10px',
-                                    'width': '100%',
-                                    'boxShadow': f'3px 3px {VAPORWAVE_COLORS["secondary"]}',
-                                }
-                            ),
-                            html.Div(id="output-box"),
-                            dcc.Store(id="data-store"),
-                            html.Button(
-                                "Run Structured Extraction", 
-                                id="run-extraction-button",
-                                style={
-                                    'backgroundColor': VAPORWAVE_COLORS['secondary'],
-                                    'border': 'none',
-                                    'color': 'white',
-                                    'padding': '10px 20px',
-                                    'borderRadius': '5px',
-                                    'width': '100%',
-                                    'boxShadow': f'3px 3px {VAPORWAVE_COLORS["primary"]}',
-                                }
-                            ),
-                        ],
+def make_input_grid(column_defs):
+    # The input grid pages rows in from the spooled upload instead of holding them all
+    import dash_ag_grid as dag
+
+    return dag.AgGrid(
+        id="ag-grid",
+        columnDefs=column_defs,
+        rowModelType="infinite",
+        dashGridOptions={
+            "defaultColDef": {
+                "resizable": True,
+            },
+            "cacheBlockSize": INPUT_GRID_PAGE_SIZE,
+            "maxBlocksInCache": 10,
+        },
+        className="ag-theme-alpine-dark"
+    )
+
+
+def make_layout():
+    import dash_ag_grid as dag
+    import dash_bootstrap_components as dbc
+
+    return dbc.Container(
+        fluid=True,
+        style={
+            'background': f'linear-gradient(45deg, {VAPORWAVE_COLORS["background"]}, #330033)',
+            'minHeight': '100vh',
+            'color': VAPORWAVE_COLORS['text']
+        },
+        children=[
+            # ASCII Art Header
+            dbc.Row(
+                dbc.Col(
+                    html.Pre(
+                        ASCII_HEADER,
                         style={
-                            "padding": "20px",
-                            "background": "rgba(0, 0, 51, 0.5)",
-                            "borderRadius": "10px",
-                            "backdropFilter": "blur(5px)",
-                            "border": f"1px solid {VAPORWAVE_COLORS['accent']}"
-                        },
-                    )
-                ],
-                style={"height": "100vh", "padding": "20px"},
+                            'color': VAPORWAVE_COLORS['primary'],
+                            'textAlign': 'center',
+                            'fontFamily': 'monospace',
+                            'whiteSpace': 'pre',
+                            'margin': '20px 0',
+                            'textShadow': f'2px 2px {VAPORWAVE_COLORS["secondary"]}',
+                            'fontSize': '0.7em',
+                            'letterSpacing': '1px',
+                            'animation': 'glow 1.5s ease-in-out infinite alternate'
+                        }
+                    ),
+                    className="text-center"
+                )
             ),
-            dbc.Col(
-                width=8,
-                children=[
-                    html.Div(
-                        [
-                            dcc.Upload(
-                                id="upload-data",
-                                children=html.Div([
-                                    "Drag and Drop or ", 
-                                    html.A("Select CSV Files", style={'color': VAPORWAVE_COLORS['primary']})
-                                ]),
-                                style={
-                                    "width": "100%",
-                                    "height": "60px",
-                                    "lineHeight": "60px",
-                                    "borderWidth": "2px",
-                                    "borderStyle": "dashed",
-                                    "borderColor": VAPORWAVE_COLORS['secondary'],
-                                    "borderRadius": "5px",
-                                    "textAlign": "center",
-                                    "margin": "10px",
-                                    "background": "rgba(0, 0, 51, 0.7)",
-                                },
-                                multiple=False,
-                            ),
-                            dbc.Row([
-                                dbc.Col(
-                                    html.Label(
-                                        "ID column",
-                                        style={'color': VAPORWAVE_COLORS['primary']}
-                                    ), 
-                                    width=6
+            dbc.Row([
+                dbc.Col(
+                    width=4,
+                    children=[
+                        html.Div(
+                            [
+                                html.H5(
+                                    "Enter detailed instructions for what types of question you want answered",
+                                    style={
+                                        'color': VAPORWAVE_COLORS['primary'],
+                                        'textShadow': f'2px 2px {VAPORWAVE_COLORS["secondary"]}',
+                                        'fontFamily': '"Press Start 2P", cursive',
+                                        'marginBottom': '20px'
+                                    }
                                 ),
-                                dbc.Col(
-                                    dcc.Dropdown(
-                                        id="id-column-selector",
-                                        options=[
-                                            {"label": "Please Upload a File to choose columns", "value": "upload-file"},
-                                        ],
-                                        value="upload-file",
-                                        style={
-                                            'backgroundColor': 'rgba(0, 0, 51, 0.7)',
-                                            'color': VAPORWAVE_COLORS['text']
-                                        }
-                                    ),
-                                    width=6,
+                                dcc.Textarea(
+                                    id="input-box",
+                                    placeholder="Enter something...",
+                                    value="I want to extract user names, and ids from this data",
+                                    style={
+                                        'width': '100%',
+                                        'height': '200px',
+                                        'resize': 'vertical',
+                                        'marginBottom': '20px',
+                                        'background': 'rgba(0, 0, 51, 0.7)',
+                                        'color': VAPORWAVE_COLORS['text'],
+                                        'border': f'2px solid {VAPORWAVE_COLORS["secondary"]}',
+                                        'borderRadius': '5px',
+                                        'padding': '10px'
+                                    }
                                 ),
-                            ]),
-                            dbc.Row([
-                                dbc.Col(
-                                    html.Label(
-                                        "Text column",
-                                        style={'color': VAPORWAVE_COLORS['primary']}
-                                    ), 
-                                    width=6
+                                html.Button(
+                                    "Submit", 
+                                    id="submit-fewshot-instruct",
+                                    style={
+                                        'backgroundColor': VAPORWAVE_COLORS['primary'],
+                                        'border': 'none',
+                                        'color': 'white',
+                                        'padding': '10px 20px',
+                                        'borderRadius': '5px',
+                                        'marginBottom': '10px',
+                                        'width': '100%',
+                                        'boxShadow': f'3px 3px {VAPORWAVE_COLORS["secondary"]}',
+                                    }
                                 ),
-                                dbc.Col(
-                                    dcc.Dropdown(
-                                        id="text-column-selector",
-                                        options=[
-                                            {"label": "Please Upload a File to choose columns", "value": "upload-file"},
-                                        ],
-                                        value="upload-file",
-                                        style={
-                                            'backgroundColor': 'rgba(0, 0, 51, 0.7)',
-                                            'color': VAPORWAVE_COLORS['text']
-                                        }
-                                    ),
-                                    width=6,
+                                html.Div(id="output-box"),
+                                dcc.Store(id="data-store"),
+                                dbc.Switch(
+                                    id="bulk-mode-switch",
+                                    label="Bulk mode (Batch API, cheaper but can take up to 24h)",
+                                    value=False,
+                                    style={'color': VAPORWAVE_COLORS['text'], 'marginBottom': '10px'}
                                 ),
-                            ]),
-                            dbc.Row([
-                                dbc.Col([
-                                    dbc.Progress(
-                                        id="extraction-progress",
-                                        style={
-                                            "height": "20px",
-                                            "marginBottom": "10px",
-                                            "backgroundColor": "rgba(0, 0, 51, 0.7)",
-                                            "borderRadius": "10px",
-                                        },
-                                        className="mb-3",
-                                    ),
-                                    html.Div(id="progress-text", style={
-                                        "color": VAPORWAVE_COLORS['text'],
-                                        "textAlign": "center",
-                                        "marginBottom": "10px",
-                                    }),
-                                ])
-                            ]),
-                            dcc.Store(id="progress-store", data={"current": 0, "total": 0}),
-                            dcc.Interval(id='progress-interval', interval=500, disabled=True),  # 500ms interval
-                            dcc.Store(id='processing-state', data={'processing': False, 'queue': [], 'current_row': 0, 'total_rows': 0}),
-                            dag.AgGrid(
-                                id="ag-grid", 
-                                columnDefs=[], 
-                                rowData=[],
-                                dashGridOptions={
-                                    "defaultColDef": {
-                                        "resizable": True,
-                                        "sortable": True,
-                                        "filter": True
+                                html.Button(
+                                    "Preview on a Sample",
+                                    id="preview-button",
+                                    style={
+                                        'backgroundColor': VAPORWAVE_COLORS['accent'],
+                                        'border': 'none',
+                                        'color': 'white',
+                                        'padding': '10px 20px',
+                                        'borderRadius': '5px',
+                                        'marginBottom': '10px',
+                                        'width': '100%',
+                                        'boxShadow': f'3px 3px {VAPORWAVE_COLORS["secondary"]}',
                                     }
-                                },
-                                className="ag-theme-alpine-dark"
-                            ),
-                            dag.AgGrid(
-                                id="ag-grid-out", 
-                                columnDefs=[], 
-                                rowData=[],
-                                dashGridOptions={
-                                    "defaultColDef": {
-                                        "resizable": True,
-                                        "sortable": True,
-                                        "filter": True
+                                ),
+                                html.Button(
+                                    "Run Structured Extraction", 
+                                    id="run-extraction-button",
+                                    style={
+                                        'backgroundColor': VAPORWAVE_COLORS['secondary'],
+                                        'border': 'none',
+                                        'color': 'white',
+                                        'padding': '10px 20px',
+                                        'borderRadius': '5px',
+                                        'width': '100%',
+                                        'boxShadow': f'3px 3px {VAPORWAVE_COLORS["primary"]}',
                                     }
-                                },
-                                className="ag-theme-alpine-dark"
-                            ),
-                        ],
-                        style={
-                            "padding": "20px",
-                            "background": "rgba(0, 0, 51, 0.5)",
-                            "borderRadius": "10px",
-                            "backdropFilter": "blur(5px)",
-                            "border": f"1px solid {VAPORWAVE_COLORS['accent']}"
-                        },
-                    ),
-                ],
-            ),
-        ])
-    ],
-)
+                                ),
+                            ],
+                            style={
+                                "padding": "20px",
+                                "background": "rgba(0, 0, 51, 0.5)",
+                                "borderRadius": "10px",
+                                "backdropFilter": "blur(5px)",
+                                "border": f"1px solid {VAPORWAVE_COLORS['accent']}"
+                            },
+                        )
+                    ],
+                    style={"height": "100vh", "padding": "20px"},
+                ),
+                dbc.Col(
+                    width=8,
+                    children=[
+                        html.Div(
+                            [
+                                dcc.Upload(
+                                    id="upload-data",
+                                    children=html.Div([
+                                        "Drag and Drop or ", 
+                                        html.A("Select CSV Files", style={'color': VAPORWAVE_COLORS['primary']})
+                                    ]),
+                                    style={
+                                        "width": "100%",
+                                        "height": "60px",
+                                        "lineHeight": "60px",
+                                        "borderWidth": "2px",
+                                        "borderStyle": "dashed",
+                                        "borderColor": VAPORWAVE_COLORS['secondary'],
+                                        "borderRadius": "5px",
+                                        "textAlign": "center",
+                                        "margin": "10px",
+                                        "background": "rgba(0, 0, 51, 0.7)",
+                                    },
+                                    multiple=False,
+                                ),
+                                dbc.Row([
+                                    dbc.Col(
+                                        html.Label(
+                                            "ID column",
+                                            style={'color': VAPORWAVE_COLORS['primary']}
+                                        ), 
+                                        width=6
+                                    ),
+                                    dbc.Col(
+                                        dcc.Dropdown(
+                                            id="id-column-selector",
+                                            options=[
+                                                {"label": "Please Upload a File to choose columns", "value": "upload-file"},
+                                            ],
+                                            value="upload-file",
+                                            style={
+                                                'backgroundColor': 'rgba(0, 0, 51, 0.7)',
+                                                'color': VAPORWAVE_COLORS['text']
+                                            }
+                                        ),
+                                        width=6,
+                                    ),
+                                ]),
+                                dbc.Row([
+                                    dbc.Col(
+                                        html.Label(
+                                            "Text column",
+                                            style={'color': VAPORWAVE_COLORS['primary']}
+                                        ), 
+                                        width=6
+                                    ),
+                                    dbc.Col(
+                                        dcc.Dropdown(
+                                            id="text-column-selector",
+                                            options=[
+                                                {"label": "Please Upload a File to choose columns", "value": "upload-file"},
+                                            ],
+                                            value="upload-file",
+                                            style={
+                                                'backgroundColor': 'rgba(0, 0, 51, 0.7)',
+                                                'color': VAPORWAVE_COLORS['text']
+                                            }
+                                        ),
+                                        width=6,
+                                    ),
+                                ]),
+                                dbc.Row([
+                                    dbc.Col(
+                                        html.Label(
+                                            "Rows per request (pack short rows into one call)",
+                                            style={'color': VAPORWAVE_COLORS['primary']}
+                                        ),
+                                        width=6
+                                    ),
+                                    dbc.Col(
+                                        dcc.Input(
+                                            id="pack-size-input",
+                                            type="number",
+                                            min=1,
+                                            step=1,
+                                            value=1,
+                                            style={
+                                                'width': '100%',
+                                                'backgroundColor': 'rgba(0, 0, 51, 0.7)',
+                                                'color': VAPORWAVE_COLORS['text']
+                                            }
+                                        ),
+                                        width=6,
+                                    ),
+                                ]),
+                                dbc.Row([
+                                    dbc.Col([
+                                        dbc.Progress(
+                                            id="extraction-progress",
+                                            style={
+                                                "height": "20px",
+                                                "marginBottom": "10px",
+                                                "backgroundColor": "rgba(0, 0, 51, 0.7)",
+                                                "borderRadius": "10px",
+                                            },
+                                            className="mb-3",
+                                        ),
+                                        html.Div(id="progress-text", style={
+                                            "color": VAPORWAVE_COLORS['text'],
+                                            "textAlign": "center",
+                                            "marginBottom": "10px",
+                                        }),
+                                        html.Div(
+                                            [
+                                                html.Button(
+                                                    label,
+                                                    id=f"{action}-button",
+                                                    style={
+                                                        'backgroundColor': 'transparent',
+                                                        'border': f'1px solid {VAPORWAVE_COLORS["accent"]}',
+                                                        'color': VAPORWAVE_COLORS['text'],
+                                                        'padding': '2px 12px',
+                                                        'borderRadius': '5px',
+                                                        'margin': '0 5px',
+                                                    }
+                                                )
+                                                for action, label in (("pause", "Pause"), ("resume", "Resume"), ("cancel", "Cancel"))
+                                            ],
+                                            style={"textAlign": "center", "marginBottom": "10px"},
+                                        ),
+                                        html.Div(id="dead-letter"),
+                                    ])
+                                ]),
+                                dcc.Store(id="progress-store", data={"current": 0, "total": 0}),
+                                dcc.Interval(id='progress-interval', interval=500, disabled=True),  # 500ms interval
+                                dcc.Store(id='processing-state', data={'processing': False, 'job_id': None, 'current_row': 0, 'total_rows': 0}),
+                                dcc.Store(id="upload-store"),
+                                html.Div(id="input-grid-container", children=make_input_grid([])),
+                                dag.AgGrid(
+                                    id="ag-grid-out", 
+                                    columnDefs=[], 
+                                    rowData=[],
+                                    getRowId=f"params.data.{ROW_ID_FIELD}",
+                                    dashGridOptions={
+                                        "defaultColDef": {
+                                            "resizable": True,
+                                            "sortable": True,
+                                            "filter": True
+                                        },
+                                        # Batch row transactions into one render per progress tick
+                                        "asyncTransactionWaitMillis": 500
+                                    },
+                                    className="ag-theme-alpine-dark"
+                                ),
+                            ],
+                            style={
+                                "padding": "20px",
+                                "background": "rgba(0, 0, 51, 0.5)",
+                                "borderRadius": "10px",
+                                "backdropFilter": "blur(5px)",
+                                "border": f"1px solid {VAPORWAVE_COLORS['accent']}"
+                            },
+                        ),
+                    ],
+                ),
+            ])
+        ],
+    )
 
 
-@app.callback(
+@app_callback(
     [Output("output-box", "children"), Output("data-store", "data")],
     [Input("submit-fewshot-instruct", "n_clicks")],
     [State("input-box", "value")],
 )
 def generate_chat_completions(n_clicks, input_value):
     if n_clicks is not None:
-        # Make the OpenAI chat completions call with gpt-4o
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                FUNCTION_CALLING_SYS_PROMPT,
-                *FUNCTION_CALLING_FEW_SHOTS_DICT,
-                {"role": "user", "content": input_value},
-            ],
-        )
+        # Loaded along with the client by the first schema request
+        import openai
+
+        # Make the OpenAI chat completions call with the schema model (gpt-4o by default)
+        try:
+            # Instructions used before are answered from the result cache
+            completed_message = generate_schema(services.scheduler, input_value, cache=services.engine.cache)
+        except openai.OpenAIError as e:
+            return [html.Div([html.H5("Error generating schema", style={'color': 'red'}), html.Pre(str(e))]), None]
 
-        # Extract the completed message from the response
-        completed_message = response.choices[0].message.content
-        
         # Clean and parse the JSON schema
-        cleaned_schema = completed_message.replace("```json", "").replace("```", "").replace("'", '"')
         try:
-            schema_json = json.loads(cleaned_schema)
+            schema_json = clean_schema(completed_message)
             
             # Create a nicely formatted display of the schema
             schema_display = html.Div([
@@ -381,213 +619,565 @@ def generate_chat_completions(n_clicks, input_value):
                 ])
             ])
             
-            return [schema_display, completed_message]
+            # The parsed schema is stored so it is only cleaned and parsed once
+            return [schema_display, schema_json]
             
-        except json.JSONDecodeError:
+        except ValueError:
             return [
                 html.Div([
                     html.H5("Error parsing schema", style={'color': 'red'}),
                     html.Pre(completed_message)
                 ]), 
-                completed_message
+                None
             ]
 
     # If the submit button has not been clicked, return an empty div and None for the data store
     return [html.Div(), None]
 
 
-@app.callback(
+@app_callback(
     [
         Output("id-column-selector", "options"),
         Output("text-column-selector", "options"),
-        Output("ag-grid", "columnDefs"),
-        Output("ag-grid", "rowData"),
+        Output("input-grid-container", "children"),
+        Output("upload-store", "data"),
     ],
     Input("upload-data", "contents"),
     [State("upload-data", "filename")]
 )
 def update_output(contents, filename):
     if contents is None:
-        return [], [], [], []
+        return [], [], make_input_grid([]), None
 
     try:
-        # Decode the file contents
-        content_type, content_string = contents.split(",")
-        decoded = base64.b64decode(content_string)
-        
-        # Read the file into a pandas DataFrame
-        if "csv" in filename.lower():
-            df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-        elif "xls" in filename.lower():
-            df = pd.read_excel(io.BytesIO(decoded))
-        else:
-            return [], [], [], []
+        # Uploads nobody has used for a while go first
+        prune_uploads()
+        # Spool the upload to disk, only its columns and row count are read here
+        path = spool_upload(contents, filename)
+        if path is None:
+            return [], [], make_input_grid([]), None
+        columns = read_columns(path)
 
         # Create options for dropdowns
-        options = [{"label": col, "value": col} for col in df.columns]
-        
-        # Create column definitions and row data for ag-grid
-        column_defs = [{"headerName": col, "field": col} for col in df.columns]
-        row_data = df.to_dict("records")
+        options = [{"label": col, "value": col} for col in columns]
+
+        # Create column definitions for ag-grid, rows are paged in by load_input_rows
+        column_defs = [{"headerName": col, "field": col} for col in columns]
 
-        return options, options, column_defs, row_data
+        # The browser only gets the upload's id, the path stays on the server
+        return options, options, make_input_grid(column_defs), {
+            'upload_id': upload_id(path),
+            'filename': filename,
+            'sha256': file_digest(path),
+            'total_rows': count_rows(path),
+        }
 
     except Exception as e:
         print(f"Error processing file: {e}")
-        return [], [], [], []
+        return [], [], make_input_grid([]), None
+
+
+@app_callback(
+    Output("ag-grid", "getRowsResponse"),
+    Input("ag-grid", "getRowsRequest"),
+    State("upload-store", "data"),
+    prevent_initial_call=True
+)
+@timed_callback
+def load_input_rows(request, upload):
+    if request is None or upload is None:
+        return dash.no_update
+    try:
+        path = upload_path(upload)
+    except ValueError:
+        return dash.no_update
+    return {
+        "rowData": read_page(path, request["startRow"], request["endRow"]),
+        "rowCount": upload['total_rows'],
+    }
+
+
+def output_column_defs(columns):
+    # Rows finish out of file order (long rows are sent early), the grid keeps them in file order
+    return [
+        {"field": ROW_INDEX_FIELD, "hide": True, "sort": "asc"},
+        *({"headerName": col, "field": col} for col in columns),
+    ]
+
+
+def upload_path(upload):
+    # The upload store is in the browser, so its id is only trusted once it names a spooled upload
+    return resolve_upload(upload.get('upload_id'))
 
 
-@app.callback(
+def describe_job(data, upload, id_column, text_column):
+    # The schema was parsed when it was generated
+    function_name = FUNCTION_NAME
+    tools = build_tools(data, function_name)
+
+    # Only the ID and text columns are read back from the spooled upload
+    columns = list(dict.fromkeys([id_column, text_column]))
+    # The same file and schema map to the same job, so a re-run resumes where it stopped
+    # (and a full run picks up the rows of its preview)
+    job_id = job_key(upload['sha256'], tools, DEFAULT_MODEL, id_column, text_column)
+    return job_id, tools, function_name, columns
+
+
+def read_queue(path, columns, text_column, tools, function_name):
+    processing_queue = deque()
+    for row in iter_rows(path, columns):
+        processing_queue.append({
+            'row': row,
+            'text_column': text_column,
+            'tools': tools,
+            'function_name': function_name
+        })
+    return processing_queue
+
+
+@app_callback(
     [
         Output("processing-state", "data"),
         Output("progress-interval", "disabled"),
+        Output("ag-grid-out", "rowData"),
+        Output("ag-grid-out", "columnDefs", allow_duplicate=True),
+        Output("progress-text", "children", allow_duplicate=True),
     ],
     Input("run-extraction-button", "n_clicks"),
     [
         State("data-store", "data"),
-        State("ag-grid", "rowData"),
-        State("ag-grid", "columnDefs"),
+        State("upload-store", "data"),
         State("id-column-selector", "value"),
         State("text-column-selector", "value"),
+        State("bulk-mode-switch", "value"),
+        State("pack-size-input", "value"),
     ],
     prevent_initial_call=True
 )
-def start_processing(n_clicks, data, row_data, column_defs, id_column, text_column):
-    if n_clicks is not None and data is not None and row_data:
-        # Clean and parse the schema
-        cleaned_schema_json = data.replace("```json", "").replace("```", "").replace("'", '"')
-        cleaned_schema_json = json.loads(cleaned_schema_json)
-        
-        function_name = "extraction_function"
-        tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": f"{function_name}",
-                    "description": "Extract data as per the schema provided",
-                    "parameters": {
-                        "type": "object",
-                        "properties": cleaned_schema_json["properties"],
-                        "required": cleaned_schema_json["required"],
-                    },
-                },
-            }
-        ]
-
-        processing_queue = deque()
-        for row in row_data:
-            processing_queue.append({
-                'row': row,
+@timed_callback
+def start_processing(n_clicks, data, upload, id_column, text_column, bulk_mode, pack_size):
+    if n_clicks is not None and data is not None and upload is not None:
+        try:
+            path = upload_path(upload)
+        except ValueError as e:
+            return {'processing': False, 'job_id': None, 'current_row': 0, 'total_rows': 0}, True, dash.no_update, dash.no_update, str(e)
+        job_id, tools, function_name, columns = describe_job(data, upload, id_column, text_column)
+        column_defs = output_column_defs(columns)
+        engine, work_queue = services.engine, services.work_queue
+
+        if work_queue is not None and not bulk_mode:
+            # Workers read their row ranges from the spooled file themselves
+            enqueue_extraction(work_queue, engine.store, job_id, {
+                'path': path,
+                'columns': columns,
                 'text_column': text_column,
                 'tools': tools,
-                'function_name': function_name
-            })
+                'function_name': function_name,
+                'model': DEFAULT_MODEL,
+                'pack_size': int(pack_size or 1),
+            }, upload['total_rows'])
+            return {
+                'processing': True,
+                'mode': 'queue',
+                'job_id': job_id,
+                'current_row': 0,
+                'total_rows': upload['total_rows'],
+                'rows_sent': 0,
+                'id_column': id_column,
+                'columns': columns,
+            }, False, [], column_defs, "Queued for the extraction workers"
+
+        processing_queue = read_queue(path, columns, text_column, tools, function_name)
 
+        # Hand the queue to the engine (or the Batch API), the browser only keeps the job id
+        if bulk_mode:
+            try:
+                job_id = services.batch_runner.submit(list(processing_queue), id_column)
+            except ValueError as e:
+                return {'processing': False, 'job_id': None, 'current_row': 0, 'total_rows': 0}, True, dash.no_update, dash.no_update, str(e)
+        else:
+            engine.submit(list(processing_queue), pack_size=int(pack_size or 1), job_id=job_id, id_column=id_column)
+
+        # Clear the output grid, finished rows are appended page by page and
+        # extracted columns are added as their keys first show up
         return {
             'processing': True,
-            'queue': list(processing_queue),
+            'mode': 'batch' if bulk_mode else 'sync',
+            'job_id': job_id,
             'current_row': 0,
-            'total_rows': len(row_data),
-            'column_defs': column_defs,
-            'processed_rows': []
-        }, False
+            'total_rows': len(processing_queue),
+            'rows_sent': 0,
+            'id_column': id_column,
+            'columns': columns,
+        }, False, [], column_defs, ""
+
+    return {'processing': False, 'job_id': None, 'current_row': 0, 'total_rows': 0}, True, dash.no_update, dash.no_update, dash.no_update
 
-    return {'processing': False, 'queue': [], 'current_row': 0, 'total_rows': 0}, True
 
-@app.callback(
+@app_callback(
+    [
+        Output("processing-state", "data", allow_duplicate=True),
+        Output("progress-interval", "disabled", allow_duplicate=True),
+        Output("ag-grid-out", "rowData", allow_duplicate=True),
+        Output("ag-grid-out", "columnDefs", allow_duplicate=True),
+        Output("progress-text", "children", allow_duplicate=True),
+    ],
+    Input("preview-button", "n_clicks"),
+    [
+        State("data-store", "data"),
+        State("upload-store", "data"),
+        State("id-column-selector", "value"),
+        State("text-column-selector", "value"),
+        State("pack-size-input", "value"),
+    ],
+    prevent_initial_call=True
+)
+@timed_callback
+def start_preview(n_clicks, data, upload, id_column, text_column, pack_size):
+    if n_clicks is None or data is None or upload is None:
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+    try:
+        path = upload_path(upload)
+    except ValueError as e:
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, str(e)
+
+    job_id, tools, function_name, columns = describe_job(data, upload, id_column, text_column)
+    processing_queue = read_queue(path, columns, text_column, tools, function_name)
+    # Rows spread over short and long texts run in this process at full concurrency, checkpointed
+    # under the full job's id so "Run Structured Extraction" doesn't send them again
+    sample = stratified_sample([str(item['row'][text_column]) for item in processing_queue])
+    # Someone is waiting on the preview, so it goes ahead of the full runs of other users
+    services.engine.submit(
+        list(processing_queue),
+        pack_size=int(pack_size or 1),
+        job_id=job_id,
+        id_column=id_column,
+        only_rows=sample,
+        priority=INTERACTIVE_PRIORITY,
+    )
+    return {
+        'processing': True,
+        'mode': 'preview',
+        'job_id': job_id,
+        'current_row': 0,
+        'total_rows': len(sample),
+        'rows_sent': 0,
+        'id_column': id_column,
+        'columns': columns,
+    }, False, [], output_column_defs(columns), f"Previewing {len(sample)} of {len(processing_queue)} rows"
+
+
+@app_callback(
+    Output("progress-text", "children", allow_duplicate=True),
+    [Input("pause-button", "n_clicks"), Input("resume-button", "n_clicks"), Input("cancel-button", "n_clicks")],
+    State("processing-state", "data"),
+    prevent_initial_call=True
+)
+@timed_callback
+def control_job(pause_clicks, resume_clicks, cancel_clicks, processing_state):
+    # Only runs on this process's engine can be held, bulk and queued runs go on elsewhere
+    job_id = processing_state.get('job_id')
+    if not processing_state.get('processing') or processing_state.get('mode') not in ('sync', 'preview'):
+        return "Pause, resume and cancel work on runs in progress on this server"
+    action = dash.callback_context.triggered_id.removesuffix("-button")
+    getattr(services.engine, action)(job_id)
+    # The next progress tick shows the new state
+    return f"{action.capitalize()} requested"
+
+
+@app_callback(
     [
         Output("ag-grid-out", "columnDefs"),
-        Output("ag-grid-out", "rowData"),
+        Output("ag-grid-out", "rowTransaction"),
         Output("extraction-progress", "value"),
         Output("extraction-progress", "label"),
         Output("progress-text", "children"),
         Output("processing-state", "data", allow_duplicate=True),
         Output("progress-interval", "disabled", allow_duplicate=True),
+        Output("dead-letter", "children"),
     ],
     Input("progress-interval", "n_intervals"),
     State("processing-state", "data"),
     prevent_initial_call=True
 )
+@timed_callback
 def process_next_batch(n_intervals, processing_state):
-    if not processing_state['processing'] and not processing_state.get('processed_rows'):
-        # Only return empty state if we've never processed anything
-        return [], [], 0, "", "", processing_state, True
-
-    # Process one row
-    if processing_state['queue']:
-        current_item = processing_state['queue'][0]
-        row = current_item['row']
-        
-        # Process the row
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Only provide results you want to extract"},
-                {"role": "user", "content": row[current_item['text_column']]},
-            ],
-            tools=current_item['tools'],
-            tool_choice={"type": "function", "function": {"name": current_item['function_name']}},
-        )
-        
-        tool_call = json.loads(response.choices[0].message.tool_calls[0].function.arguments)
-        
-        # Update column definitions if needed
-        column_defs = processing_state.get('column_defs', []).copy()
-        for key in tool_call.keys():
-            if key not in [col["field"] for col in column_defs]:
-                column_defs.append({"headerName": key, "field": key})
-        
-        # Add the processed row
-        processed_row = {**row, **tool_call}
-        processed_rows = processing_state.get('processed_rows', []) + [processed_row]
-        
-        # Update processing state
-        new_queue = processing_state['queue'][1:]
-        current_row = processing_state['current_row'] + 1
+    job_id = processing_state.get('job_id')
+    engine, work_queue = services.engine, services.work_queue
+    progress_info = engine.store.get_progress(job_id)
+    if progress_info is None:
+        return [], dash.no_update, 0, "", "", processing_state, True, None
+
+    # Bulk jobs only reach the store once the whole batch has finished
+    batch_status = None
+    if processing_state.get('mode') == 'batch':
+        batch_status = services.batch_runner.poll(job_id)
+        if batch_status not in TERMINAL_STATUSES:
+            return (
+                dash.no_update,
+                dash.no_update,
+                0,
+                "",
+                f"Batch {batch_status}, results are merged once it completes",
+                processing_state,
+                False,
+                dash.no_update
+            )
+        progress_info = engine.store.get_progress(job_id)
+
+    # Column definitions are only sent again when a new extracted key shows up
+    columns = processing_state.get('columns', [])
+    new_columns = [key for key in progress_info['extracted_keys'] if key not in columns]
+    column_defs = dash.no_update
+    if new_columns:
+        columns = columns + new_columns
+        column_defs = output_column_defs(columns)
+
+    # Only fetch the next page of rows the grid has not seen yet
+    rows_sent = processing_state.get('rows_sent', 0)
+    id_column = progress_info['id_column']
+    page = engine.store.get_rows(job_id, offset=rows_sent, limit=RESULT_PAGE_SIZE, index_field=ROW_INDEX_FIELD)
+    partial_rows = engine.partial_rows(job_id, index_field=ROW_INDEX_FIELD) if id_column else []
+
+    current_row = progress_info['completed'] + progress_info['failed']
+    total_rows = progress_info['total_rows']
+    previewing = processing_state.get('mode') == 'preview'
+    if previewing:
+        # Only the sampled rows were queued, so the job itself doesn't finish
         total_rows = processing_state['total_rows']
-        
+        current_row = min(current_row, total_rows)
+    cache_text = ""
+    if job_id in engine.stats:
+        stats = engine.stats[job_id]
+        cache_text = (
+            f" (cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses,"
+            f" {stats['duplicates']} duplicate rows)"
+        )
+        if stats['near_duplicates']:
+            cache_text += (
+                f" ({stats['near_duplicates']} near-duplicate texts share an extraction,"
+                f" {engine.throughput(job_id)['reduction_factor']:.1f}x fewer extractions)"
+            )
+        if stats['retries']:
+            cache_text += f" ({stats['retries']} retries)"
+        if stats['chunked_rows']:
+            cache_text += f" ({stats['chunked_rows']} long rows split into {stats['chunks']} chunks)"
+        if stats['invalid']:
+            cache_text += f" ({stats['invalid']} answers didn't match the schema and were sent again)"
+        if stats['cached_tokens']:
+            cache_text += f" ({stats['cached_tokens'] / max(stats['prompt_tokens'], 1):.0%} of prompt tokens cached)"
+        if stats['escalated']:
+            escalated = ", ".join(f"{count} to {model}" for model, count in engine.escalations[job_id].items())
+            cache_text += f" ({escalated} escalated, ~${engine.throughput(job_id)['cost_saved']:.4f} saved)"
+        if stats['resumed']:
+            cache_text += f" ({stats['resumed']} rows resumed from checkpoint)"
+    if processing_state.get('mode') == 'queue' and work_queue is not None:
+        ranges = work_queue.counts(job_id)
+        cache_text += f" ({ranges['leased']} ranges running on workers, {ranges['pending']} waiting)"
+    job_state = engine.job_state(job_id)
+    if job_state == PAUSED:
+        cache_text += " (paused)"
+    finished, cancelled = run_finished(
+        job_state,
+        engine.running(job_id),
+        previewing,
+        progress_info['done'],
+        rows_sent + len(page),
+        progress_info['completed'],
+    )
+    row_transaction, streaming = grid_transaction(
+        page, rows_sent, partial_rows, set(processing_state.get('streaming', [])), id_column, finished
+    )
+    rows_sent += len(page)
+    row_transaction = row_transaction or dash.no_update
+    new_state = {
+        **processing_state,
+        'processing': not finished,
+        'current_row': current_row,
+        'rows_sent': rows_sent,
+        'columns': columns,
+        'streaming': sorted(streaming),
+    }
+
+    if not finished:
         # Calculate progress
         progress = int((current_row / total_rows) * 100)
-        
-        # Update processing state
-        new_state = {
-            'processing': bool(new_queue),
-            'queue': new_queue,
-            'current_row': current_row,
-            'total_rows': total_rows,
-            'column_defs': column_defs,
-            'processed_rows': processed_rows
-        }
-        
+        rate_text = format_rates(engine.throughput(job_id)) if job_id in engine.stats else ""
         return (
             column_defs,
-            processed_rows,
+            row_transaction,
             progress,
             f"{progress}%",
-            f"Processing row {current_row} of {total_rows}",
+            f"{'Previewing' if previewing else 'Processing'} row {current_row} of {total_rows}{rate_text}{cache_text}",
+            new_state,
+            False,
+            dash.no_update
+        )
+
+    # Once every row has finished and been sent, stop polling
+    if cancelled:
+        return (
+            column_defs,
+            row_transaction,
+            int((current_row / total_rows) * 100) if total_rows else 0,
+            "Cancelled",
+            f"Cancelled after {current_row} of {total_rows} rows, run it again to resume from there",
             new_state,
-            False
+            True,
+            render_dead_letters(engine.store.get_errors(job_id), processing_state.get('id_column'))
         )
-    
-    # If queue is empty, return the final state with the last processed data
+    if previewing:
+        return (
+            column_defs,
+            row_transaction,
+            100,
+            "Preview done",
+            format_projection(project_run(engine, job_id, total_rows)),
+            new_state,
+            True,
+            render_dead_letters(engine.store.get_errors(job_id), processing_state.get('id_column'))
+        )
+    status = f"Processed {total_rows} rows"
+    if batch_status is not None and batch_status != "completed":
+        status = f"Batch {batch_status}, processed {total_rows} rows"
+    if progress_info['failed']:
+        status += f" ({progress_info['failed']} failed)"
+    status += cache_text
+    if job_id in engine.stats:
+        throughput = engine.throughput(job_id)
+        status += (
+            f" - {throughput['rows_per_second']:.1f} rows/s,"
+            f" {throughput['tokens_per_row']:.0f} tokens/row,"
+            f" {throughput['mean_latency']:.2f}s per call, ~${throughput['estimated_cost']:.4f}"
+        )
+        if throughput['mean_first_field'] is not None:
+            status += f" (first field after {throughput['mean_first_field']:.2f}s)"
     return (
-        processing_state.get('column_defs', []),
-        processing_state.get('processed_rows', []),
+        column_defs,
+        row_transaction,
         100,
         "Complete!",
-        f"Processed {processing_state['total_rows']} rows",
-        {**processing_state, 'processing': False},
-        True
+        [
+            status,
+            " Download: ",
+            *[
+                link
+                for extension in EXPORT_FORMATS
+                for link in (html.A(extension.upper(), href=f"/jobs/{job_id}/results.{extension}"), ", ")
+            ],
+            html.A("trace", href=f"/jobs/{job_id}/trace.json", target="_blank"),
+        ],
+        new_state,
+        True,
+        render_dead_letters(engine.store.get_errors(job_id), processing_state.get('id_column'))
+    )
+
+
+def format_rates(throughput):
+    # Live counters shown while a run is in progress
+    text = (
+        f" - {throughput['rows_per_second']:.1f} rows/s, {throughput['tokens_per_second']:,.0f} tokens/s,"
+        f" ~${throughput['estimated_cost']:.4f}"
     )
+    if throughput['mean_first_field'] is not None:
+        text += f", first field after {throughput['mean_first_field']:.2f}s"
+    if throughput['eta_seconds'] is not None:
+        minutes, seconds = divmod(int(throughput['eta_seconds']), 60)
+        text += f", ETA {minutes}m {seconds:02d}s"
+    return text
+
 
+def format_projection(projection):
+    # Measured on the sample, shown so the full run is only started once it looks right
+    if projection is None:
+        return "The sampled rows were already extracted, Run Structured Extraction to process the rest"
+    if projection['mean_latency'] is None:
+        # The engine no longer has the preview's measurements
+        return (
+            f"Preview of {projection['rows']} rows done, Run Structured Extraction to process the other"
+            f" {projection['remaining_rows']} rows"
+        )
+    minutes, seconds = divmod(int(projection['projected_seconds']), 60)
+    text = (
+        f"Preview of {projection['rows']} rows: {projection['mean_latency']:.2f}s per call,"
+        f" {projection['tokens_per_row']:.0f} tokens/row, ~${projection['cost_per_row']:.5f}/row"
+    )
+    if projection['cache_hits']:
+        text += f", {projection['cache_hits']} more rows served from the cache"
+    if projection['failed_share']:
+        text += f", {projection['failed_share']:.0%} failed"
+    return text + (
+        f". The other {projection['remaining_rows']} rows should take ~{minutes}m {seconds:02d}s"
+        f" (limited by {projection['limited_by']}) and cost ~${projection['projected_cost']:.4f}."
+        " If the sample and schema look right, Run Structured Extraction to approve the full run,"
+        " the previewed rows are reused."
+    )
 
-@app.callback(
+
+def grid_transaction(page, rows_sent, partial_rows, streaming, id_column, finished):
+    """The output grid's row transaction for one progress tick, and the IDs of the rows left streaming.
+
+    ``page`` holds the rows finished since the first ``rows_sent``, they are
+    added, or update the row shown while it streamed. ``partial_rows`` are
+    still streaming and show the fields that have arrived, which takes unique
+    IDs from ``id_column``. ``streaming`` has the IDs shown streaming after the
+    last tick. Once the run has ``finished``, rows still shown streaming
+    failed or were cancelled and are removed.
+    """
+    new_rows = [
+        {**row, ROW_ID_FIELD: str(row[id_column]) if id_column else f"#{rows_sent + offset}"}
+        for offset, row in enumerate(page)
+    ]
+    finished_ids = {row[ROW_ID_FIELD] for row in new_rows}
+    added = [row for row in new_rows if row[ROW_ID_FIELD] not in streaming]
+    updated = [row for row in new_rows if row[ROW_ID_FIELD] in streaming]
+    streaming = streaming - finished_ids
+    if id_column:
+        for row in partial_rows:
+            row_id = str(row[id_column])
+            if row_id not in finished_ids:
+                (updated if row_id in streaming else added).append({**row, ROW_ID_FIELD: row_id})
+                streaming.add(row_id)
+    removed = [{ROW_ID_FIELD: row_id} for row_id in sorted(streaming)] if finished else []
+    transaction = {name: rows for name, rows in (("add", added), ("update", updated), ("remove", removed)) if rows}
+    return transaction, set() if finished else streaming
+
+
+def run_finished(job_state, running, previewing, done, rows_sent, completed):
+    """Whether a run's progress can stop being polled, and whether that is because it was cancelled.
+
+    A preview only queues its sample, so it is over once nothing of the job
+    is ``running``, a full run once every row is ``done``. Either way every
+    ``completed`` row has to have been sent to the grid first.
+    """
+    cancelled = job_state == CANCELLED and not running
+    finished = (cancelled or (not running if previewing else done)) and rows_sent >= completed
+    return finished, cancelled
+
+
+def render_dead_letters(errors, id_column):
+    # Rows that still failed after every retry, shown so they can be checked and re-run
+    if not errors:
+        return None
+    return html.Details(
+        [
+            html.Summary(f"{len(errors)} rows failed", style={'color': VAPORWAVE_COLORS['primary']}),
+            html.Ul([
+                html.Li(f"{error['row'].get(id_column, error['index'])}: {error['error']}")
+                for error in errors[:DEAD_LETTER_DISPLAY_LIMIT]
+            ], style={'fontSize': '0.8em'}),
+        ],
+        style={'marginBottom': '10px'}
+    )
+
+
+@app_callback(
     Output("upload-data", "children"),
-    [Input("upload-data", "contents")],
-    [State("upload-data", "filename")]
+    [Input("upload-data", "filename")],
 )
-def update_upload_text(contents, filename):
-    if contents is not None:
+def update_upload_text(filename):
+    # Keyed on the filename so the upload contents are only sent to the server once
+    if filename is not None:
         return html.Div([
             html.I(className="fas fa-file-alt", style={'marginRight': '10px', 'color': VAPORWAVE_COLORS['secondary']}),
             f"Loaded: {filename}",
@@ -601,4 +1191,4 @@ def update_upload_text(contents, filename):
 
 # Run the app
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    create_app().run_server(debug=True)
@@ -0,0 +1,138 @@
+"""Where chat completions are sent: OpenAI or any OpenAI-compatible server.
+
+``DATA_RIP_BACKEND`` picks a preset. ``openai`` is the hosted API.
+``local`` is a server on your own hardware that speaks the same API, such as
+llama.cpp's ``llama-server``, vLLM or Ollama, at ``DATA_RIP_BASE_URL``. It
+starts with fewer requests in flight, no rate limits, no escalation to
+hosted models, no cost, no OpenAI prompt cache key and no streaming. ``DATA_RIP_BASE_URL``
+also points the ``openai`` preset at a proxy or a mock.
+
+Every client gets its own pooled HTTP client. The pool is sized to the
+backend's concurrency and connections are kept alive between calls, so
+the workers don't open a new TLS connection for every row. The openai
+package itself is only imported when the first client is made.
+"""
+
+import os
+from typing import TYPE_CHECKING, Any
+
+import httpx
+
+from data_rip.engine import DEFAULT_CONCURRENCY
+from data_rip.ratelimit import DEFAULT_RPM, DEFAULT_TPM, RequestScheduler
+from data_rip.routing import ModelRouter, make_model_router
+
+if TYPE_CHECKING:
+    import openai
+
+DEFAULT_BACKEND = os.getenv("DATA_RIP_BACKEND", "openai")
+DEFAULT_LOCAL_URL = "http://127.0.0.1:8080/v1"
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("DATA_RIP_TIMEOUT", "120"))
+DEFAULT_KEEPALIVE_SECONDS = float(os.getenv("DATA_RIP_KEEPALIVE_SECONDS", "60"))
+CONNECT_TIMEOUT_SECONDS = 5.0
+# Connections beyond the concurrency limit, for schema generation and the odd retry
+POOL_HEADROOM = 4
+# A local server is limited by its hardware, not a request budget
+UNLIMITED = 1_000_000_000
+
+
+class Backend:
+    """Connection settings, limits and pricing of one OpenAI-compatible endpoint.
+
+    ``escalation_models`` of None uses ``DATA_RIP_ESCALATION_MODELS``, an
+    empty list turns escalation off. ``stream`` is the engine's stream mode
+    (see ``streaming``).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str | None = None,
+        api_key: str | None = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        requests_per_minute: int = DEFAULT_RPM,
+        tokens_per_minute: int = DEFAULT_TPM,
+        escalation_models: list[str] | None = None,
+        priced: bool = True,
+        prompt_cache_key: bool = True,
+        stream: str = "on",
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        keepalive: float = DEFAULT_KEEPALIVE_SECONDS,
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.escalation_models = escalation_models
+        self.priced = priced
+        self.prompt_cache_key = prompt_cache_key
+        self.stream = stream
+        self.timeout = timeout
+        self.keepalive = keepalive
+
+    def make_http_client(self, **options: Any) -> httpx.Client:
+        """Pooled HTTP client sized for this backend, ``options`` are passed on to ``httpx.Client``."""
+        connections = self.concurrency + POOL_HEADROOM
+        return httpx.Client(
+            limits=httpx.Limits(
+                max_connections=connections,
+                max_keepalive_connections=connections,
+                keepalive_expiry=self.keepalive,
+            ),
+            # Waiting for a pooled connection is bounded like the call itself
+            timeout=httpx.Timeout(self.timeout, connect=CONNECT_TIMEOUT_SECONDS),
+            **options,
+        )
+
+    def make_client(self, **http_options: Any) -> "openai.Client":
+        # The openai package takes a while to import, it is only loaded once a client is needed
+        import openai
+
+        return openai.Client(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            timeout=httpx.Timeout(self.timeout, connect=CONNECT_TIMEOUT_SECONDS),
+            http_client=self.make_http_client(**http_options),
+        )
+
+    def make_scheduler(self, client: Any) -> RequestScheduler:
+        return RequestScheduler(client, self.requests_per_minute, self.tokens_per_minute)
+
+    def make_router(self) -> ModelRouter | None:
+        if self.escalation_models is None:
+            return make_model_router()
+        return ModelRouter(self.escalation_models) if self.escalation_models else None
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def make_backend(name: str | None = None) -> Backend:
+    """The ``DATA_RIP_BACKEND`` (or ``name``) preset, with settings from the environment."""
+    name = name or DEFAULT_BACKEND
+    base_url = os.getenv("DATA_RIP_BASE_URL")
+    if name == "openai":
+        # Without overrides the openai package falls back to OPENAI_API_KEY and OPENAI_BASE_URL
+        return Backend(
+            name, base_url=base_url, api_key=os.getenv("DATA_RIP_API_KEY"), stream=os.getenv("DATA_RIP_STREAM", "on")
+        )
+    if name == "local":
+        return Backend(
+            name,
+            base_url=base_url or DEFAULT_LOCAL_URL,
+            # Local servers accept any key, but the openai package insists on one
+            api_key=os.getenv("DATA_RIP_API_KEY", "local"),
+            concurrency=_env_int("DATA_RIP_CONCURRENCY", 4),
+            requests_per_minute=_env_int("DATA_RIP_RPM", UNLIMITED),
+            tokens_per_minute=_env_int("DATA_RIP_TPM", UNLIMITED),
+            escalation_models=None if os.getenv("DATA_RIP_ESCALATION_MODELS") else [],
+            priced=False,
+            prompt_cache_key=False,
+            # Not every local server streams tool calls
+            stream=os.getenv("DATA_RIP_STREAM", "off"),
+        )
+    raise ValueError(f"Unknown DATA_RIP_BACKEND {name!r}, expected 'openai' or 'local'")
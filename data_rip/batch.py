@@ -0,0 +1,200 @@
+"""Bulk extraction through the OpenAI Batch API.
+
+Instead of one synchronous call per row, every queued row is written as a
+chat completion request to a JSONL file, uploaded and submitted as a batch,
+several batches when the queue is over the Batch API's limits per input
+file. The batches are polled for status and, as each one finishes, its
+results are merged into the job store by the value of the ID column, so the
+output grid is filled by the same paging as the synchronous engine. The
+batch ids are kept in the job store, so polling carries on after a restart.
+"""
+
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import Any
+
+from data_rip.engine import DEFAULT_MODEL, build_request
+from data_rip.jobs import MemoryJobStore, SQLiteJobStore
+from data_rip.schema import tools_schema
+from data_rip.validation import SchemaValidationError, SchemaValidator
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# Batches take minutes to hours, there is no point asking on every progress tick
+BATCH_POLL_SECONDS = 30.0
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Batch API limits per input file
+MAX_BATCH_REQUESTS = 50_000
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+
+
+def build_batch_requests(processing_queue: list[dict], id_column: str, model: str = DEFAULT_MODEL) -> list[dict]:
+    """One Batch API request line per queued row, with the ID column value as ``custom_id``."""
+    requests = []
+    seen = set()
+    for item in processing_queue:
+        custom_id = str(item["row"][id_column])
+        if custom_id in seen:
+            raise ValueError(f"Duplicate value {custom_id!r} in ID column {id_column!r}")
+        seen.add(custom_id)
+        requests.append({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": build_request(item, model),
+        })
+    return requests
+
+
+def split_batch_requests(
+    requests: list[dict], max_requests: int = MAX_BATCH_REQUESTS, max_bytes: int = MAX_BATCH_BYTES
+) -> list[list[dict]]:
+    """Split request lines into runs that each fit one batch input file."""
+    parts: list[list[dict]] = []
+    size = 0
+    for request in requests:
+        line_size = len(json.dumps(request).encode("utf-8")) + 1
+        if not parts or len(parts[-1]) >= max_requests or size + line_size > max_bytes:
+            parts.append([])
+            size = 0
+        parts[-1].append(request)
+        size += line_size
+    return parts
+
+
+def batch_status(statuses: list[str]) -> str:
+    """Status of a job made of batches: the first unfinished one, else ``completed`` unless one of them wasn't."""
+    for status in statuses:
+        if status not in TERMINAL_STATUSES:
+            return status
+    return next((status for status in statuses if status != "completed"), "completed")
+
+
+def write_batch_file(path: str, requests: list[dict]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request) + "\n")
+
+
+def parse_batch_output(text: str) -> dict[str, dict]:
+    """Map each ``custom_id`` in a batch output or error file to its tool call or error."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or response.get("body", {}).get("error") or {}
+            results[record["custom_id"]] = {"error": error.get("message", "Batch request failed")}
+            continue
+        try:
+            arguments = response["body"]["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"]
+            results[record["custom_id"]] = {"tool_call": json.loads(arguments)}
+        except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+            results[record["custom_id"]] = {"error": f"Could not parse tool call: {e}"}
+    return results
+
+
+class BatchRunner:
+    """Submits extraction jobs as batches and merges finished batches into the job store."""
+
+    def __init__(
+        self,
+        client: Any,
+        store: MemoryJobStore | SQLiteJobStore,
+        batch_dir: str | None = None,
+        poll_seconds: float = BATCH_POLL_SECONDS,
+        max_requests: int = MAX_BATCH_REQUESTS,
+        max_bytes: int = MAX_BATCH_BYTES,
+    ):
+        self.client = client
+        self.store = store
+        self.batch_dir = batch_dir or os.getenv("DATA_RIP_BATCH_DIR", tempfile.gettempdir())
+        self.poll_seconds = poll_seconds
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        # Each job's batches as recorded in the job store, and when they were last polled
+        self.batches: dict[str, list[dict]] = {}
+        self.last_polled: dict[str, float] = {}
+
+    def submit(self, processing_queue: list[dict], id_column: str, model: str = DEFAULT_MODEL) -> str:
+        """Write, upload and submit the queue as one or more batches, returning the job id."""
+        requests = build_batch_requests(processing_queue, id_column, model)
+        job_id = uuid.uuid4().hex
+        schema = tools_schema(processing_queue[0]["tools"]) if processing_queue else None
+        self.store.create_job(job_id, len(processing_queue), model, schema=schema)
+
+        rows = {
+            request["custom_id"]: (index, item["row"])
+            for index, (request, item) in enumerate(zip(requests, processing_queue))
+        }
+        parts = split_batch_requests(requests, self.max_requests, self.max_bytes)
+        for number, part in enumerate(parts, 1):
+            name = f"{job_id}.jsonl" if len(parts) == 1 else f"{job_id}-{number}.jsonl"
+            path = os.path.join(self.batch_dir, name)
+            write_batch_file(path, part)
+            with open(path, "rb") as f:
+                batch_file = self.client.files.create(file=f, purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=BATCH_COMPLETION_WINDOW,
+            )
+            self.store.add_batch(
+                job_id, batch.id, batch.status, {request["custom_id"]: rows[request["custom_id"]] for request in part}
+            )
+        self.batches[job_id] = self.store.get_batches(job_id)
+        self.last_polled[job_id] = time.monotonic()
+        return job_id
+
+    def poll(self, job_id: str) -> str:
+        """Refresh the batch statuses at most every ``poll_seconds``, merging each batch once finished.
+
+        Raises ``KeyError`` for a job with no batches.
+        """
+        if job_id not in self.batches:
+            # Submitted before a restart
+            self.batches[job_id] = self.store.get_batches(job_id)
+        batches = self.batches[job_id]
+        if not batches:
+            raise KeyError(job_id)
+        status = batch_status([batch["status"] for batch in batches])
+        if status in TERMINAL_STATUSES or time.monotonic() - self.last_polled.get(job_id, 0.0) < self.poll_seconds:
+            return status
+
+        for batch_info in batches:
+            if batch_info["status"] in TERMINAL_STATUSES:
+                continue
+            batch = self.client.batches.retrieve(batch_info["batch_id"])
+            if batch.status in TERMINAL_STATUSES:
+                self._merge(job_id, batch, batch_info["rows"])
+            batch_info["status"] = batch.status
+            self.store.set_batch_status(job_id, batch_info["batch_id"], batch.status)
+            if batch.status in TERMINAL_STATUSES:
+                batch_info["rows"] = {}
+        self.last_polled[job_id] = time.monotonic()
+        return batch_status([batch["status"] for batch in batches])
+
+    def _merge(self, job_id: str, batch: Any, rows: dict[str, tuple[int, dict]]) -> None:
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                results.update(parse_batch_output(self.client.files.content(file_id).text))
+
+        # Rows missing from both files were never run (failed, expired or cancelled batch)
+        validator = SchemaValidator(self.store.get_schema(job_id) or {})
+        for custom_id, (index, row) in rows.items():
+            result = results.get(custom_id, {"error": f"Batch {batch.status} before row was processed"})
+            if "tool_call" in result:
+                try:
+                    result["tool_call"] = validator.validate(result["tool_call"])
+                except SchemaValidationError as e:
+                    result = {"error": f"Answer did not match the schema: {e}"}
+            if "tool_call" in result:
+                self.store.add_result(job_id, index, row, result["tool_call"])
+            else:
+                self.store.add_error(job_id, index, row, result["error"])
@@ -0,0 +1,105 @@
+"""Persistent, content-addressed cache of extraction results.
+
+Results are keyed by a hash of everything that determines the model's answer:
+the ``tools`` schema, the model name, the system prompt and the row text. The
+cache lives in a SQLite file with a maximum number of entries, the least
+recently used entries are evicted first. Keys are looked up in batches, with
+one write per batch to mark the hits as recently used.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "data_rip", "results.db")
+DEFAULT_CACHE_SIZE = 100_000
+# Keys per lookup query, below SQLite's limit on query parameters
+LOOKUP_BATCH = 500
+
+
+def schema_digest(tools: list[dict], model: str, system_prompt: str) -> str:
+    """Hash of the parts of a request that are shared by every row of a job."""
+    payload = json.dumps({"tools": tools, "model": model, "system_prompt": system_prompt}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_key(digest: str, text: str) -> str:
+    return hashlib.sha256(f"{digest}\n{text}".encode()).hexdigest()
+
+
+class ResultCache:
+    """LRU cache of ``tool_call`` results stored in SQLite."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_CACHE_SIZE):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            # Readers don't block the writer, and commits don't wait for a sync of the whole file
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, tool_call TEXT NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            (self._entries, last_used) = self._conn.execute("SELECT COUNT(*), MAX(last_used) FROM results").fetchone()
+        # Recency is a counter rather than a timestamp so ties can't reorder evictions
+        self._clock = itertools.count(int(last_used or 0) + 1)
+
+    def __len__(self) -> int:
+        return self._entries
+
+    def get(self, key: str) -> dict | None:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        """Results of the ``keys`` that are cached, marked as used in the order of ``keys``."""
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock, self._conn:
+            for start in range(0, len(unique), LOOKUP_BATCH):
+                batch = unique[start : start + LOOKUP_BATCH]
+                found.update(
+                    self._conn.execute(
+                        f"SELECT key, tool_call FROM results WHERE key IN ({', '.join('?' * len(batch))})", batch
+                    )
+                )
+            if found:
+                self._conn.executemany(
+                    "UPDATE results SET last_used = ? WHERE key = ?",
+                    [(next(self._clock), key) for key in unique if key in found],
+                )
+        return {key: json.loads(tool_call) for key, tool_call in found.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def put(self, key: str, tool_call: dict) -> None:
+        with self._lock, self._conn:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO results (key, tool_call, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(tool_call), next(self._clock)),
+            ).rowcount
+            self._entries += inserted
+            if self._entries > self.max_entries:
+                # Evict a tenth of the cache at once so eviction isn't paid on every insert
+                evict = self._entries - self.max_entries + self.max_entries // 10
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)", (evict,)
+                )
+                (self._entries,) = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()
+
+
+def make_result_cache(path: str | None = None) -> ResultCache | None:
+    """Cache at ``DATA_RIP_CACHE_PATH`` (or ``path``), disabled when that is set to ``off``."""
+    path = path or os.getenv("DATA_RIP_CACHE_PATH", DEFAULT_CACHE_PATH)
+    if path.lower() == "off":
+        return None
+    return ResultCache(path, max_entries=int(os.getenv("DATA_RIP_CACHE_SIZE", str(DEFAULT_CACHE_SIZE))))
@@ -0,0 +1,111 @@
+"""Splitting long text cells into chunks and merging what was extracted from them.
+
+A cell estimated at more than ``DEFAULT_CHUNK_TOKENS`` is split into
+overlapping chunks, preferring paragraph, line and word boundaries. Every
+chunk is extracted on its own (in parallel with the rest of the job) and the
+partial results are merged by the schema: arrays are concatenated, leaving
+out the items a chunk starts with that the chunk before ended with (they
+come from the text the two share), objects are merged field by field, and
+anything else takes the first non-null value.
+"""
+
+import json
+import os
+import threading
+from typing import Any
+
+from data_rip.packing import estimate_tokens
+
+DEFAULT_CHUNK_TOKENS = int(os.getenv("DATA_RIP_CHUNK_TOKENS", "4000"))
+DEFAULT_CHUNK_OVERLAP = int(os.getenv("DATA_RIP_CHUNK_OVERLAP", "200"))
+# Characters per token, matching ``estimate_tokens``
+CHARS_PER_TOKEN = 4
+BOUNDARIES = ("\n\n", "\n", ". ", " ")
+
+
+def split_text(
+    text: str, max_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_CHUNK_OVERLAP
+) -> list[str]:
+    """Chunks of about ``max_tokens`` each, consecutive chunks sharing about ``overlap_tokens``."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, max_chars // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            # Cut at the last natural boundary in the final fifth of the window
+            window_start = end - max_chars // 5
+            for boundary in BOUNDARIES:
+                cut = text.rfind(boundary, window_start, end)
+                if cut > start:
+                    end = cut + len(boundary)
+                    break
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        # The next chunk starts up to ``overlap_chars`` back, at the start of a word
+        start = max(end - overlap_chars, start + 1)
+        space = text.find(" ", start, end)
+        if space != -1:
+            start = space + 1
+    return chunks
+
+
+def _merge_value(schema: dict, values: list[Any]) -> Any:
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    kind = schema.get("type")
+    if kind == "array" and all(isinstance(value, list) for value in values):
+        # Only the overlap is deduplicated, items repeated elsewhere in the text are kept
+        merged, previous = [], []
+        for value in values:
+            markers = [json.dumps(item, sort_keys=True, default=str) for item in value]
+            overlap = next(
+                (size for size in range(min(len(previous), len(markers)), 0, -1) if previous[-size:] == markers[:size]),
+                0,
+            )
+            merged.extend(value[overlap:])
+            previous = markers
+        return merged
+    if kind == "object" and schema.get("properties") and all(isinstance(value, dict) for value in values):
+        return merge_results(schema, values)
+    return values[0]
+
+
+def merge_results(parameters: dict, partials: list[dict]) -> dict:
+    """Merge the tool call arguments extracted from each chunk of a row, in chunk order."""
+    properties = parameters.get("properties", {})
+    partials = [partial for partial in partials if isinstance(partial, dict)]
+    names = list(properties) + [name for partial in partials for name in partial if name not in properties]
+    merged = {}
+    for name in dict.fromkeys(names):
+        values = [partial[name] for partial in partials if name in partial]
+        if values:
+            merged[name] = _merge_value(properties.get(name, {}), values)
+    return merged
+
+
+class ChunkedRow:
+    """The chunks of one long row, collecting partial results until every chunk is back."""
+
+    def __init__(self, key: str, group: list[tuple[int, dict]], chunks: list[str]):
+        self.key = key
+        self.group = group
+        self.chunks = chunks
+        self.partials: list[dict | None] = [None] * len(chunks)
+        self.errors: list[str] = []
+        self._remaining = len(chunks)
+        self._lock = threading.Lock()
+
+    def add(self, index: int, partial: dict | None = None, error: str | None = None) -> bool:
+        """Record one chunk's result or error, returning True once it was the last chunk outstanding."""
+        with self._lock:
+            self.partials[index] = partial
+            if error is not None:
+                self.errors.append(error)
+            self._remaining -= 1
+            return self._remaining == 0
@@ -0,0 +1,104 @@
+"""``data-rip`` command line entry point for running extraction without the UI."""
+
+import argparse
+import sys
+
+from data_rip.backends import make_backend
+from data_rip.cache import make_result_cache
+from data_rip.engine import DEFAULT_MODEL
+from data_rip.extract import extract_file
+from data_rip.schema import clean_schema, generate_schema
+from data_rip.scheduling import DISPATCH_POLICIES
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="data-rip", description="Structured data extraction from a CSV or Excel file using LLM function calling."
+    )
+    parser.add_argument("input", help="CSV or Excel file to extract from")
+    parser.add_argument("-o", "--output", required=True, help="Output file, .csv, .jsonl or .parquet")
+    parser.add_argument("--id-column", required=True, help="Column identifying each row")
+    parser.add_argument("--text-column", required=True, help="Column holding the text to extract from")
+    schema_source = parser.add_mutually_exclusive_group(required=True)
+    schema_source.add_argument("--instruction", help="Plain language description of what to extract")
+    schema_source.add_argument("--schema", help="JSON schema file with 'properties' and 'required'")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"Model for row extraction (default {DEFAULT_MODEL})")
+    parser.add_argument(
+        "--backend", choices=("openai", "local"), help="OpenAI or a local OpenAI-compatible server (DATA_RIP_BACKEND)"
+    )
+    parser.add_argument("--concurrency", type=int, help="Requests in flight at once (default per backend)")
+    parser.add_argument("--pack-size", type=int, default=1, help="Rows packed into each request")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the result cache")
+    parser.add_argument(
+        "--no-escalation", action="store_true", help="Don't send rows with bad answers to a stronger model"
+    )
+    parser.add_argument(
+        "--near-duplicates",
+        type=float,
+        metavar="SIMILARITY",
+        help="Extract texts at least this alike (0 to 1) once per cluster (DATA_RIP_NEAR_DUPLICATES)",
+    )
+    parser.add_argument(
+        "--dispatch",
+        choices=DISPATCH_POLICIES,
+        help="Order rows are sent in: file order, shortest first or length bucketed (DATA_RIP_DISPATCH)",
+    )
+    return parser.parse_args(argv)
+
+
+def print_progress(progress: dict) -> None:
+    done = progress["completed"] + progress["failed"]
+    print(f"\rProcessed {done} of {progress['total_rows']} rows ({progress['failed']} failed)", end="", file=sys.stderr)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    backend = make_backend(args.backend)
+    client = backend.make_client()
+
+    if args.schema:
+        with open(args.schema, encoding="utf-8") as f:
+            schema = clean_schema(f.read())
+    else:
+        cache = None if args.no_cache else make_result_cache()
+        schema = clean_schema(generate_schema(backend.make_scheduler(client), args.instruction, cache=cache))
+        print(f"Generated schema: {schema}", file=sys.stderr)
+
+    result = extract_file(
+        args.input,
+        args.output,
+        args.id_column,
+        args.text_column,
+        schema,
+        model=args.model,
+        client=client,
+        concurrency=args.concurrency,
+        pack_size=args.pack_size,
+        use_cache=not args.no_cache,
+        escalate=not args.no_escalation,
+        near_duplicates=args.near_duplicates,
+        dispatch=args.dispatch,
+        backend=backend,
+        on_progress=print_progress,
+    )
+    print(
+        f"\nWrote {result['completed']} rows to {args.output}"
+        f" ({result['rows_per_second']:.1f} rows/s, {result['tokens_per_row']:.0f} tokens/row)",
+        file=sys.stderr,
+    )
+    if result["near_duplicates"]:
+        print(
+            f"{result['near_duplicates']} near-duplicate texts shared an extraction,"
+            f" {result['reduction_factor']:.1f}x fewer extractions",
+            file=sys.stderr,
+        )
+    if result["escalations"]:
+        escalated = ", ".join(f"{count} to {model}" for model, count in result["escalations"].items())
+        print(f"Escalated {escalated}, saving ~${result['cost_saved']:.4f}", file=sys.stderr)
+    for error in result["errors"]:
+        print(f"Failed row {error['row'].get(args.id_column, error['index'])}: {error['error']}", file=sys.stderr)
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
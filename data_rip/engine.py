@@ -0,0 +1,830 @@
+"""Server-side extraction engine.
+
+Rows queued by the "Run Structured Extraction" callback are handed to a pool of
+worker threads so that many chat completion calls are in flight at once. Rows
+and failures are written to a job store, and the Dash progress interval only
+polls that store for progress and finished rows. Jobs share the workers by
+priority and weight and can be paused, resumed and cancelled (see
+``scheduling``).
+
+Before anything is queued, rows are looked up in the result cache and rows
+with identical text are grouped, so each distinct request is sent only once.
+With ``near_duplicates`` rows whose texts are almost the same are grouped too
+(see ``near_duplicates``).
+Short rows can optionally be packed several to a call (see ``packing``), and
+rows too long for one call are split into chunks that are extracted in
+parallel and merged (see ``chunking``).
+
+Every answer is checked against the job's schema (see ``validation``). With a
+model ``router`` a row whose answer doesn't parse, doesn't match or reports a
+low confidence is escalated to a stronger model (see ``routing``); without one
+it is sent again to the same model. A row that still doesn't match is recorded
+as failed instead of landing in the results.
+
+Jobs submitted with a stable ``job_id`` resume: rows already checkpointed in
+the job store are skipped and only the rest (including earlier failures) are
+queued again. That is also how a preview of a sample of rows (see
+``preview``) is reused by the full run.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import Callable, Collection, Iterable
+from types import SimpleNamespace
+from typing import Any
+
+from data_rip.cache import LOOKUP_BATCH, ResultCache, cache_key
+from data_rip.chunking import DEFAULT_CHUNK_TOKENS, ChunkedRow, merge_results, split_text
+from data_rip.jobs import MemoryJobStore, SQLiteJobStore, row_key
+from data_rip.metrics import MetricsRecorder, estimate_cost
+from data_rip.near_duplicates import NearDuplicateFinder
+from data_rip.packing import DEFAULT_PACK_TOKENS, estimate_tokens, pack_rows, parse_packed_results
+from data_rip.prompts import EXTRACTION_SYS_PROMPT
+from data_rip.ratelimit import COMPLETION_TOKEN_ESTIMATE, RequestCancelled, RequestScheduler, estimate_request_tokens
+from data_rip.request_builder import RequestBuilder
+from data_rip.routing import ModelRouter
+from data_rip.schema import tools_schema
+from data_rip.scheduling import (
+    CANCELLED,
+    DEFAULT_DISPATCH,
+    DEFAULT_PRIORITY,
+    DEFAULT_WEIGHT,
+    DISPATCH_POLICIES,
+    JobQueue,
+    dispatch_order,
+)
+from data_rip.streaming import STREAM_MODES, read_stream
+from data_rip.validation import SchemaValidationError, SchemaValidator
+
+DEFAULT_MODEL = os.getenv("DATA_RIP_MODEL", "gpt-4o-mini")
+DEFAULT_CONCURRENCY = int(os.getenv("DATA_RIP_CONCURRENCY", "16"))
+# Times a row whose answer doesn't match the schema is sent again, without a router to escalate it
+VALIDATION_RETRIES = 1
+# Jobs whose counters, call traces and controls are kept in memory, older finished jobs are forgotten
+JOB_HISTORY = int(os.getenv("DATA_RIP_JOB_HISTORY", "50"))
+
+
+def _new_stats() -> dict[str, float]:
+    return {
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "duplicates": 0,
+        # Distinct texts answered by the extraction of a near-duplicate
+        "near_duplicates": 0,
+        "requests": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        # Prompt tokens the provider served from its prompt cache
+        "cached_tokens": 0,
+        "completion_tokens": 0,
+        "latency_seconds": 0.0,
+        "cost": 0.0,
+        # What the accepted calls would have cost on the router's strongest model
+        "baseline_cost": 0.0,
+        "escalated": 0,
+        "low_confidence": 0,
+        "pack_fallbacks": 0,
+        "chunked_rows": 0,
+        "chunks": 0,
+        "invalid": 0,
+        "resumed": 0,
+        # Streamed calls that got a field, the seconds until their first field closed and the streams stopped early
+        "streamed": 0,
+        "first_field_seconds": 0.0,
+        "early_stops": 0,
+        "started": time.monotonic(),
+        "last_finished": time.monotonic(),
+    }
+
+
+def build_request(item: dict, model: str = DEFAULT_MODEL) -> dict:
+    """Chat completion arguments for extracting a single queued row."""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": EXTRACTION_SYS_PROMPT},
+            {"role": "user", "content": item["row"][item["text_column"]]},
+        ],
+        "tools": item["tools"],
+        "tool_choice": {"type": "function", "function": {"name": item["function_name"]}},
+    }
+
+
+class ExtractionEngine:
+    """Runs queued rows for every job on a fixed number of worker threads.
+
+    ``max_workers`` is the concurrency limit: the number of chat completion
+    requests that may be in flight at any time across all jobs. With a
+    ``scheduler`` the calls are also rate limited and retried. With a
+    ``router`` rows with bad answers are escalated to stronger models. Every
+    call is recorded in ``metrics``. ``prompt_cache_key`` tags requests with
+    OpenAI's prompt cache routing key (see ``request_builder``). With
+    ``near_duplicates`` each cluster of near-duplicate texts is extracted once.
+    ``dispatch`` is the order each job's calls are sent in (see ``scheduling``).
+    With ``stream`` (``on`` or ``early``, see ``streaming``) single rows are
+    streamed and their fields shown in ``partial_rows`` as they close. The
+    in-memory state of the ``job_history`` most recently submitted jobs is
+    kept, older jobs are forgotten once they have finished and pruned from the
+    job store with their rows.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        store: MemoryJobStore | SQLiteJobStore | None = None,
+        max_workers: int = DEFAULT_CONCURRENCY,
+        cache: ResultCache | None = None,
+        scheduler: RequestScheduler | None = None,
+        metrics: MetricsRecorder | None = None,
+        router: ModelRouter | None = None,
+        prompt_cache_key: bool = False,
+        near_duplicates: NearDuplicateFinder | None = None,
+        dispatch: str = DEFAULT_DISPATCH,
+        stream: str = "off",
+        job_history: int = JOB_HISTORY,
+    ):
+        if dispatch not in DISPATCH_POLICIES:
+            raise ValueError(f"Unknown dispatch policy {dispatch!r}, expected one of {', '.join(DISPATCH_POLICIES)}")
+        if stream not in STREAM_MODES:
+            raise ValueError(f"Unknown stream mode {stream!r}, expected one of {', '.join(STREAM_MODES)}")
+        self.client = client
+        self.scheduler = scheduler
+        self.router = router
+        self.prompt_cache_key = prompt_cache_key
+        self.near_duplicates = near_duplicates
+        self.dispatch = dispatch
+        self.stream = stream
+        self.metrics = metrics if metrics is not None else MetricsRecorder()
+        self.store = store if store is not None else MemoryJobStore()
+        self.max_workers = max_workers
+        self.cache = cache
+        self.job_history = job_history
+        # Jobs in the order they were last submitted, oldest first
+        self._history: dict[str, None] = {}
+        # Per job counters: cache hits and misses, in-run duplicates, requests, token usage, latency,
+        # estimated cost and invalid answers
+        self.stats: dict[str, dict[str, float]] = {}
+        # Per job count of rows escalated to each model
+        self.escalations: dict[str, Counter] = {}
+        # Per job count of queued calls not finished yet
+        self._in_flight: Counter = Counter()
+        # Per job rows being streamed, by index, with the fields that have closed so far
+        self._partial: dict[str, dict[int, dict]] = {}
+        # Per job indexes of the rows queued or in flight, so a run joining one still going (the full run of a
+        # previewed job) only queues the rest
+        self._queued: dict[str, set[int]] = {}
+        self._queue = JobQueue()
+        self._workers: list[threading.Thread] = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _ensure_workers(self) -> None:
+        # Workers are started on first use so importing the app stays cheap
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The engine was closed")
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(
+                    target=self._work, name=f"data-rip-worker-{len(self._workers)}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(
+        self,
+        processing_queue: list[dict],
+        model: str = DEFAULT_MODEL,
+        pack_size: int = 1,
+        pack_tokens: int = DEFAULT_PACK_TOKENS,
+        job_id: str | None = None,
+        id_column: str | None = None,
+        chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+        only_rows: Collection[int] | None = None,
+        priority: int = DEFAULT_PRIORITY,
+        weight: float = DEFAULT_WEIGHT,
+    ) -> str:
+        """Queue every item for extraction and return the job id.
+
+        With ``pack_size`` above one, up to that many distinct rows (and about
+        ``pack_tokens`` of text) are extracted per call. Rows longer than
+        ``chunk_tokens`` are extracted a chunk at a time. Passing the ``job_id``
+        of an earlier run resumes it, skipping rows checkpointed by their
+        ``id_column`` value. With ``only_rows`` just the items at those
+        positions are queued, the job still covers the whole queue. The job's
+        calls go before those of lower ``priority`` jobs and share the workers
+        with equal priority jobs in proportion to ``weight``. Submitting a job
+        still running in this process only queues its rows not already queued.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        done_keys: set[str] = set()
+        joining = False
+        if self.store.has_job(job_id):
+            joining = self.running(job_id) and self.job_state(job_id) != CANCELLED
+            done_keys = self.store.completed_row_keys(job_id)
+            self.store.clear_errors(job_id)
+        else:
+            # Rows are checkpointed by ID only when the IDs tell them apart
+            ids = [item["row"].get(id_column) for item in processing_queue] if id_column else []
+            unique_ids = id_column is not None and len(set(map(str, ids))) == len(ids)
+            schema = tools_schema(processing_queue[0]["tools"]) if processing_queue else None
+            self.store.create_job(job_id, len(processing_queue), model, id_column if unique_ids else None, schema)
+        checkpoint_column = self.store.get_progress(job_id)["id_column"]
+
+        self._remember(job_id)
+        if not joining or job_id not in self.stats:
+            # A run joining one still going keeps counting into the same stats
+            self.stats[job_id] = _new_stats()
+            self.escalations[job_id] = Counter()
+        if only_rows is None:
+            indexed_items: Iterable[tuple[int, dict]] = enumerate(processing_queue)
+        else:
+            indexed_items = ((index, processing_queue[index]) for index in sorted(only_rows))
+        self._enqueue(
+            job_id,
+            model,
+            indexed_items,
+            checkpoint_column,
+            done_keys,
+            pack_size,
+            pack_tokens,
+            chunk_tokens,
+            priority,
+            weight,
+        )
+        return job_id
+
+    def submit_range(
+        self,
+        job_id: str,
+        processing_queue: list[dict],
+        start_index: int,
+        model: str = DEFAULT_MODEL,
+        pack_size: int = 1,
+        pack_tokens: int = DEFAULT_PACK_TOKENS,
+        chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+        priority: int = DEFAULT_PRIORITY,
+        weight: float = DEFAULT_WEIGHT,
+    ) -> None:
+        """Queue rows of a job created elsewhere, numbered from ``start_index``.
+
+        Worker processes use this for the row range they claimed from the work
+        queue. Rows of the range that are already checkpointed are skipped and
+        its earlier failures are retried.
+        """
+        end_index = start_index + len(processing_queue)
+        self._remember(job_id)
+        with self._stats_lock:
+            if job_id not in self.stats:
+                self.stats[job_id] = _new_stats()
+                self.escalations[job_id] = Counter()
+        done_keys = self.store.completed_row_keys(job_id, start_index, end_index)
+        self.store.clear_errors(job_id, start_index, end_index)
+        checkpoint_column = self.store.get_progress(job_id)["id_column"]
+        self._enqueue(
+            job_id,
+            model,
+            enumerate(processing_queue, start_index),
+            checkpoint_column,
+            done_keys,
+            pack_size,
+            pack_tokens,
+            chunk_tokens,
+            priority,
+            weight,
+        )
+
+    def _enqueue(
+        self,
+        job_id: str,
+        model: str,
+        indexed_items: Iterable[tuple[int, dict]],
+        checkpoint_column: str | None,
+        done_keys: set[str],
+        pack_size: int,
+        pack_tokens: int,
+        chunk_tokens: int,
+        priority: int = DEFAULT_PRIORITY,
+        weight: float = DEFAULT_WEIGHT,
+    ) -> None:
+        stats = dict.fromkeys(
+            ("resumed", "duplicates", "near_duplicates", "cache_hits", "cache_misses", "chunked_rows", "chunks"), 0
+        )
+
+        # Group identical requests so each one goes out once, serving cached ones directly
+        groups: dict[str, list[tuple[int, dict]]] = {}
+        # One frozen request prefix and validator per schema, shared by all its rows
+        builders: dict[int, RequestBuilder] = {}
+        validators: dict[int, SchemaValidator] = {}
+        with self._stats_lock:
+            queued = set(self._queued.get(job_id, ()))
+        # Rows are looked up in the cache a batch at a time rather than with a query per row
+        pending = iter(indexed_items)
+        while batch := list(itertools.islice(pending, LOOKUP_BATCH)):
+            keyed = []
+            for index, item in batch:
+                if index in queued:
+                    continue
+                if done_keys and row_key(item["row"], index, checkpoint_column) in done_keys:
+                    stats["resumed"] += 1
+                    continue
+                tools_id = id(item["tools"])
+                if tools_id not in builders:
+                    builders[tools_id] = RequestBuilder(
+                        item["tools"], item["function_name"], model, prompt_cache_key=self.prompt_cache_key
+                    )
+                    validators[tools_id] = SchemaValidator.for_tools(item["tools"])
+                keyed.append((cache_key(builders[tools_id].digest, str(item["row"][item["text_column"]])), index, item))
+            found = {}
+            if self.cache is not None:
+                found = self.cache.get_many([key for key, _, _ in keyed if key not in groups])
+            for key, index, item in keyed:
+                if key in groups:
+                    stats["duplicates"] += 1
+                    groups[key].append((index, item))
+                    continue
+                cached = found.get(key)
+                if cached is not None:
+                    try:
+                        cached = validators[id(item["tools"])].validate(cached)
+                    except SchemaValidationError:
+                        # Cached before answers were checked, extract it again
+                        cached = None
+                if cached is not None:
+                    stats["cache_hits"] += 1
+                    self.store.add_result(job_id, index, item["row"], cached)
+                    continue
+                stats["cache_misses"] += 1
+                groups[key] = [(index, item)]
+
+        if self.near_duplicates is not None:
+            stats["near_duplicates"] = self._group_near_duplicates(groups)
+
+        # Long rows are split into chunks, each queued as a call of its own
+        entries, chunked = [], []
+        for key, group in groups.items():
+            text = str(group[0][1]["row"][group[0][1]["text_column"]])
+            if estimate_tokens(text) > chunk_tokens:
+                chunked.append(ChunkedRow(key, group, split_text(text, chunk_tokens)))
+            else:
+                entries.append((key, group))
+
+        if pack_size > 1:
+            texts = [str(group[0][1]["row"][group[0][1]["text_column"]]) for _, group in entries]
+            packs = pack_rows(entries, texts, pack_size, pack_tokens)
+        else:
+            packs = [[entry] for entry in entries]
+
+        stats["chunked_rows"] = len(chunked)
+        stats["chunks"] = sum(len(row.chunks) for row in chunked)
+        self._record(job_id, **stats)
+        if stats["cache_hits"]:
+            self.metrics.increment("data_rip_cache_hits_total", stats["cache_hits"])
+        # Calls are queued in the dispatch policy's order of their estimated text tokens
+        calls, sizes = [], []
+        for row in chunked:
+            tools_id = id(row.group[0][1]["tools"])
+            for chunk_index in range(len(row.chunks)):
+                calls.append((job_id, model, None, builders[tools_id], validators[tools_id], (row, chunk_index)))
+                sizes.append(estimate_tokens(row.chunks[chunk_index]))
+        for pack in packs:
+            tools_id = id(pack[0][1][0][1]["tools"])
+            calls.append((job_id, model, pack, builders[tools_id], validators[tools_id], None))
+            sizes.append(sum(estimate_tokens(str(group[0][1]["row"][group[0][1]["text_column"]])) for _, group in pack))
+        with self._stats_lock:
+            self._in_flight[job_id] += len(calls)
+            self._queued.setdefault(job_id, set()).update(index for group in groups.values() for index, _ in group)
+        self._ensure_workers()
+        ordered = [calls[position] for position in dispatch_order(sizes, self.dispatch)]
+        self._queue.extend(job_id, ordered, priority, weight)
+
+    def _remember(self, job_id: str) -> None:
+        """Mark the job as the most recent, forgetting the oldest finished jobs over ``job_history``."""
+        with self._stats_lock:
+            self._history.pop(job_id, None)
+            self._history[job_id] = None
+            excess = len(self._history) - self.job_history
+            forgotten = [old for old in self._history if old != job_id and not self._in_flight[old]][: max(excess, 0)]
+            for old in forgotten:
+                del self._history[old]
+                for state in (self.stats, self.escalations, self._in_flight, self._partial, self._queued):
+                    state.pop(old, None)
+            running = [job_id, *(old for old in self._history if self._in_flight[old])]
+        for old in forgotten:
+            self._queue.forget(old)
+            self.metrics.forget(old)
+        self.store.prune(self.job_history, keep=running)
+
+    def _group_near_duplicates(self, groups: dict[str, list[tuple[int, dict]]]) -> int:
+        """Merge groups of near-duplicate texts into their representative's group, returning how many were merged.
+
+        Only the representative's text is extracted and cached, the merged rows get its answer.
+        """
+        by_tools: dict[int, list[str]] = {}
+        for key, group in groups.items():
+            by_tools.setdefault(id(group[0][1]["tools"]), []).append(key)
+        merged = 0
+        for keys in by_tools.values():
+            texts = [str(groups[key][0][1]["row"][groups[key][0][1]["text_column"]]) for key in keys]
+            for key, representative in zip(keys, self.near_duplicates.representatives(texts)):
+                if keys[representative] != key:
+                    groups[keys[representative]].extend(groups.pop(key))
+                    merged += 1
+        return merged
+
+    def pause(self, job_id: str) -> None:
+        """Stop handing out the job's queued calls, calls already in flight still finish."""
+        self._queue.pause(job_id)
+
+    def resume(self, job_id: str) -> None:
+        self._queue.resume(job_id)
+
+    def cancel(self, job_id: str) -> None:
+        """Drop the job's queued calls and give up on calls still waiting for the rate limiter.
+
+        Streamed calls are closed, other calls already sent can't be taken
+        back and are still recorded, but their answers are discarded and the
+        rows left unfinished. Submitting the job again resumes it.
+        """
+        dropped = self._queue.cancel(job_id)
+        with self._stats_lock:
+            self._in_flight[job_id] -= dropped
+            self._queued.pop(job_id, None)
+
+    def job_state(self, job_id: str) -> str | None:
+        """``running``, ``paused`` or ``cancelled``, None for a job this engine hasn't run."""
+        return self._queue.state(job_id)
+
+    def set_share(self, job_id: str, priority: int | None = None, weight: float | None = None) -> None:
+        """Change the priority or weight of a job that is running."""
+        self._queue.set_share(job_id, priority, weight)
+
+    def partial_rows(self, job_id: str, index_field: str | None = None) -> list[dict]:
+        """Rows still being streamed, with the fields that have arrived so far.
+
+        With ``index_field`` each row also holds its position in the input under that key.
+        """
+        with self._stats_lock:
+            partial = list(self._partial.get(job_id, {}).items())
+        return [{**row, index_field: index} if index_field else dict(row) for index, row in partial]
+
+    def running(self, job_id: str) -> bool:
+        """Whether calls queued for the job in this process haven't all finished."""
+        with self._stats_lock:
+            return self._in_flight[job_id] > 0
+
+    def throughput(self, job_id: str) -> dict[str, float | None]:
+        """Rate, token, cost and latency figures for this run of a job so far.
+
+        ``eta_seconds`` is the time left at the current rate, None until the
+        first row has finished.
+        """
+        stats = self.stats[job_id]
+        progress = self.store.get_progress(job_id) or {"completed": 0, "failed": 0, "total_rows": 0}
+        elapsed = max(stats["last_finished"] - stats["started"], 1e-9)
+        # Rows resumed from a checkpoint weren't extracted by this run
+        finished = max(progress["completed"] - stats["resumed"], 0)
+        rows = max(finished, 1)
+        tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+        remaining = progress["total_rows"] - progress["completed"] - progress["failed"]
+        rows_per_second = finished / elapsed
+        return {
+            "rows_per_second": rows_per_second,
+            "tokens_per_second": tokens / elapsed,
+            "tokens_per_row": tokens / rows,
+            "cached_share": stats["cached_tokens"] / max(stats["prompt_tokens"], 1),
+            "requests_per_row": stats["requests"] / rows,
+            # Rows sent for extraction per distinct extraction, after exact and near-duplicate grouping
+            "reduction_factor": (stats["cache_misses"] + stats["duplicates"])
+            / max(stats["cache_misses"] - stats["near_duplicates"], 1),
+            "mean_latency": stats["latency_seconds"] / max(stats["requests"], 1),
+            "mean_first_field": stats["first_field_seconds"] / stats["streamed"] if stats["streamed"] else None,
+            "estimated_cost": stats["cost"],
+            "cost_saved": stats["baseline_cost"] - stats["cost"] if self.router is not None else 0.0,
+            "eta_seconds": remaining / rows_per_second if rows_per_second else None,
+        }
+
+    def trace(self, job_id: str) -> dict:
+        """Progress, counters, throughput and recorded calls of a job, for the JSON trace export."""
+        stats = self.stats.get(job_id)
+        return {
+            "job_id": job_id,
+            "progress": self.store.get_progress(job_id),
+            "stats": {k: v for k, v in stats.items() if k not in ("started", "last_finished")} if stats else None,
+            "throughput": self.throughput(job_id) if stats else None,
+            "escalations": dict(self.escalations.get(job_id, {})),
+            "calls": self.metrics.trace(job_id),
+        }
+
+    def _record(self, job_id: str, **increments: float) -> None:
+        with self._stats_lock:
+            stats = self.stats[job_id]
+            for name, value in increments.items():
+                stats[name] += value
+
+    def _complete(
+        self,
+        job_id: str,
+        request: dict,
+        kind: str = "single",
+        rows: int = 1,
+        on_fields: Callable[[dict], None] | None = None,
+        required: list[str] | None = None,
+    ) -> tuple[Any, float]:
+        """Send one chat completion, recording its latency, retries and token usage against the job.
+
+        Returns the message and what the call would have cost on the router's
+        strongest model, which callers record once the answer is accepted.
+        With ``on_fields`` and streaming on, the call is streamed and
+        ``on_fields`` gets the fields as they close, stopping early once the
+        ``required`` fields have closed in ``early`` mode. Raises
+        ``RequestCancelled`` when the job is cancelled before the call is sent,
+        while it streams or by the time its answer is back.
+        """
+        retries = 0
+
+        def on_retry() -> None:
+            nonlocal retries
+            retries += 1
+            self._record(job_id, retries=1)
+
+        def cancelled() -> bool:
+            return self._queue.state(job_id) == CANCELLED
+
+        if cancelled():
+            raise RequestCancelled("Job cancelled")
+        streamed = on_fields is not None and self.stream != "off"
+        if streamed:
+            request = {**request, "stream": True, "stream_options": {"include_usage": True}}
+        first_field = None
+        started = time.perf_counter()
+        try:
+            if self.scheduler is not None:
+                response = self.scheduler.create(on_retry=on_retry, cancelled=cancelled, **request)
+            else:
+                response = self.client.chat.completions.create(**request)
+            if streamed:
+                message, usage, first_field = read_stream(
+                    response, on_fields, required if self.stream == "early" else None, cancelled
+                )
+            else:
+                message, usage = response.choices[0].message, getattr(response, "usage", None)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            self.metrics.record_call(
+                job_id, request["model"], kind, time.perf_counter() - started, retries=retries, rows=rows, error=str(e)
+            )
+            raise
+        latency = time.perf_counter() - started
+        if streamed and usage is None:
+            # A stream stopped early never gets to report its usage, it is estimated instead
+            usage = SimpleNamespace(
+                prompt_tokens=estimate_request_tokens(request) - COMPLETION_TOKEN_ESTIMATE,
+                completion_tokens=estimate_tokens(message.tool_calls[0].function.arguments),
+            )
+            self._record(job_id, early_stops=1)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+        first_field_seconds = first_field - started if first_field is not None else None
+        record = self.metrics.record_call(
+            job_id,
+            request["model"],
+            kind,
+            latency,
+            prompt_tokens,
+            completion_tokens,
+            retries,
+            rows,
+            cached_tokens,
+            first_field=first_field_seconds,
+        )
+        self._record(
+            job_id,
+            requests=1,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            completion_tokens=completion_tokens,
+            latency_seconds=latency,
+            cost=record["cost"],
+            streamed=int(first_field_seconds is not None),
+            first_field_seconds=first_field_seconds or 0.0,
+        )
+        if cancelled():
+            # The call is paid for, but the job was cancelled while it ran, so its answer isn't used
+            raise RequestCancelled("Job cancelled")
+        if self.router is None:
+            baseline = record["cost"]
+        else:
+            baseline = estimate_cost(
+                self.router.top_model(request["model"]), prompt_tokens, completion_tokens, cached_tokens
+            )
+        return message, baseline
+
+    def _show_partial(self, job_id: str, group: list[tuple[int, dict]], fields: dict) -> None:
+        with self._stats_lock:
+            partial = self._partial.setdefault(job_id, {})
+            for index, item in group:
+                partial.setdefault(index, dict(item["row"])).update(fields)
+
+    def _drop_partial(self, job_id: str, group: list[tuple[int, dict]]) -> None:
+        with self._stats_lock:
+            partial = self._partial.get(job_id, {})
+            queued = self._queued.get(job_id, set())
+            for index, _ in group:
+                partial.pop(index, None)
+                queued.discard(index)
+
+    def _finish(self, job_id: str, key: str, group: list[tuple[int, dict]], tool_call: dict) -> None:
+        # Dropped first, so a row is never shown both streaming and finished
+        self._drop_partial(job_id, group)
+        if self.cache is not None:
+            self.cache.put(key, tool_call)
+        for index, item in group:
+            self.store.add_result(job_id, index, item["row"], tool_call)
+        self.metrics.increment("data_rip_rows_total", len(group), status="completed")
+        with self._stats_lock:
+            self.stats[job_id]["last_finished"] = time.monotonic()
+
+    def _fail(self, job_id: str, group: list[tuple[int, dict]], error: str) -> None:
+        self._drop_partial(job_id, group)
+        if self._queue.state(job_id) == CANCELLED:
+            # Left unfinished rather than failed, running the job again picks the rows up
+            return
+        for index, item in group:
+            self.store.add_error(job_id, index, item["row"], error)
+        self.metrics.increment("data_rip_rows_total", len(group), status="failed")
+
+    def _unsure(self, model: str, tool_call: dict) -> bool:
+        """Whether an answer's confidence is too low and a stronger model is left to escalate to."""
+        return (
+            self.router is not None
+            and self.router.top_model(model) != model
+            and self.router.low_confidence(tool_call)
+        )
+
+    def _run_single(
+        self,
+        job_id: str,
+        model: str,
+        key: str,
+        group: list[tuple[int, dict]],
+        builder: RequestBuilder,
+        validator: SchemaValidator,
+        escalate: str | None = None,
+    ) -> None:
+        """Extract one row, moving up the router's models while the answers are bad.
+
+        With ``escalate`` (the reason) the row starts on the next model up.
+        """
+        models = self.router.ladder(model) if self.router is not None else [model]
+        if len(models) == 1:
+            models = models * (VALIDATION_RETRIES + 1)
+        elif escalate is not None:
+            models = models[1:]
+            self._escalate(job_id, models[0], escalate)
+        reason = "invalid"
+        required = group[0][1]["tools"][0]["function"]["parameters"].get("required", [])
+
+        def on_fields(fields: dict) -> None:
+            self._show_partial(job_id, group, fields)
+
+        try:
+            for attempt, attempt_model in enumerate(models):
+                last = attempt == len(models) - 1
+                if attempt and attempt_model != models[attempt - 1]:
+                    self._escalate(job_id, attempt_model, reason)
+                text = str(group[0][1]["row"][group[0][1]["text_column"]])
+                message, baseline = self._complete(
+                    job_id, builder.single(text, attempt_model), on_fields=on_fields, required=required
+                )
+                try:
+                    tool_call = validator.validate(json.loads(message.tool_calls[0].function.arguments))
+                except (SchemaValidationError, json.JSONDecodeError) as e:
+                    self._record(job_id, invalid=1)
+                    if last:
+                        raise SchemaValidationError([f"Answer did not match the schema: {e}"]) from e
+                    reason = "invalid"
+                    continue
+                if self._unsure(attempt_model, tool_call):
+                    # Only while a stronger model is left, the last answer is kept however unsure
+                    self._record(job_id, low_confidence=1)
+                    reason = "low_confidence"
+                    continue
+                break
+            self._record(job_id, baseline_cost=baseline)
+            self._finish(job_id, key, group, tool_call)
+        except Exception as e:
+            # A failed row must not stall the rest of the run
+            self._fail(job_id, group, str(e))
+
+    def _escalate(self, job_id: str, model: str, reason: str) -> None:
+        self._record(job_id, escalated=1)
+        with self._stats_lock:
+            self.escalations[job_id][model] += 1
+        self.metrics.increment("data_rip_escalations_total", model=model, reason=reason)
+
+    def _run_pack(
+        self, job_id: str, model: str, pack: list, builder: RequestBuilder, validator: SchemaValidator
+    ) -> None:
+        row_ids = [str(group[0][0]) for _, group in pack]
+        texts = [str(group[0][1]["row"][group[0][1]["text_column"]]) for _, group in pack]
+        baseline = 0.0
+        try:
+            request = builder.packed(texts, row_ids, model)
+            message, baseline = self._complete(job_id, request, kind="pack", rows=len(texts))
+            results = parse_packed_results(message.tool_calls[0].function.arguments, row_ids)
+        except RequestCancelled:
+            for _, group in pack:
+                self._drop_partial(job_id, group)
+            return
+        except Exception:
+            results = {}
+        accepted = 0
+        for row_id, (key, group) in zip(row_ids, pack):
+            tool_call = None
+            if row_id in results:
+                try:
+                    tool_call = validator.validate(results[row_id])
+                except SchemaValidationError:
+                    self._record(job_id, invalid=1)
+            if tool_call is not None and self._unsure(model, tool_call):
+                # Unsure rows go straight to the stronger model
+                self._record(job_id, low_confidence=1)
+                self._run_single(job_id, model, key, group, builder, validator, escalate="low_confidence")
+            elif tool_call is not None:
+                accepted += 1
+                self._finish(job_id, key, group, tool_call)
+            else:
+                # Rows the packed answer got wrong are retried on their own
+                self._record(job_id, pack_fallbacks=1)
+                self._run_single(job_id, model, key, group, builder, validator)
+        if accepted:
+            self._record(job_id, baseline_cost=baseline * accepted / len(pack))
+
+    def _run_chunk(
+        self,
+        job_id: str,
+        model: str,
+        row: ChunkedRow,
+        chunk_index: int,
+        builder: RequestBuilder,
+        validator: SchemaValidator,
+    ) -> None:
+        # Chunks only hold part of the row, so only the merged result is checked against the schema
+        try:
+            message, baseline = self._complete(job_id, builder.single(row.chunks[chunk_index], model), kind="chunk")
+            self._record(job_id, baseline_cost=baseline)
+            last = row.add(chunk_index, json.loads(message.tool_calls[0].function.arguments))
+        except Exception as e:
+            last = row.add(chunk_index, error=f"Chunk {chunk_index + 1} of {len(row.chunks)}: {e}")
+        if not last:
+            return
+        try:
+            if row.errors:
+                raise RuntimeError(row.errors[0])
+            tools = row.group[0][1]["tools"]
+            merged = merge_results(tools[0]["function"]["parameters"], row.partials)
+            try:
+                tool_call = validator.validate(merged)
+            except SchemaValidationError as e:
+                self._record(job_id, invalid=1)
+                raise SchemaValidationError([f"Merged answer did not match the schema: {e}"]) from e
+            self._finish(job_id, row.key, row.group, tool_call)
+        except Exception as e:
+            self._fail(job_id, row.group, str(e))
+
+    def close(self) -> None:
+        """Stop the worker threads once their calls in flight are done, dropping the calls still queued.
+
+        The engine can't run jobs after that.
+        """
+        self._queue.stop()
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.join()
+
+    def _work(self) -> None:
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            _, (job_id, model, pack, builder, validator, chunk) = entry
+            try:
+                if chunk is not None:
+                    self._run_chunk(job_id, model, *chunk, builder, validator)
+                elif len(pack) > 1:
+                    self._run_pack(job_id, model, pack, builder, validator)
+                else:
+                    self._run_single(job_id, model, *pack[0], builder, validator)
+            finally:
+                with self._stats_lock:
+                    self._in_flight[job_id] -= 1
@@ -0,0 +1,137 @@
+"""Headless extraction of a whole file, for scripts, pipelines and cron.
+
+``extract_file`` runs the same engine as the Dash app (concurrency, result
+cache, rate limiting, checkpoints) and streams finished rows to an output file
+as they complete. Nothing here imports Dash.
+"""
+
+import time
+from collections.abc import Callable
+from typing import Any
+
+from data_rip.backends import Backend, make_backend
+from data_rip.cache import make_result_cache
+from data_rip.engine import DEFAULT_MODEL, ExtractionEngine
+from data_rip.ingest import file_digest, iter_rows
+from data_rip.jobs import RESULT_PAGE_SIZE, MemoryJobStore, SQLiteJobStore, job_key, make_job_store
+from data_rip.metrics import MetricsRecorder
+from data_rip.near_duplicates import NearDuplicateFinder, make_near_duplicate_finder
+from data_rip.schema import FUNCTION_NAME, build_tools, tools_schema
+from data_rip.scheduling import DEFAULT_DISPATCH
+from data_rip.writers import open_writer
+
+
+def extract_file(
+    input_path: str,
+    output_path: str,
+    id_column: str,
+    text_column: str,
+    schema: dict,
+    model: str = DEFAULT_MODEL,
+    client: Any = None,
+    concurrency: int | None = None,
+    pack_size: int = 1,
+    use_cache: bool = True,
+    escalate: bool = True,
+    near_duplicates: float | None = None,
+    dispatch: str | None = None,
+    store: MemoryJobStore | SQLiteJobStore | None = None,
+    on_progress: Callable[[dict], None] | None = None,
+    poll_seconds: float = 0.5,
+    backend: Backend | None = None,
+) -> dict:
+    """Extract ``schema`` from every row of ``input_path`` into ``output_path`` (CSV, JSONL or Parquet).
+
+    Returns the final progress counters, throughput, rows escalated to each
+    stronger model, texts answered by a near-duplicate and the rows that
+    failed. With ``escalate`` rows with bad answers are sent again to the
+    models in ``DATA_RIP_ESCALATION_MODELS``. Texts at least
+    ``near_duplicates`` alike (0 to 1, ``DATA_RIP_NEAR_DUPLICATES`` by
+    default) are extracted once per cluster. ``dispatch`` is the order rows
+    are sent in (``DATA_RIP_DISPATCH`` by default, see ``scheduling``).
+    Running the same file and schema again resumes from the job store's
+    checkpoint. Calls go to ``backend`` (``DATA_RIP_BACKEND`` by default),
+    with its concurrency unless ``concurrency`` is given.
+    """
+    backend = backend if backend is not None else make_backend()
+    # Only what is made here is closed here, a client or store passed in stays open
+    own_client, own_store = client is None, store is None
+    client = client if client is not None else backend.make_client()
+    engine = ExtractionEngine(
+        client,
+        store=store if store is not None else make_job_store(),
+        max_workers=concurrency or backend.concurrency,
+        cache=make_result_cache() if use_cache else None,
+        scheduler=backend.make_scheduler(client),
+        metrics=MetricsRecorder(priced=backend.priced),
+        prompt_cache_key=backend.prompt_cache_key,
+        router=backend.make_router() if escalate else None,
+        near_duplicates=NearDuplicateFinder(near_duplicates) if near_duplicates else make_near_duplicate_finder(),
+        dispatch=dispatch or DEFAULT_DISPATCH,
+        stream=backend.stream,
+    )
+    try:
+        return _run(
+            engine, input_path, output_path, id_column, text_column, schema, model, pack_size, on_progress, poll_seconds
+        )
+    finally:
+        engine.close()
+        if engine.cache is not None:
+            engine.cache.close()
+        if own_store:
+            engine.store.close()
+        if own_client:
+            client.close()
+
+
+def _run(
+    engine: ExtractionEngine,
+    input_path: str,
+    output_path: str,
+    id_column: str,
+    text_column: str,
+    schema: dict,
+    model: str,
+    pack_size: int,
+    on_progress: Callable[[dict], None] | None,
+    poll_seconds: float,
+) -> dict:
+    tools = build_tools(schema)
+    columns = list(dict.fromkeys([id_column, text_column]))
+    processing_queue = [
+        {"row": row, "text_column": text_column, "tools": tools, "function_name": FUNCTION_NAME}
+        for row in iter_rows(input_path, columns)
+    ]
+    job_id = engine.submit(
+        processing_queue,
+        model=model,
+        pack_size=pack_size,
+        job_id=job_key(file_digest(input_path), tools, model, id_column, text_column),
+        id_column=id_column,
+    )
+
+    fieldnames = columns + [key for key in schema["properties"] if key not in columns]
+    writer = open_writer(output_path, fieldnames, tools_schema(tools))
+    written = 0
+    try:
+        while True:
+            progress = engine.store.get_progress(job_id)
+            rows = engine.store.get_rows(job_id, offset=written, limit=RESULT_PAGE_SIZE)
+            writer.write(rows)
+            written += len(rows)
+            if on_progress is not None:
+                on_progress(progress)
+            if progress["done"] and written >= progress["completed"]:
+                break
+            if len(rows) < RESULT_PAGE_SIZE:
+                time.sleep(poll_seconds)
+    finally:
+        writer.close()
+
+    return {
+        **progress,
+        **engine.throughput(job_id),
+        "escalations": dict(engine.escalations[job_id]),
+        "near_duplicates": engine.stats[job_id]["near_duplicates"],
+        "errors": engine.store.get_errors(job_id),
+    }
@@ -0,0 +1,201 @@
+"""Spooling uploads to disk and reading them back in chunks.
+
+``dcc.Upload`` hands the server the whole file as a base64 data URL. Instead of
+decoding that into bytes, then a string, then a DataFrame and a list of
+records, the upload is decoded a block at a time into a CSV file on disk.
+Everything after that (column names, grid pages, the extraction queue) reads
+the spooled file in chunks and only the columns it needs. pandas is imported
+by the functions that read files, so importing this module stays cheap.
+
+The browser only gets the spooled file's upload id, which ``resolve_upload``
+turns back into a path inside ``DATA_RIP_UPLOAD_DIR``. Spooled files not used
+for ``DATA_RIP_UPLOAD_TTL_HOURS`` are deleted by ``prune_uploads``.
+"""
+
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import time
+import uuid
+from collections.abc import Iterator
+
+CHUNK_ROWS = 50_000
+# Multiple of 4 so every block of base64 text decodes on its own
+DECODE_BLOCK_CHARS = 4 * 1024 * 1024
+UPLOAD_TTL_HOURS = float(os.getenv("DATA_RIP_UPLOAD_TTL_HOURS", "24"))
+# Spooled files are named by a random hex id
+UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def _upload_dir(upload_dir: str | None) -> str:
+    return upload_dir or os.getenv("DATA_RIP_UPLOAD_DIR", tempfile.gettempdir())
+
+
+def spool_upload(contents: str, filename: str, upload_dir: str | None = None) -> str | None:
+    """Write a ``dcc.Upload`` data URL to a CSV file, returning its path or None for unsupported files."""
+    upload_dir = _upload_dir(upload_dir)
+    name = filename.lower()
+    if "csv" in name:
+        suffix = ".csv"
+    elif "xls" in name:
+        suffix = os.path.splitext(name)[1] or ".xlsx"
+    else:
+        return None
+
+    path = os.path.join(upload_dir, f"{uuid.uuid4().hex}{suffix}")
+    start = contents.index(",") + 1
+    with open(path, "wb") as f:
+        for offset in range(start, len(contents), DECODE_BLOCK_CHARS):
+            f.write(base64.b64decode(contents[offset : offset + DECODE_BLOCK_CHARS]))
+
+    if suffix != ".csv":
+        # Excel can't be read in chunks, convert it once so everything downstream reads CSV
+        import pandas as pd
+
+        csv_path = os.path.splitext(path)[0] + ".csv"
+        try:
+            pd.read_excel(path).to_csv(csv_path, index=False)
+        finally:
+            os.remove(path)
+        path = csv_path
+    return path
+
+
+def upload_id(path: str) -> str:
+    """The id of a spooled upload, the only part of it handed to the browser."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def resolve_upload(upload: str | None, upload_dir: str | None = None) -> str:
+    """Path of the spooled upload with id ``upload``, raising ``ValueError`` for anything else.
+
+    Using an upload keeps it from expiring for another ``UPLOAD_TTL_HOURS``.
+    """
+    if not isinstance(upload, str) or not UPLOAD_ID.fullmatch(upload):
+        raise ValueError(f"Not an upload id: {upload!r}")
+    path = os.path.join(_upload_dir(upload_dir), f"{upload}.csv")
+    if not os.path.isfile(path):
+        raise ValueError(f"Upload {upload} has expired or doesn't exist")
+    os.utime(path)
+    return path
+
+
+def prune_uploads(upload_dir: str | None = None, max_age_hours: float = UPLOAD_TTL_HOURS) -> int:
+    """Delete spooled uploads (and leftover Excel files) unused for ``max_age_hours``, returning how many."""
+    upload_dir = _upload_dir(upload_dir)
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for entry in os.scandir(upload_dir):
+        stem, suffix = os.path.splitext(entry.name)
+        if not (UPLOAD_ID.fullmatch(stem) and (suffix == ".csv" or suffix.startswith(".xls"))):
+            continue
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # Pruned by another process at the same time
+            continue
+    return removed
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a spooled upload, so re-uploading the same file resumes the same job."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def read_columns(path: str) -> list[str]:
+    import pandas as pd
+
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def count_rows(path: str) -> int:
+    """Number of records, counted by pandas since quoted text cells can span several lines."""
+    import pandas as pd
+
+    first_column = read_columns(path)[:1]
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=first_column, chunksize=CHUNK_ROWS))
+
+
+def read_page(
+    path: str, start_row: int, end_row: int, columns: list[str] | None = None, offset: int | None = None
+) -> list[dict]:
+    """Records ``start_row`` up to ``end_row``, for the input grid's server-side row model and worker ranges.
+
+    Without the byte ``offset`` of ``start_row`` (from ``range_offsets``) every
+    record before it is parsed and thrown away.
+    """
+    import pandas as pd
+
+    if offset is None:
+        page = pd.read_csv(path, usecols=columns, skiprows=range(1, start_row + 1), nrows=end_row - start_row)
+    else:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            page = pd.read_csv(f, header=None, names=read_columns(path), usecols=columns, nrows=end_row - start_row)
+    return (page[columns] if columns else page).to_dict("records")
+
+
+def _ends_quoted(line: bytes, quoted: bool) -> bool:
+    """Whether ``line`` ends inside a quoted cell, given whether it starts in one."""
+    i, field_start = 0, not quoted
+    while True:
+        if quoted:
+            i = line.find(b'"', i)
+            if i < 0:
+                return True
+            if line[i + 1 : i + 2] == b'"':
+                # Escaped quote
+                i += 2
+                continue
+            quoted, field_start, i = False, False, i + 1
+        elif field_start and line[i : i + 1] == b'"':
+            quoted, i = True, i + 1
+        else:
+            # Quotes inside an unquoted cell are plain text, like pandas reads them
+            i = line.find(b",", i)
+            if i < 0:
+                return False
+            field_start, i = True, i + 1
+
+
+def _record_ends(f) -> Iterator[int]:
+    """Byte offset after each record, the header first, with blank lines skipped like pandas does."""
+    quoted, offset = False, 0
+    for line in f:
+        offset += len(line)
+        if not quoted and not line.strip(b"\r\n"):
+            continue
+        if quoted or b'"' in line:
+            quoted = _ends_quoted(line, quoted)
+        if not quoted:
+            yield offset
+
+
+def range_offsets(path: str, range_rows: int) -> list[int]:
+    """Byte offset of every ``range_rows``-th record, so a worker can seek straight to the start of its range."""
+    offsets = []
+    with open(path, "rb") as f:
+        ends = _record_ends(f)
+        start = next(ends, 0)
+        for row, end in enumerate(ends):
+            if row % range_rows == 0:
+                offsets.append(start)
+            start = end
+    return offsets
+
+
+def iter_rows(path: str, columns: list[str], chunksize: int = CHUNK_ROWS) -> Iterator[dict]:
+    """Stream records holding only ``columns``, one chunk in memory at a time."""
+    import pandas as pd
+
+    if os.path.splitext(path)[1].lower() in (".xls", ".xlsx"):
+        # Excel files handed to the library directly can't be chunked, read just the columns
+        yield from pd.read_excel(path, usecols=columns)[columns].to_dict("records")
+        return
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+        yield from chunk[columns].to_dict("records")
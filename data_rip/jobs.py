@@ -0,0 +1,442 @@
+"""Server-side storage for extraction jobs.
+
+The browser only holds a job id and progress counters, everything else (the
+finished rows, failures and extracted keys) lives in a job store. Results are
+kept in the order rows finish so the output grid can fetch them a page at a
+time with a simple offset cursor.
+
+The SQLite store doubles as a checkpoint: every finished row is committed as
+it completes, keyed by job id and the row's ID column value. Job ids derived
+with ``job_key`` are stable for the same file and schema, so re-running a job
+after a restart skips the rows that are already done. It can be shared by
+several worker processes (see ``worker``), which report on row ranges of a
+job by row index. Bulk jobs keep the ids of their Batch API batches and
+which row each request came from, so a batch submitted before a restart is
+still merged once it finishes. ``prune`` deletes all but the most recently
+used jobs, so the store doesn't grow with every job ever run.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Collection, Iterator
+from typing import Any
+
+# Number of finished rows sent to the output grid per progress tick
+RESULT_PAGE_SIZE = 500
+DEFAULT_JOB_DB = os.path.join(os.path.expanduser("~"), ".cache", "data_rip", "jobs.db")
+
+
+def job_key(file_digest: str, tools: list[dict], model: str, id_column: str | None, text_column: str) -> str:
+    """Stable job id for extracting one file with one schema."""
+    payload = json.dumps(
+        {"file": file_digest, "tools": tools, "model": model, "id_column": id_column, "text_column": text_column},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def row_key(row: dict, index: int, id_column: str | None) -> str:
+    """Checkpoint key of a row: its ID column value, or its position without one."""
+    if id_column is not None and id_column in row:
+        return str(row[id_column])
+    return f"#{index}"
+
+
+class MemoryJobStore:
+    """Keeps jobs in process memory, they are lost when the server restarts."""
+
+    def __init__(self) -> None:
+        self._jobs: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create_job(
+        self, job_id: str, total_rows: int, model: str, id_column: str | None = None, schema: dict | None = None
+    ) -> None:
+        with self._lock:
+            # Recreated jobs count as the most recently used
+            self._jobs.pop(job_id, None)
+            self._jobs[job_id] = {
+                "total_rows": total_rows,
+                "model": model,
+                "id_column": id_column,
+                "schema": schema,
+                "extracted_keys": [],
+                "results": [],
+                "row_keys": {},
+                "errors": [],
+                "batches": [],
+            }
+
+    def has_job(self, job_id: str | None) -> bool:
+        return job_id in self._jobs
+
+    def add_result(self, job_id: str, index: int, row: dict, tool_call: dict) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            for key in tool_call:
+                if key not in job["extracted_keys"]:
+                    job["extracted_keys"].append(key)
+            key = row_key(row, index, job["id_column"])
+            if key not in job["row_keys"]:
+                job["results"].append((index, {**row, **tool_call}))
+                job["row_keys"][key] = index
+
+    def add_error(self, job_id: str, index: int, row: dict, error: str) -> None:
+        with self._lock:
+            self._jobs[job_id]["errors"].append({"index": index, "row": row, "error": error})
+
+    def get_progress(self, job_id: str | None) -> dict | None:
+        if job_id not in self._jobs:
+            return None
+        with self._lock:
+            job = self._jobs[job_id]
+            return _progress(
+                job["total_rows"], len(job["results"]), len(job["errors"]), job["extracted_keys"], job["id_column"]
+            )
+
+    def get_rows(
+        self, job_id: str, offset: int = 0, limit: int = RESULT_PAGE_SIZE, index_field: str | None = None
+    ) -> list[dict]:
+        """Finished rows in completion order, starting at ``offset``.
+
+        With ``index_field`` each row also holds its position in the input under that key.
+        """
+        with self._lock:
+            results = self._jobs[job_id]["results"][offset : offset + limit]
+        return [{**row, index_field: index} if index_field else row for index, row in results]
+
+    def iter_results(self, job_id: str, page_size: int = RESULT_PAGE_SIZE) -> Iterator[list[dict]]:
+        """Every finished row in completion order, a page at a time."""
+        offset = 0
+        while page := self.get_rows(job_id, offset, page_size):
+            yield page
+            offset += len(page)
+
+    def get_schema(self, job_id: str) -> dict | None:
+        """JSON schema of the job's extracted fields, if it was given when the job was created."""
+        with self._lock:
+            return self._jobs[job_id]["schema"]
+
+    def get_errors(self, job_id: str) -> list[dict]:
+        with self._lock:
+            return list(self._jobs[job_id]["errors"])
+
+    def completed_row_keys(self, job_id: str, start: int | None = None, end: int | None = None) -> set[str]:
+        """Checkpoint keys of finished rows, only those indexed ``start`` up to ``end`` when given."""
+        with self._lock:
+            return {key for key, index in self._jobs[job_id]["row_keys"].items() if _in_range(index, start, end)}
+
+    def count_finished(self, job_id: str, start: int, end: int) -> int:
+        """Rows indexed ``start`` up to ``end`` that have completed or failed."""
+        with self._lock:
+            job = self._jobs[job_id]
+            completed = sum(_in_range(index, start, end) for index in job["row_keys"].values())
+            return completed + sum(_in_range(error["index"], start, end) for error in job["errors"])
+
+    def clear_errors(self, job_id: str, start: int | None = None, end: int | None = None) -> None:
+        """Forget failed rows (indexed ``start`` up to ``end`` when given) so a resumed run retries them."""
+        with self._lock:
+            job = self._jobs[job_id]
+            job["errors"] = [error for error in job["errors"] if not _in_range(error["index"], start, end)]
+
+    def close(self) -> None:
+        """Nothing to release, for the same interface as the SQLite store."""
+
+    def prune(self, keep_latest: int, keep: Collection[str] = ()) -> list[str]:
+        """Delete all but the ``keep_latest`` most recently used jobs, returning their ids oldest first.
+
+        The jobs in ``keep`` are marked as used now and never deleted.
+        """
+        with self._lock:
+            for job_id in keep:
+                if job_id in self._jobs:
+                    self._jobs[job_id] = self._jobs.pop(job_id)
+            excess = max(len(self._jobs) - keep_latest, 0)
+            old = [job_id for job_id in list(self._jobs)[:excess] if job_id not in keep]
+            for job_id in old:
+                del self._jobs[job_id]
+        return old
+
+    def add_batch(self, job_id: str, batch_id: str, status: str, rows: dict[str, tuple[int, dict]]) -> None:
+        """Record a Batch API batch of the job, with the row index and row of each request's ``custom_id``."""
+        with self._lock:
+            self._jobs[job_id]["batches"].append({"batch_id": batch_id, "status": status, "rows": dict(rows)})
+
+    def get_batches(self, job_id: str) -> list[dict]:
+        """The job's batches in the order they were added, each with its ``batch_id``, ``status`` and ``rows``."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return [{**batch, "rows": dict(batch["rows"])} for batch in job["batches"]] if job else []
+
+    def set_batch_status(self, job_id: str, batch_id: str, status: str) -> None:
+        with self._lock:
+            for batch in self._jobs[job_id]["batches"]:
+                if batch["batch_id"] == batch_id:
+                    batch["status"] = status
+
+
+class SQLiteJobStore:
+    """Persists jobs to a SQLite database so finished rows survive a restart."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Worker processes share the file, so wait on each other's writes rather than failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            # WAL keeps a commit per finished row cheap while staying durable across restarts
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    total_rows INTEGER NOT NULL,
+                    model TEXT NOT NULL,
+                    id_column TEXT,
+                    extracted_keys TEXT NOT NULL DEFAULT '[]',
+                    schema TEXT,
+                    last_used REAL
+                );
+                CREATE TABLE IF NOT EXISTS results (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    row_index INTEGER NOT NULL,
+                    row_key TEXT NOT NULL,
+                    row TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS results_job ON results (job_id, seq);
+                CREATE UNIQUE INDEX IF NOT EXISTS results_row_key ON results (job_id, row_key);
+                CREATE INDEX IF NOT EXISTS results_row_index ON results (job_id, row_index);
+                CREATE TABLE IF NOT EXISTS errors (
+                    job_id TEXT NOT NULL,
+                    row_index INTEGER NOT NULL,
+                    row TEXT NOT NULL,
+                    error TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS errors_row_index ON errors (job_id, row_index);
+                CREATE TABLE IF NOT EXISTS batches (
+                    job_id TEXT NOT NULL,
+                    batch_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    rows TEXT NOT NULL,
+                    PRIMARY KEY (job_id, batch_id)
+                );
+                """
+            )
+            # Databases from before job schemas were kept
+            columns = {name for _, name, *_ in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "schema" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN schema TEXT")
+            # and from before old jobs were pruned
+            if "last_used" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN last_used REAL")
+
+    def create_job(
+        self, job_id: str, total_rows: int, model: str, id_column: str | None = None, schema: dict | None = None
+    ) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, total_rows, model, id_column, schema, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, total_rows, model, id_column, json.dumps(schema) if schema is not None else None, time.time()),
+            )
+
+    def has_job(self, job_id: str | None) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone() is not None
+
+    def add_result(self, job_id: str, index: int, row: dict, tool_call: dict) -> None:
+        with self._lock, self._conn:
+            keys, id_column = self._conn.execute(
+                "SELECT extracted_keys, id_column FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            keys = json.loads(keys)
+            new_keys = [key for key in tool_call if key not in keys]
+            if new_keys:
+                self._conn.execute(
+                    "UPDATE jobs SET extracted_keys = ? WHERE job_id = ?", (json.dumps(keys + new_keys), job_id)
+                )
+            # A row already finished keeps its place in the completion order, as in the memory store
+            self._conn.execute(
+                "INSERT OR IGNORE INTO results (job_id, row_index, row_key, row) VALUES (?, ?, ?, ?)",
+                (job_id, index, row_key(row, index, id_column), json.dumps({**row, **tool_call})),
+            )
+
+    def add_error(self, job_id: str, index: int, row: dict, error: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO errors (job_id, row_index, row, error) VALUES (?, ?, ?, ?)",
+                (job_id, index, json.dumps(row), error),
+            )
+
+    def get_progress(self, job_id: str | None) -> dict | None:
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT total_rows, extracted_keys, id_column FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            (completed,) = self._conn.execute("SELECT COUNT(*) FROM results WHERE job_id = ?", (job_id,)).fetchone()
+            (failed,) = self._conn.execute("SELECT COUNT(*) FROM errors WHERE job_id = ?", (job_id,)).fetchone()
+        return _progress(job[0], completed, failed, json.loads(job[1]), job[2])
+
+    def get_rows(
+        self, job_id: str, offset: int = 0, limit: int = RESULT_PAGE_SIZE, index_field: str | None = None
+    ) -> list[dict]:
+        """Finished rows in completion order, starting at ``offset``.
+
+        With ``index_field`` each row also holds its position in the input under that key.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row_index, row FROM results WHERE job_id = ? ORDER BY seq LIMIT ? OFFSET ?",
+                (job_id, limit, offset),
+            ).fetchall()
+        return [{**json.loads(row), index_field: index} if index_field else json.loads(row) for index, row in rows]
+
+    def iter_results(self, job_id: str, page_size: int = RESULT_PAGE_SIZE) -> Iterator[list[dict]]:
+        """Every finished row in completion order, a page at a time.
+
+        Pages continue from the last row seen rather than an offset, so reading
+        millions of rows doesn't rescan the ones already read.
+        """
+        last_seq = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, row FROM results WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (job_id, last_seq, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            last_seq = rows[-1][0]
+            yield [json.loads(row) for _, row in rows]
+
+    def get_schema(self, job_id: str) -> dict | None:
+        """JSON schema of the job's extracted fields, if it was given when the job was created."""
+        with self._lock:
+            found = self._conn.execute("SELECT schema FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(found[0]) if found and found[0] else None
+
+    def get_errors(self, job_id: str) -> list[dict]:
+        with self._lock:
+            errors = self._conn.execute(
+                "SELECT row_index, row, error FROM errors WHERE job_id = ? ORDER BY rowid", (job_id,)
+            ).fetchall()
+        return [{"index": index, "row": json.loads(row), "error": error} for index, row, error in errors]
+
+    def completed_row_keys(self, job_id: str, start: int | None = None, end: int | None = None) -> set[str]:
+        """Checkpoint keys of finished rows, only those indexed ``start`` up to ``end`` when given."""
+        where, params = _range_filter(job_id, start, end)
+        with self._lock:
+            return {key for (key,) in self._conn.execute(f"SELECT row_key FROM results WHERE {where}", params)}
+
+    def count_finished(self, job_id: str, start: int, end: int) -> int:
+        """Rows indexed ``start`` up to ``end`` that have completed or failed."""
+        where, params = _range_filter(job_id, start, end)
+        with self._lock:
+            (completed,) = self._conn.execute(f"SELECT COUNT(*) FROM results WHERE {where}", params).fetchone()
+            (failed,) = self._conn.execute(f"SELECT COUNT(*) FROM errors WHERE {where}", params).fetchone()
+        return completed + failed
+
+    def clear_errors(self, job_id: str, start: int | None = None, end: int | None = None) -> None:
+        """Forget failed rows (indexed ``start`` up to ``end`` when given) so a resumed run retries them."""
+        where, params = _range_filter(job_id, start, end)
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM errors WHERE {where}", params)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def prune(self, keep_latest: int, keep: Collection[str] = ()) -> list[str]:
+        """Delete all but the ``keep_latest`` most recently used jobs and their rows, returning their ids oldest first.
+
+        The jobs in ``keep`` are marked as used now and never deleted. Jobs are
+        marked in the shared file, so a job one worker process is running isn't
+        pruned by another.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE jobs SET last_used = ? WHERE job_id = ?", [(now, job_id) for job_id in keep])
+            # Jobs from before last_used was kept sort last
+            old = [
+                job_id
+                for (job_id,) in self._conn.execute(
+                    "SELECT job_id FROM jobs ORDER BY last_used DESC LIMIT -1 OFFSET ?", (keep_latest,)
+                )
+                if job_id not in keep
+            ][::-1]
+            for table in ("results", "errors", "batches", "jobs"):
+                self._conn.executemany(f"DELETE FROM {table} WHERE job_id = ?", [(job_id,) for job_id in old])
+        return old
+
+    def add_batch(self, job_id: str, batch_id: str, status: str, rows: dict[str, tuple[int, dict]]) -> None:
+        """Record a Batch API batch of the job, with the row index and row of each request's ``custom_id``."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO batches (job_id, batch_id, status, rows) VALUES (?, ?, ?, ?)",
+                (job_id, batch_id, status, json.dumps(rows)),
+            )
+
+    def get_batches(self, job_id: str) -> list[dict]:
+        """The job's batches in the order they were added, each with its ``batch_id``, ``status`` and ``rows``."""
+        with self._lock:
+            batches = self._conn.execute(
+                "SELECT batch_id, status, rows FROM batches WHERE job_id = ? ORDER BY rowid", (job_id,)
+            ).fetchall()
+        return [
+            {
+                "batch_id": batch_id,
+                "status": status,
+                "rows": {custom_id: (index, row) for custom_id, (index, row) in json.loads(rows).items()},
+            }
+            for batch_id, status, rows in batches
+        ]
+
+    def set_batch_status(self, job_id: str, batch_id: str, status: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE batches SET status = ? WHERE job_id = ? AND batch_id = ?", (status, job_id, batch_id)
+            )
+
+
+def _in_range(index: int, start: int | None, end: int | None) -> bool:
+    return (start is None or index >= start) and (end is None or index < end)
+
+
+def _range_filter(job_id: str, start: int | None, end: int | None) -> tuple[str, tuple]:
+    where, params = "job_id = ?", (job_id,)
+    if start is not None:
+        where, params = f"{where} AND row_index >= ?", (*params, start)
+    if end is not None:
+        where, params = f"{where} AND row_index < ?", (*params, end)
+    return where, params
+
+
+def _progress(
+    total_rows: int, completed: int, failed: int, extracted_keys: list[str], id_column: str | None
+) -> dict:
+    return {
+        "total_rows": total_rows,
+        "completed": completed,
+        "failed": failed,
+        "extracted_keys": extracted_keys,
+        "id_column": id_column,
+        "done": completed + failed >= total_rows,
+    }
+
+
+def make_job_store(path: str | None = None) -> MemoryJobStore | SQLiteJobStore:
+    """SQLite store at ``DATA_RIP_JOB_DB`` (or ``path``), kept in memory when that is set to ``memory``."""
+    path = path or os.getenv("DATA_RIP_JOB_DB", DEFAULT_JOB_DB)
+    if path.lower() == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore(path)
@@ -0,0 +1,179 @@
+"""Per-call instrumentation of extraction runs.
+
+Every chat completion the engine sends is recorded with its model, latency,
+token usage, retries and estimated cost. The most recent calls of each job
+are kept for the JSON trace export, and process-wide totals are rendered in
+the Prometheus text format for the app's ``/metrics`` endpoint.
+"""
+
+import bisect
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TRACE_LIMIT = int(os.getenv("DATA_RIP_TRACE_LIMIT", "10000"))
+# USD per million prompt, completion and cached prompt tokens, matched by the longest model name prefix
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+}
+METRICS = {
+    "data_rip_requests_total": ("counter", "Chat completion calls by model and outcome."),
+    "data_rip_retries_total": ("counter", "Retried attempts of chat completion calls."),
+    "data_rip_tokens_total": ("counter", "Tokens used by model and kind, cached being the prompt tokens cached."),
+    "data_rip_cost_dollars_total": ("counter", "Estimated spend in USD by model."),
+    "data_rip_cache_hits_total": ("counter", "Rows served from the result cache."),
+    "data_rip_rows_total": ("counter", "Rows finished by outcome."),
+    "data_rip_escalations_total": ("counter", "Rows escalated to a stronger model, by model and reason."),
+    "data_rip_request_latency_seconds": ("histogram", "Chat completion latency with retries and rate limit waits."),
+    "data_rip_first_field_seconds": ("histogram", "Time until the first field of a streamed answer closed."),
+    "data_rip_callback_seconds": ("histogram", "Time spent in Dash callbacks, by callback."),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: float, completion_tokens: float, cached_tokens: float = 0) -> float:
+    """Estimated USD for the tokens of one call, zero for models without a known price.
+
+    ``cached_tokens`` are the part of ``prompt_tokens`` served from the prompt cache.
+    """
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price, cached_price = MODEL_PRICES[max(matches, key=len)]
+    prompt_cost = (prompt_tokens - cached_tokens) * prompt_price + cached_tokens * cached_price
+    return (prompt_cost + completion_tokens * completion_price) / 1_000_000
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class MetricsRecorder:
+    """Thread safe store of call records per job and metric totals for the process.
+
+    Calls cost nothing when not ``priced``, as on a local model server.
+    """
+
+    def __init__(self, trace_limit: int = TRACE_LIMIT, priced: bool = True):
+        self.trace_limit = trace_limit
+        self.priced = priced
+        self._counters: dict[tuple[str, tuple], float] = defaultdict(float)
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+        self._traces: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    def record_call(
+        self,
+        job_id: str,
+        model: str,
+        kind: str,
+        latency: float,
+        prompt_tokens: float = 0,
+        completion_tokens: float = 0,
+        retries: int = 0,
+        rows: int = 1,
+        cached_tokens: float = 0,
+        error: str | None = None,
+        first_field: float | None = None,
+    ) -> dict:
+        """Record one chat completion call and return its trace record.
+
+        ``first_field`` is the time until a streamed call's first field closed.
+        """
+        record = {
+            "timestamp": time.time(),
+            "model": model,
+            "kind": kind,
+            "rows": rows,
+            "latency": latency,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "retries": retries,
+            "first_field": first_field,
+            "cost": estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens) if self.priced else 0.0,
+            "error": error,
+        }
+        with self._lock:
+            if job_id not in self._traces:
+                self._traces[job_id] = deque(maxlen=self.trace_limit)
+            self._traces[job_id].append(record)
+        self.increment("data_rip_requests_total", model=model, status="error" if error else "ok")
+        if retries:
+            self.increment("data_rip_retries_total", retries, model=model)
+        self.increment("data_rip_tokens_total", prompt_tokens, model=model, type="prompt")
+        self.increment("data_rip_tokens_total", cached_tokens, model=model, type="cached")
+        self.increment("data_rip_tokens_total", completion_tokens, model=model, type="completion")
+        self.increment("data_rip_cost_dollars_total", record["cost"], model=model)
+        self.observe("data_rip_request_latency_seconds", latency, model=model)
+        if first_field is not None:
+            self.observe("data_rip_first_field_seconds", first_field, model=model)
+        return record
+
+    def trace(self, job_id: str) -> list[dict]:
+        """The most recent ``trace_limit`` calls of a job, oldest first."""
+        with self._lock:
+            return list(self._traces.get(job_id, ()))
+
+    def forget(self, job_id: str) -> None:
+        """Drop the recorded calls of a job, the process totals keep counting them."""
+        with self._lock:
+            self._traces.pop(job_id, None)
+
+    def render_prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value:g}")
+            for (metric, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels(labels, le=f'{bound:g}')} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {total:g}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,132 @@
+"""Grouping near-duplicate row texts so each group is extracted once.
+
+Exports are full of templated texts and boilerplate that differ in a few
+characters, which exact deduplication and the result cache miss. Texts are
+normalized (case and whitespace), cut into character shingles and summarized
+by MinHash signatures, computed with numpy over a whole batch of texts at
+once. Locality sensitive hashing over bands of the signatures finds the
+candidates for each text without comparing every pair.
+
+A candidate only joins a cluster when its exact shingle similarity to the
+cluster's representative is at least ``min_similarity``. Any row that isn't
+that close is extracted on its own, and the rows of a cluster get their
+representative's answer. Clustering is off by default, set
+``DATA_RIP_NEAR_DUPLICATES`` to the minimum similarity (0.9 is a good start)
+to turn it on.
+"""
+
+import os
+from collections import deque
+from typing import Any
+
+DEFAULT_SHINGLE_SIZE = 5
+DEFAULT_PERMUTATIONS = 64
+DEFAULT_BANDS = 16
+# Below the minimum similarity a signature estimate may still be a match, a bit over twice the estimate's standard
+# error with 64 permutations
+ESTIMATE_MARGIN = 0.1
+# Representatives kept per LSH bucket. Texts that are all a little too far apart from each other (numbered templates
+# under a high minimum similarity) would otherwise fill one bucket and compare every row with all of them. A row only
+# close to an older representative becomes a representative itself, that costs an extraction, never a wrong answer
+BUCKET_SIZE = 32
+# Candidates compared exactly per row, the most alike by their signatures first
+EXACT_CHECKS = 4
+# Shingles hashed per numpy batch, bounding memory at about 8 bytes times this times the permutations
+SIGNATURE_BATCH_SHINGLES = 65_536
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class NearDuplicateFinder:
+    """Clusters texts whose shingle sets are at least ``min_similarity`` alike (Jaccard similarity)."""
+
+    def __init__(
+        self,
+        min_similarity: float = 0.9,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+        permutations: int = DEFAULT_PERMUTATIONS,
+        bands: int = DEFAULT_BANDS,
+    ):
+        if permutations % bands:
+            raise ValueError(f"{permutations} permutations can't be split into {bands} bands")
+        self.min_similarity = min_similarity
+        self.shingle_size = shingle_size
+        self.permutations = permutations
+        self.bands = bands
+
+    def shingles(self, text: str) -> Any:
+        """Sorted, distinct hashes of the normalized text's character shingles."""
+        import numpy as np
+
+        data = np.frombuffer(normalize(text).encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        if len(data) < self.shingle_size:
+            # Too short to cut, the whole text is its only shingle
+            data = np.pad(data, (0, self.shingle_size - len(data)))
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.shingle_size)
+        weights = np.uint64(257) ** np.arange(self.shingle_size, dtype=np.uint64)
+        return np.unique(windows @ weights)
+
+    def signatures(self, shingle_sets: list[Any]) -> Any:
+        """MinHash signature of every shingle set, one row per set."""
+        import numpy as np
+
+        rng = np.random.default_rng(self.permutations)
+        # Multiply-shift hashing, the products wrap around at 2**64 and the top 32 bits are kept
+        multipliers = rng.integers(1, 2**63, self.permutations, dtype=np.uint64)[:, None] * np.uint64(2) + np.uint64(1)
+        offsets = rng.integers(0, 2**63, self.permutations, dtype=np.uint64)[:, None]
+        signatures = np.empty((len(shingle_sets), self.permutations), dtype=np.uint64)
+        start = 0
+        while start < len(shingle_sets):
+            end, size = start, 0
+            while end < len(shingle_sets) and (end == start or size + len(shingle_sets[end]) <= SIGNATURE_BATCH_SHINGLES):
+                size += len(shingle_sets[end])
+                end += 1
+            batch = shingle_sets[start:end]
+            hashed = (multipliers * np.concatenate(batch)[None, :] + offsets) >> np.uint64(32)
+            bounds = np.cumsum([0] + [len(shingles) for shingles in batch[:-1]])
+            signatures[start:end] = np.minimum.reduceat(hashed, bounds, axis=1).T
+            start = end
+        return signatures
+
+    def representatives(self, texts: list[str]) -> list[int]:
+        """For every text the position of the text it is extracted with, its own for a representative.
+
+        Texts are taken in order and each joins the first earlier
+        representative close enough to it, so a representative always comes
+        before the rows it stands for.
+        """
+        import numpy as np
+
+        shingle_sets = [self.shingles(text) for text in texts]
+        signatures = self.signatures(shingle_sets)
+        rows = self.permutations // self.bands
+        representatives = list(range(len(texts)))
+        buckets: dict[tuple[int, bytes], deque[int]] = {}
+        for index, signature in enumerate(signatures):
+            keys = [(band, signature[band * rows : (band + 1) * rows].tobytes()) for band in range(self.bands)]
+            candidates = np.unique([candidate for key in keys for candidate in buckets.get(key, ())]).astype(np.int64)
+            # Signatures estimate the similarity of every candidate at once, only likely matches are checked exactly,
+            # most alike first
+            estimates = (signatures[candidates] == signature).mean(axis=1)
+            likely = estimates >= self.min_similarity - ESTIMATE_MARGIN
+            for candidate in candidates[likely][np.argsort(-estimates[likely], kind="stable")][:EXACT_CHECKS]:
+                shared = len(np.intersect1d(shingle_sets[index], shingle_sets[candidate], assume_unique=True))
+                union = len(shingle_sets[index]) + len(shingle_sets[candidate]) - shared
+                if shared / union >= self.min_similarity:
+                    representatives[index] = int(candidate)
+                    break
+            else:
+                # Only representatives are bucketed, so every row is compared against them alone
+                for key in keys:
+                    buckets.setdefault(key, deque(maxlen=BUCKET_SIZE)).append(index)
+        return representatives
+
+
+def make_near_duplicate_finder() -> NearDuplicateFinder | None:
+    """Finder for the minimum similarity in ``DATA_RIP_NEAR_DUPLICATES``, None when unset or ``off``."""
+    value = os.getenv("DATA_RIP_NEAR_DUPLICATES", "off")
+    if value.lower() == "off":
+        return None
+    return NearDuplicateFinder(float(value))
@@ -0,0 +1,97 @@
+"""Preview runs: extract a sample of rows first and project the full run from it.
+
+A preview extracts a stratified sample of the job's rows at full concurrency,
+under the full job's id. It measures latency, tokens and cost per row on the
+job's real schema and model, before the whole file is committed to. The
+sampled rows are checkpointed in the job store like any other, so the full
+run resumes from them instead of sending them again.
+"""
+
+import os
+import random
+
+from data_rip.engine import ExtractionEngine
+
+DEFAULT_PREVIEW_ROWS = int(os.getenv("DATA_RIP_PREVIEW_ROWS", "50"))
+# Text length bands the sample is spread over
+LENGTH_BANDS = 5
+
+
+def stratified_sample(texts: list[str], size: int = DEFAULT_PREVIEW_ROWS, bands: int = LENGTH_BANDS) -> list[int]:
+    """Positions of ``size`` texts drawn evenly from ``bands`` bands of text length.
+
+    The bands hold equal numbers of texts, from shortest to longest, and each
+    gives the same share of the sample. Short and long rows are both covered
+    and the sample's per-row averages stand for the whole file. The draw is
+    seeded, so previewing the same file again picks the same rows.
+    """
+    if size >= len(texts):
+        return list(range(len(texts)))
+    order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+    rng = random.Random(len(texts))
+    sample = []
+    for band in range(bands):
+        members = order[band * len(order) // bands : (band + 1) * len(order) // bands]
+        count = (band + 1) * size // bands - band * size // bands
+        sample.extend(rng.sample(members, min(count, len(members))))
+    return sorted(sample)
+
+
+def project_run(engine: ExtractionEngine, job_id: str, sample_rows: int) -> dict[str, float | str | None] | None:
+    """Per-row figures measured by a finished preview and the projected time and cost of the rest of the job.
+
+    The time is bounded by whichever is slowest: the calls at the engine's
+    concurrency and measured latency, or the scheduler's requests and tokens
+    per minute. Rows served from the result cache are counted in
+    ``cache_hits`` rather than averaged in, and the rest of the job is
+    projected as if none of it were cached. Once the engine has forgotten the
+    job (see ``job_history``) only the counts in the job store are left, and
+    the measured and projected figures are None. None when the preview didn't
+    extract any rows itself.
+    """
+    progress = engine.store.get_progress(job_id)
+    if progress is None:
+        return None
+    remaining = progress["total_rows"] - progress["completed"]
+    stats = engine.stats.get(job_id)
+    if stats is None:
+        rows = min(progress["completed"] + progress["failed"], sample_rows)
+        if rows <= 0:
+            return None
+        return {
+            "rows": rows,
+            "cache_hits": None,
+            "failed_share": progress["failed"] / rows,
+            "mean_latency": None,
+            "tokens_per_row": None,
+            "cost_per_row": None,
+            "remaining_rows": remaining,
+            "projected_seconds": None,
+            "projected_cost": None,
+            "limited_by": None,
+        }
+    # Rows already checkpointed by an earlier run or found in the cache say nothing about this one's calls
+    rows = sample_rows - stats["resumed"] - stats["cache_hits"]
+    if rows <= 0:
+        return None
+    mean_latency = stats["latency_seconds"] / max(stats["requests"], 1)
+    requests = stats["requests"] / rows * remaining
+    tokens_per_row = (stats["prompt_tokens"] + stats["completion_tokens"]) / rows
+    tokens = tokens_per_row * remaining
+    bounds = {"concurrency": requests * mean_latency / engine.max_workers}
+    if engine.scheduler is not None:
+        bounds["requests per minute"] = requests / engine.scheduler.requests.limit * 60
+        bounds["tokens per minute"] = tokens / engine.scheduler.tokens.limit * 60
+    limit = max(bounds, key=bounds.__getitem__)
+    return {
+        "rows": rows,
+        "cache_hits": stats["cache_hits"],
+        "failed_share": progress["failed"] / rows,
+        "mean_latency": mean_latency,
+        "tokens_per_row": tokens_per_row,
+        "cost_per_row": stats["cost"] / rows,
+        "remaining_rows": remaining,
+        "projected_seconds": bounds[limit],
+        "projected_cost": stats["cost"] / rows * remaining,
+        "limited_by": limit,
+    }
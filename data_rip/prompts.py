@@ -22,7 +22,7 @@ FUNCTION_CALLING_FEW_SHOTS_DICT = [
     },
     {
         "role": "assistant",
-        "content": "{'properties': {'id': {'title': 'Id', 'type': 'integer'}, 'name': {'default': 'John Doe', 'title': 'Name', 'type': 'string'}, 'signup_ts': {'default': None, 'format': 'date-time', 'title': 'Signup Ts', 'type': 'string'}, 'friends': {'default': [], 'items': {'type': 'integer'}, 'title': 'Friends', 'type': 'array'}}, 'required': ['id'], 'title': 'User', 'type': 'object'}}",
+        "content": "{'properties': {'id': {'title': 'Id', 'type': 'integer'}, 'name': {'default': 'John Doe', 'title': 'Name', 'type': 'string'}, 'signup_ts': {'default': None, 'format': 'date-time', 'title': 'Signup Ts', 'type': 'string'}, 'friends': {'default': [], 'items': {'type': 'integer'}, 'title': 'Friends', 'type': 'array'}}, 'required': ['id'], 'title': 'User', 'type': 'object'}",
     },
     {
         "role": "user",
@@ -33,3 +33,7 @@ FUNCTION_CALLING_FEW_SHOTS_DICT = [
         "content": "{'properties': {'user_name': {'title': 'User Name', 'type': 'string'}, 'phone_number': {'default': None, 'title': 'Phone Number', 'type': 'string'}, 'satisfaction_score': {'title': 'Satisfaction Score', 'type': 'integer'}, 'criticisms': {'items': {'type': 'string'}, 'title': 'Criticisms', 'type': 'array'}}, 'required': ['user_name', 'satisfaction_score', 'criticisms'], 'title': 'SurveyResponse', 'type': 'object'}",
     },
 ]
+
+
+# System prompt for the per-row extraction calls
+EXTRACTION_SYS_PROMPT = "Only provide results you want to extract"
@@ -0,0 +1,207 @@
+"""Shared rate limiting and retries for OpenAI calls.
+
+Every chat completion goes through one ``RequestScheduler``. It holds token
+buckets for requests per minute and tokens per minute, tightens them from the
+``x-ratelimit-*`` response headers, and retries rate limits, timeouts and
+transient server errors with jittered exponential backoff. A request that
+still fails after ``max_retries`` is raised to the caller, which records the
+row in the job's dead-letter list.
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+from data_rip.packing import estimate_tokens
+
+DEFAULT_RPM = int(os.getenv("DATA_RIP_RPM", "500"))
+DEFAULT_TPM = int(os.getenv("DATA_RIP_TPM", "200000"))
+DEFAULT_MAX_RETRIES = int(os.getenv("DATA_RIP_MAX_RETRIES", "5"))
+# Completion tokens budgeted per request before the real usage is known
+COMPLETION_TOKEN_ESTIMATE = 256
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+TOOLS_ESTIMATES_KEPT = 64
+
+
+class RequestCancelled(Exception):
+    """The call's job was cancelled before the call was sent or before its answer was used."""
+
+
+class TokenBucket:
+    """Allows ``limit`` units per minute, refilled continuously."""
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.level = limit
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.limit, self.level + (now - self._updated) * self.limit / 60)
+        self._updated = now
+
+    def acquire(self, amount: float = 1, cancelled: Callable[[], bool] | None = None) -> None:
+        """Block until ``amount`` units are available, then take them.
+
+        Raises ``RequestCancelled`` once ``cancelled`` returns True while waiting.
+        """
+        # A request bigger than the whole bucket only has to wait for a full bucket
+        amount = min(amount, self.limit)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) * 60 / self.limit
+            if cancelled is not None and cancelled():
+                raise RequestCancelled("Job cancelled")
+            time.sleep(min(wait, 1.0))
+
+    def update(self, limit: float | None = None, remaining: float | None = None) -> None:
+        """Follow the limit and remaining budget reported by the API."""
+        with self._lock:
+            self._refill()
+            if limit:
+                self.limit = limit
+            if remaining is not None:
+                self.level = min(self.level, remaining)
+
+
+def parse_reset(value: str) -> float:
+    """Seconds in a reset header such as ``1s``, ``6m0s`` or ``20ms``."""
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(number) * units[unit] for number, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value))
+
+
+def is_retryable(error: Exception) -> bool:
+    # Imported on the first failed call, so importing the scheduler doesn't load the openai package
+    import openai
+
+    if isinstance(error, openai.APIConnectionError | openai.APITimeoutError):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and (status_code in RETRYABLE_STATUS_CODES or status_code >= 500)
+
+
+def estimate_request_tokens(request: dict, tools_tokens: int | None = None) -> int:
+    """Prompt plus completion tokens a request is expected to use, for the tokens per minute bucket.
+
+    ``tools_tokens`` is the estimate for ``request["tools"]`` when it is already known.
+    """
+    text = "".join(str(message.get("content", "")) for message in request.get("messages", []))
+    if tools_tokens is None:
+        tools_tokens = estimate_tokens(json.dumps(request["tools"])) if request.get("tools") else 0
+    return estimate_tokens(text) + tools_tokens + COMPLETION_TOKEN_ESTIMATE
+
+
+class RequestScheduler:
+    """Rate limited, retrying front for ``client.chat.completions.create``."""
+
+    def __init__(
+        self,
+        client: Any,
+        requests_per_minute: int = DEFAULT_RPM,
+        tokens_per_minute: int = DEFAULT_TPM,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        # Retries are handled here, so the client's own retry loop is switched off
+        self.client = client.with_options(max_retries=0) if hasattr(client, "with_options") else client
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Token estimates of the tools lists in use, so a job's shared tools are serialized once rather than per row.
+        # The list is kept with its estimate so its id can't be reused by another object.
+        self._tools_tokens: OrderedDict[int, tuple[list, int]] = OrderedDict()
+        self._tools_lock = threading.Lock()
+
+    def create(
+        self,
+        on_retry: Callable[[], None] | None = None,
+        cancelled: Callable[[], bool] | None = None,
+        **request: Any,
+    ) -> Any:
+        """Send a chat completion, waiting for rate limit budget and retrying transient errors.
+
+        Once ``cancelled`` returns True the call is given up on before it is
+        sent (again), raising ``RequestCancelled``.
+        """
+        attempt = 0
+        while True:
+            if cancelled is not None and cancelled():
+                raise RequestCancelled("Job cancelled")
+            self.requests.acquire(cancelled=cancelled)
+            self.tokens.acquire(
+                estimate_request_tokens(request, self._estimate_tools(request.get("tools"))), cancelled=cancelled
+            )
+            try:
+                return self._send(request)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                if on_retry is not None:
+                    on_retry()
+                time.sleep(self._backoff(attempt, e))
+                attempt += 1
+
+    def _estimate_tools(self, tools: list | None) -> int:
+        if not tools:
+            return 0
+        with self._tools_lock:
+            if id(tools) in self._tools_tokens:
+                self._tools_tokens.move_to_end(id(tools))
+                return self._tools_tokens[id(tools)][1]
+        tokens = estimate_tokens(json.dumps(tools))
+        with self._tools_lock:
+            self._tools_tokens[id(tools)] = (tools, tokens)
+            while len(self._tools_tokens) > TOOLS_ESTIMATES_KEPT:
+                self._tools_tokens.popitem(last=False)
+        return tokens
+
+    def _send(self, request: dict) -> Any:
+        completions = self.client.chat.completions
+        if not hasattr(completions, "with_raw_response"):
+            return completions.create(**request)
+        raw = completions.with_raw_response.create(**request)
+        self._follow_headers(raw.headers)
+        return raw.parse()
+
+    def _follow_headers(self, headers: Any) -> None:
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            bucket.update(
+                limit=float(limit) if limit else None,
+                remaining=float(remaining) if remaining else None,
+            )
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            try:
+                return float(headers["retry-after"])
+            except ValueError:
+                pass
+        resets = [
+            parse_reset(headers[name])
+            for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+            if headers.get(name)
+        ]
+        if resets:
+            return min(max(resets), self.max_delay)
+        # Full jitter keeps many workers from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))  # noqa: S311
@@ -0,0 +1,71 @@
+"""Per-row chat completion requests that share one frozen prefix per job.
+
+Providers cache the longest prompt prefix they have seen recently (OpenAI
+from 1024 tokens up), billing and computing the cached part for less. Every
+request of a job is laid out so that prefix is as long as possible and
+identical from row to row: the tool definition and system prompt come first
+and are built once, as the same objects for every request, and only the row
+text at the end differs. On OpenAI a ``prompt_cache_key`` derived from the
+prefix, sent in the request body, also routes a job's requests to the same
+cache.
+"""
+
+import hashlib
+import json
+
+from data_rip.cache import schema_digest
+from data_rip.packing import PACKED_FUNCTION_NAME, PACKED_SYS_PROMPT, build_packed_tools
+from data_rip.prompts import EXTRACTION_SYS_PROMPT
+
+
+class _Prefix:
+    """System message, tools and tool choice of one request layout, never modified once built."""
+
+    def __init__(self, system_prompt: str, tools: list[dict], function_name: str, prompt_cache_key: bool):
+        self.system = {"role": "system", "content": system_prompt}
+        self.tools = tools
+        self.tool_choice = {"type": "function", "function": {"name": function_name}}
+        payload = json.dumps({"tools": tools, "system_prompt": system_prompt}, sort_keys=True)
+        self.cache_key = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] if prompt_cache_key else None
+
+    def request(self, model: str, content: str) -> dict:
+        request = {
+            "model": model,
+            "messages": [self.system, {"role": "user", "content": content}],
+            "tools": self.tools,
+            "tool_choice": self.tool_choice,
+        }
+        if self.cache_key is not None:
+            # In the body rather than as a keyword, openai versions before the parameter existed reject it
+            request["extra_body"] = {"prompt_cache_key": self.cache_key}
+        return request
+
+
+class RequestBuilder:
+    """Builds a job's single row and packed requests around its frozen prefixes.
+
+    ``digest`` identifies the prefix for ``model`` in the result cache.
+    ``prompt_cache_key`` adds OpenAI's routing hint, which other
+    OpenAI-compatible servers may not accept.
+    """
+
+    def __init__(self, tools: list[dict], function_name: str, model: str, prompt_cache_key: bool = False):
+        self.tools = tools
+        self.digest = schema_digest(tools, model, EXTRACTION_SYS_PROMPT)
+        self._prompt_cache_key = prompt_cache_key
+        self._single = _Prefix(EXTRACTION_SYS_PROMPT, tools, function_name, prompt_cache_key)
+        self._packed: _Prefix | None = None
+
+    def single(self, text: str, model: str) -> dict:
+        """Chat completion arguments extracting one row (or chunk) of ``text``."""
+        return self._single.request(model, text)
+
+    def packed(self, texts: list[str], row_ids: list[str], model: str) -> dict:
+        """Chat completion arguments extracting every text in one call, tagged with its row id."""
+        if self._packed is None:
+            # Only jobs that pack rows need the wrapper tool
+            self._packed = _Prefix(
+                PACKED_SYS_PROMPT, build_packed_tools(self.tools), PACKED_FUNCTION_NAME, self._prompt_cache_key
+            )
+        rows = "\n".join(f'<row id="{row_id}">\n{text}\n</row>' for row_id, text in zip(row_ids, texts))
+        return self._packed.request(model, rows)
@@ -0,0 +1,57 @@
+"""Routing rows from the cheap extraction model to stronger ones.
+
+Every row is extracted with the job's model first. A row is escalated to the
+next model in ``DATA_RIP_ESCALATION_MODELS`` when its answer fails to parse,
+doesn't match the schema, or reports a low confidence. Confidence is opt-in:
+add a number field named ``confidence`` (0 to 1) to the extraction schema and
+answers below ``DATA_RIP_MIN_CONFIDENCE`` are escalated. A low confidence
+answer from the last model is kept rather than failed.
+"""
+
+import os
+
+DEFAULT_ESCALATION_MODELS = [
+    model.strip() for model in os.getenv("DATA_RIP_ESCALATION_MODELS", "gpt-4o").split(",") if model.strip()
+]
+DEFAULT_MIN_CONFIDENCE = float(os.getenv("DATA_RIP_MIN_CONFIDENCE", "0.5"))
+CONFIDENCE_FIELD = "confidence"
+
+
+class ModelRouter:
+    """The models a row is tried with, cheapest first, and when to move on to the next one."""
+
+    def __init__(
+        self,
+        escalation_models: list[str] | None = None,
+        min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+        confidence_field: str = CONFIDENCE_FIELD,
+    ):
+        self.escalation_models = DEFAULT_ESCALATION_MODELS if escalation_models is None else escalation_models
+        self.min_confidence = min_confidence
+        self.confidence_field = confidence_field
+
+    def ladder(self, model: str) -> list[str]:
+        """``model`` followed by the stronger models a row may be escalated to.
+
+        A model in the escalation list itself is only followed by the ones after it.
+        """
+        if model in self.escalation_models:
+            return self.escalation_models[self.escalation_models.index(model) :]
+        return [model, *self.escalation_models]
+
+    def top_model(self, model: str) -> str:
+        """The strongest model a row of ``model`` can end up on, the baseline for the cost saved."""
+        return self.ladder(model)[-1]
+
+    def low_confidence(self, tool_call: dict) -> bool:
+        confidence = tool_call.get(self.confidence_field)
+        return isinstance(confidence, int | float) and not isinstance(confidence, bool) and (
+            confidence < self.min_confidence
+        )
+
+
+def make_model_router() -> ModelRouter | None:
+    """Router for ``DATA_RIP_ESCALATION_MODELS``, None when it is set to ``off``."""
+    if [model.lower() for model in DEFAULT_ESCALATION_MODELS] == ["off"]:
+        return None
+    return ModelRouter()
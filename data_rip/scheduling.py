@@ -0,0 +1,165 @@
+"""Sharing the engine's workers between jobs.
+
+Every job's queued calls wait in a ``JobQueue``, and each worker that frees up
+takes the next call from it. Jobs with a higher priority go first. Jobs of the
+same priority share the workers in proportion to their weights, through stride
+scheduling: a job's pass grows by ``1 / weight`` with every call it is handed,
+and the job with the lowest pass goes next. A job that was idle starts again at
+the current pass rather than with credit saved up, so a huge upload keeps its
+share and small interactive runs still get a worker right away.
+
+Jobs can be paused (queued calls stay, none are handed out), resumed and
+cancelled (queued calls are dropped and calls waiting on the rate limiter are
+abandoned).
+
+Within a job, calls are queued in the order of its dispatch policy, from the
+estimated tokens of each call: ``file`` keeps the file order, ``shortest``
+sends the shortest first for the quickest first results, and ``bucketed``
+alternates between the longest and the shortest length bands. Long calls then
+start early instead of becoming the tail of the run, and short ones keep
+results coming in from the start.
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Any
+
+DEFAULT_PRIORITY = 0
+# Previews and other runs someone is waiting on go before full runs
+INTERACTIVE_PRIORITY = 1
+DEFAULT_WEIGHT = 1.0
+
+RUNNING, PAUSED, CANCELLED = "running", "paused", "cancelled"
+
+DISPATCH_POLICIES = ("file", "shortest", "bucketed")
+DEFAULT_DISPATCH = os.getenv("DATA_RIP_DISPATCH", "bucketed")
+# Estimates are rough, so calls of about the same length keep their file order
+DISPATCH_BANDS = 8
+
+
+def dispatch_order(sizes: list[int], policy: str = DEFAULT_DISPATCH) -> list[int]:
+    """Positions of a job's calls in the order they should be sent, from their estimated tokens."""
+    if policy not in DISPATCH_POLICIES:
+        raise ValueError(f"Unknown dispatch policy {policy!r}, expected one of {', '.join(DISPATCH_POLICIES)}")
+    if policy == "file":
+        return list(range(len(sizes)))
+    by_size = sorted(range(len(sizes)), key=sizes.__getitem__)
+    if policy == "shortest":
+        return by_size
+    band_size = max(-(-len(sizes) // DISPATCH_BANDS), 1)
+    bands = [sorted(by_size[start : start + band_size]) for start in range(0, len(sizes), band_size)]
+    shortest = [position for band in bands for position in band]
+    longest = [position for band in reversed(bands) for position in band]
+    order: dict[int, None] = {}
+    for long, short in zip(longest, shortest):
+        order.setdefault(long)
+        order.setdefault(short)
+        if len(order) == len(sizes):
+            break
+    return list(order)
+
+
+class _Job:
+    def __init__(self, priority: int, weight: float, start_pass: float):
+        self.items: deque = deque()
+        self.priority = priority
+        self.weight = weight
+        self.pass_ = start_pass
+        self.state = RUNNING
+
+
+class JobQueue:
+    """Calls queued by every job, handed out by priority first and weighted fair share second."""
+
+    def __init__(self) -> None:
+        self._jobs: dict[str, _Job] = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        # Pass of the last call handed out, where jobs that become busy again start
+        self._pass = 0.0
+
+    def extend(
+        self, job_id: str, items: list, priority: int = DEFAULT_PRIORITY, weight: float = DEFAULT_WEIGHT
+    ) -> None:
+        """Queue a run of a job's calls, a cancelled or paused job runs again."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.state == CANCELLED or not job.items:
+                job = self._jobs[job_id] = _Job(priority, weight, max(self._pass, job.pass_ if job else 0.0))
+            job.priority, job.weight, job.state = priority, weight, RUNNING
+            job.items.extend(items)
+            self._condition.notify_all()
+
+    def get(self) -> tuple[str, Any] | None:
+        """Block until a call of a running job is queued, then take the next one due.
+
+        Returns None once the queue is stopped, for every waiting worker.
+        """
+        with self._condition:
+            while not self._stopped:
+                ready = [(job_id, job) for job_id, job in self._jobs.items() if job.items and job.state == RUNNING]
+                if ready:
+                    job_id, job = min(ready, key=lambda entry: (-entry[1].priority, entry[1].pass_))
+                    self._pass = job.pass_
+                    job.pass_ += 1 / job.weight
+                    return job_id, job.items.popleft()
+                self._condition.wait()
+            return None
+
+    def stop(self) -> None:
+        """Stop handing out calls, the calls still queued are dropped."""
+        with self._condition:
+            self._stopped = True
+            self._jobs.clear()
+            self._condition.notify_all()
+
+    def set_share(self, job_id: str, priority: int | None = None, weight: float | None = None) -> None:
+        with self._condition:
+            job = self._jobs[job_id]
+            if priority is not None:
+                job.priority = priority
+            if weight is not None:
+                job.weight = weight
+
+    def pause(self, job_id: str) -> None:
+        with self._condition:
+            if job_id in self._jobs and self._jobs[job_id].state == RUNNING:
+                self._jobs[job_id].state = PAUSED
+
+    def resume(self, job_id: str) -> None:
+        with self._condition:
+            if job_id in self._jobs and self._jobs[job_id].state == PAUSED:
+                job = self._jobs[job_id]
+                job.state = RUNNING
+                job.pass_ = max(job.pass_, self._pass)
+                self._condition.notify_all()
+
+    def cancel(self, job_id: str) -> int:
+        """Drop the job's queued calls, returning how many there were."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return 0
+            dropped = len(job.items)
+            job.items.clear()
+            job.state = CANCELLED
+            return dropped
+
+    def state(self, job_id: str) -> str | None:
+        """``running``, ``paused`` or ``cancelled``, None for a job never queued here."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            return job.state if job is not None else None
+
+    def forget(self, job_id: str) -> None:
+        """Drop a job with no calls waiting, its state is None again."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.items:
+                del self._jobs[job_id]
+
+    def waiting(self, job_id: str) -> int:
+        with self._condition:
+            job = self._jobs.get(job_id)
+            return len(job.items) if job is not None else 0
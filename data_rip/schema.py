@@ -0,0 +1,97 @@
+"""Generating extraction schemas and turning them into function calling tools."""
+
+import ast
+import json
+import os
+
+from data_rip.cache import ResultCache, cache_key, schema_digest
+from data_rip.prompts import FUNCTION_CALLING_FEW_SHOTS_DICT, FUNCTION_CALLING_SYS_PROMPT
+from data_rip.ratelimit import RequestScheduler
+
+SCHEMA_MODEL = os.getenv("DATA_RIP_SCHEMA_MODEL", "gpt-4o")
+FUNCTION_NAME = "extraction_function"
+
+
+def normalize_instruction(instruction: str) -> str:
+    """Instructions differing only in case or whitespace share a generated schema."""
+    return " ".join(instruction.split()).casefold()
+
+
+def generate_schema(
+    scheduler: RequestScheduler, instruction: str, model: str = SCHEMA_MODEL, cache: ResultCache | None = None
+) -> str:
+    """Ask the model for a JSON schema matching a plain language instruction, returning its raw text.
+
+    With a ``cache``, the schema is memoized by the normalized instruction so
+    an instruction that was used before doesn't need another call.
+    """
+    key = None
+    if cache is not None:
+        digest = schema_digest(FUNCTION_CALLING_FEW_SHOTS_DICT, model, FUNCTION_CALLING_SYS_PROMPT["content"])
+        key = cache_key(digest, normalize_instruction(instruction))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["schema"]
+
+    response = scheduler.create(
+        model=model,
+        messages=[
+            FUNCTION_CALLING_SYS_PROMPT,
+            *FUNCTION_CALLING_FEW_SHOTS_DICT,
+            {"role": "user", "content": instruction},
+        ],
+    )
+    schema_text = response.choices[0].message.content
+    if key is not None:
+        try:
+            # Only schemas that parse are worth remembering
+            clean_schema(schema_text)
+            cache.put(key, {"schema": schema_text})
+        except ValueError:
+            pass
+    return schema_text
+
+
+def clean_schema(schema_text: str) -> dict:
+    """Parse the schema text the model returns, which may be fenced and written as a Python literal.
+
+    Raises ``ValueError`` (``json.JSONDecodeError`` for unparseable text) if
+    it isn't an object schema with ``properties``.
+    """
+    text = schema_text.replace("```json", "").replace("```", "").strip()
+    try:
+        schema = json.loads(text)
+    except json.JSONDecodeError:
+        try:
+            # A Python dict, as in the few-shot examples: single quotes, None, True and False
+            schema = ast.literal_eval(text)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            # Python style quotes around JSON literals, only swapped when nothing else parses so apostrophes survive
+            schema = json.loads(text.replace("'", '"'))
+    if not isinstance(schema, dict) or not isinstance(schema.get("properties"), dict):
+        raise ValueError("Schema must be an object with 'properties'")
+    schema.setdefault("required", [])
+    return schema
+
+
+def tools_schema(tools: list[dict]) -> dict | None:
+    """The JSON schema of the extracted fields, the parameters of the function in ``tools``."""
+    return tools[0]["function"]["parameters"] if tools else None
+
+
+def build_tools(schema: dict, function_name: str = FUNCTION_NAME) -> list[dict]:
+    """The forced function calling ``tools`` used to extract one row with ``schema``."""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": f"{function_name}",
+                "description": "Extract data as per the schema provided",
+                "parameters": {
+                    "type": "object",
+                    "properties": schema["properties"],
+                    "required": schema["required"],
+                },
+            },
+        }
+    ]
@@ -0,0 +1,96 @@
+"""Checking extracted rows against the extraction schema.
+
+The schema is compiled once per job into nested check functions, so checking
+a row's ``tool_call`` arguments is a handful of ``isinstance`` calls rather
+than a walk over the schema. Only the parts of JSON Schema that extraction
+schemas use are supported: ``type``, ``properties``, ``required``, ``items``,
+``enum`` and ``default``. Optional fields that are missing or null are filled
+in from their ``default``.
+"""
+
+from collections.abc import Callable
+from typing import Any
+
+Check = Callable[[Any, str], tuple[Any, list[str]]]
+
+TYPE_CHECKS: dict[str, Callable[[Any], bool]] = {
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: (isinstance(value, int) and not isinstance(value, bool))
+    or (isinstance(value, float) and value.is_integer()),
+    "number": lambda value: isinstance(value, int | float) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "array": lambda value: isinstance(value, list),
+    "object": lambda value: isinstance(value, dict),
+    "null": lambda value: value is None,
+}
+
+
+class SchemaValidationError(ValueError):
+    """Extracted arguments that don't match the schema, with every problem found."""
+
+    def __init__(self, problems: list[str]):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+def _compile(schema: dict) -> Check:
+    types = schema.get("type")
+    types = [types] if isinstance(types, str) else list(types or [])
+    type_checks = [TYPE_CHECKS[name] for name in types if name in TYPE_CHECKS]
+    enum = schema.get("enum")
+    properties = {name: _compile(prop) for name, prop in schema.get("properties", {}).items()}
+    defaults = {name: prop["default"] for name, prop in schema.get("properties", {}).items() if "default" in prop}
+    required = set(schema.get("required", []))
+    items = _compile(schema["items"]) if isinstance(schema.get("items"), dict) else None
+
+    def check(value: Any, path: str) -> tuple[Any, list[str]]:
+        if type_checks and not any(type_check(value) for type_check in type_checks):
+            return value, [f"{path} should be {' or '.join(types)}, got {type(value).__name__}"]
+        if enum is not None and value not in enum:
+            return value, [f"{path} should be one of {enum}, got {value!r}"]
+        problems: list[str] = []
+        if properties and isinstance(value, dict):
+            value = dict(value)
+            for name, check_property in properties.items():
+                if value.get(name) is None:
+                    if name in defaults:
+                        value[name] = defaults[name]
+                        continue
+                    if name not in value:
+                        if name in required:
+                            problems.append(f"{path}.{name} is required")
+                        continue
+                    if name not in required:
+                        # Models often answer null for an optional field they found nothing for
+                        continue
+                value[name], found = check_property(value[name], f"{path}.{name}")
+                problems.extend(found)
+        if items is not None and isinstance(value, list):
+            checked = []
+            for index, item in enumerate(value):
+                item, found = items(item, f"{path}[{index}]")
+                checked.append(item)
+                problems.extend(found)
+            value = checked
+        return value, problems
+
+    return check
+
+
+class SchemaValidator:
+    """A schema compiled for checking many rows of extracted arguments."""
+
+    def __init__(self, schema: dict):
+        self._check = _compile({"type": "object", **schema})
+
+    @classmethod
+    def for_tools(cls, tools: list[dict]) -> "SchemaValidator":
+        """Validator for the parameters of the (single, forced) function in ``tools``."""
+        return cls(tools[0]["function"]["parameters"] if tools else {})
+
+    def validate(self, arguments: Any) -> dict:
+        """Return ``arguments`` with defaults filled in, raising ``SchemaValidationError`` if they don't match."""
+        value, problems = self._check(arguments, "$")
+        if problems:
+            raise SchemaValidationError(problems)
+        return value
@@ -0,0 +1,166 @@
+"""``data-rip-worker``: runs queued extraction jobs outside the web process.
+
+With ``DATA_RIP_WORK_QUEUE`` set, the Dash app only puts jobs on the work
+queue and reports progress from the job store. Each worker process claims row
+ranges from the queue, extracts them on its own engine (threads, cache, rate
+limiting) and writes the rows to the shared SQLite job store. Start as many
+workers as the API limits allow, on the app's host since SQLite files can't be
+shared safely over a network file system:
+
+    DATA_RIP_WORK_QUEUE=/data/queue.db DATA_RIP_JOB_DB=/data/jobs.db data-rip-worker
+"""
+
+import argparse
+import os
+import socket
+import sys
+import time
+import uuid
+from typing import Any
+
+from data_rip.backends import make_backend
+from data_rip.cache import make_result_cache
+from data_rip.engine import ExtractionEngine
+from data_rip.ingest import range_offsets, read_page
+from data_rip.jobs import MemoryJobStore, SQLiteJobStore, make_job_store
+from data_rip.metrics import MetricsRecorder
+from data_rip.near_duplicates import make_near_duplicate_finder
+from data_rip.schema import tools_schema
+from data_rip.workqueue import DEFAULT_LEASE_SECONDS, DEFAULT_RANGE_ROWS, WorkQueue, make_work_queue
+
+# Ranges a worker keeps in flight, so its threads aren't idle while one range finishes
+DEFAULT_RANGES_IN_FLIGHT = 2
+
+
+def enqueue_extraction(
+    work_queue: WorkQueue,
+    store: MemoryJobStore | SQLiteJobStore,
+    job_id: str,
+    spec: dict,
+    total_rows: int,
+    range_rows: int = DEFAULT_RANGE_ROWS,
+) -> None:
+    """Create (or resume) a job in the store and queue its rows for the workers.
+
+    A job that still has ranges queued or running is left alone. Rows are
+    checkpointed by position, which is stable since workers read the same file.
+    The file is scanned once for the byte offset of each range, so workers don't
+    parse every row before theirs.
+    """
+    if work_queue.is_running(job_id):
+        return
+    if store.has_job(job_id):
+        store.clear_errors(job_id)
+    else:
+        store.create_job(job_id, total_rows, spec["model"], schema=tools_schema(spec["tools"]))
+    work_queue.enqueue_job(job_id, spec, total_rows, range_rows, offsets=range_offsets(spec["path"], range_rows))
+
+
+class Worker:
+    """Claims row ranges from the work queue and runs them on an extraction engine."""
+
+    def __init__(
+        self,
+        work_queue: WorkQueue,
+        engine: ExtractionEngine,
+        worker_id: str | None = None,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        ranges_in_flight: int = DEFAULT_RANGES_IN_FLIGHT,
+        poll_seconds: float = 1.0,
+    ):
+        self.work_queue = work_queue
+        self.engine = engine
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.ranges_in_flight = ranges_in_flight
+        self.poll_seconds = poll_seconds
+        self.active: dict[int, dict[str, Any]] = {}
+
+    def start_range(self, task: dict) -> None:
+        spec = task["spec"]
+        rows = read_page(
+            spec["path"], task["start_row"], task["end_row"], columns=spec["columns"], offset=task["start_offset"]
+        )
+        processing_queue = [
+            {
+                "row": row,
+                "text_column": spec["text_column"],
+                "tools": spec["tools"],
+                "function_name": spec["function_name"],
+            }
+            for row in rows
+        ]
+        self.engine.submit_range(
+            task["job_id"], processing_queue, task["start_row"], model=spec["model"], pack_size=spec["pack_size"]
+        )
+        task["rows"] = len(rows)
+        task["renewed"] = time.monotonic()
+        self.active[task["task_id"]] = task
+
+    def step(self) -> bool:
+        """Complete finished ranges, renew leases and claim new ranges. False once idle."""
+        for task_id, task in list(self.active.items()):
+            finished = self.engine.store.count_finished(task["job_id"], task["start_row"], task["end_row"])
+            if finished >= task["rows"]:
+                self.work_queue.complete(task_id, self.worker_id)
+                del self.active[task_id]
+            elif time.monotonic() - task["renewed"] > self.lease_seconds / 3:
+                if self.work_queue.renew(task_id, self.worker_id, self.lease_seconds):
+                    task["renewed"] = time.monotonic()
+                else:
+                    # Another worker took the range over, it will finish it
+                    del self.active[task_id]
+        while len(self.active) < self.ranges_in_flight:
+            task = self.work_queue.claim(self.worker_id, self.lease_seconds)
+            if task is None:
+                break
+            self.start_range(task)
+        return bool(self.active)
+
+    def run(self, stop_when_idle: bool = False) -> None:
+        while True:
+            busy = self.step()
+            if not busy and stop_when_idle:
+                return
+            time.sleep(self.poll_seconds / 5 if busy else self.poll_seconds)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="data-rip-worker", description="Run queued data-rip extraction jobs.")
+    parser.add_argument("--queue", default=os.getenv("DATA_RIP_WORK_QUEUE"), help="Work queue database")
+    parser.add_argument("--concurrency", type=int, help="Requests in flight at once (default per backend)")
+    parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS, help="Lease on a claimed range")
+    parser.add_argument("--exit-when-idle", action="store_true", help="Stop once the queue is empty")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    work_queue = make_work_queue(args.queue)
+    store = make_job_store()
+    if work_queue is None or isinstance(store, MemoryJobStore):
+        print("Workers need DATA_RIP_WORK_QUEUE (or --queue) and a SQLite DATA_RIP_JOB_DB", file=sys.stderr)
+        return 2
+
+    backend = make_backend()
+    client = backend.make_client()
+    engine = ExtractionEngine(
+        client,
+        store=store,
+        max_workers=args.concurrency or backend.concurrency,
+        cache=make_result_cache(),
+        scheduler=backend.make_scheduler(client),
+        metrics=MetricsRecorder(priced=backend.priced),
+        prompt_cache_key=backend.prompt_cache_key,
+        router=backend.make_router(),
+        near_duplicates=make_near_duplicate_finder(),
+        stream=backend.stream,
+    )
+    worker = Worker(work_queue, engine, lease_seconds=args.lease_seconds)
+    print(f"Worker {worker.worker_id} polling {work_queue.path}", file=sys.stderr)
+    worker.run(stop_when_idle=args.exit_when_idle)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
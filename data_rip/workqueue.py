@@ -0,0 +1,170 @@
+"""Shared queue of extraction work for separate worker processes.
+
+A job is split into ranges of ``DEFAULT_RANGE_ROWS`` rows, each a task in a
+SQLite database that every worker opens. A worker claims a task with a lease
+and renews it while the range is running. Tasks whose lease runs out (the
+worker died or hung) are claimed again by another worker, which skips the
+rows already checkpointed in the job store. Only a file is needed, no queue
+service, but the workers have to run on the same host as the app: SQLite's
+locking isn't reliable on network file systems, and leases are compared
+against each worker's own clock.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+DEFAULT_RANGE_ROWS = int(os.getenv("DATA_RIP_RANGE_ROWS", "200"))
+DEFAULT_LEASE_SECONDS = float(os.getenv("DATA_RIP_LEASE_SECONDS", "120"))
+
+
+class WorkQueue:
+    """Row range tasks of queued jobs, claimed by workers under expiring leases."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        # Transactions are managed explicitly so a claim can take the write lock up front
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS queued_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    spec TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    start_row INTEGER NOT NULL,
+                    end_row INTEGER NOT NULL,
+                    start_offset INTEGER,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    owner TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, task_id);
+                CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id, state);
+                """
+            )
+            # Queues from before ranges kept the byte offset they start at
+            columns = {name for _, name, *_ in self._conn.execute("PRAGMA table_info(tasks)")}
+            if "start_offset" not in columns:
+                self._conn.execute("ALTER TABLE tasks ADD COLUMN start_offset INTEGER")
+
+    def is_running(self, job_id: str) -> bool:
+        """Whether any range of the job is still waiting for or held by a worker."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM tasks WHERE job_id = ? AND state != 'done' LIMIT 1", (job_id,)
+            ).fetchone()
+        return row is not None
+
+    def enqueue_job(
+        self,
+        job_id: str,
+        spec: dict,
+        total_rows: int,
+        range_rows: int = DEFAULT_RANGE_ROWS,
+        offsets: list[int] | None = None,
+    ) -> None:
+        """Queue every row range of a job, replacing the tasks of an earlier run of it.
+
+        ``spec`` is what a worker needs to run a range: the input ``path``,
+        ``columns``, ``text_column``, ``tools``, ``function_name``, ``model``
+        and ``pack_size``. ``offsets`` are the byte offsets in the file each
+        range starts at, from ``ingest.range_offsets``.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO queued_jobs (job_id, spec) VALUES (?, ?)", (job_id, json.dumps(spec))
+                )
+                self._conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+                self._conn.executemany(
+                    "INSERT INTO tasks (job_id, start_row, end_row, start_offset) VALUES (?, ?, ?, ?)",
+                    [
+                        (job_id, start, min(start + range_rows, total_rows), offsets[n] if offsets else None)
+                        for n, start in enumerate(range(0, total_rows, range_rows))
+                    ],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, owner: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> dict[str, Any] | None:
+        """Lease the oldest pending (or abandoned) range to ``owner``, None when there is nothing to do."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                task = self._conn.execute(
+                    """
+                    SELECT task_id, tasks.job_id, start_row, end_row, start_offset, attempts, spec
+                    FROM tasks JOIN queued_jobs USING (job_id)
+                    WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                    ORDER BY task_id LIMIT 1
+                    """,
+                    (now,),
+                ).fetchone()
+                if task is not None:
+                    self._conn.execute(
+                        "UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1"
+                        " WHERE task_id = ?",
+                        (owner, now + lease_seconds, task[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if task is None:
+            return None
+        task_id, job_id, start_row, end_row, start_offset, attempts, spec = task
+        return {
+            "task_id": task_id,
+            "job_id": job_id,
+            "start_row": start_row,
+            "end_row": end_row,
+            "start_offset": start_offset,
+            "attempt": attempts + 1,
+            "spec": json.loads(spec),
+        }
+
+    def renew(self, task_id: int, owner: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """Extend a lease, False if ``owner`` lost it to another worker."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE task_id = ? AND owner = ? AND state = 'leased'",
+                (time.time() + lease_seconds, task_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, task_id: int, owner: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET state = 'done', lease_expires = NULL WHERE task_id = ? AND owner = ?",
+                (task_id, owner),
+            )
+
+    def counts(self, job_id: str) -> dict[str, int]:
+        """Number of the job's ranges in each state."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall()
+        return {"pending": 0, "leased": 0, "done": 0, **dict(rows)}
+
+
+def make_work_queue(path: str | None = None) -> WorkQueue | None:
+    """Queue at ``DATA_RIP_WORK_QUEUE`` (or ``path``), None to run extraction in the app process."""
+    path = path or os.getenv("DATA_RIP_WORK_QUEUE")
+    return WorkQueue(path) if path else None
@@ -0,0 +1,167 @@
+"""Streaming writers for extraction results.
+
+Results are written a page at a time as they come out of the job store, in
+the format picked by the output file's extension. CSV and JSONL writers also
+write to an open text stream, which the export endpoint drains as it goes.
+
+Parquet columns are typed from the job's JSON schema when there is one:
+strings, integers, numbers and booleans become the matching Arrow types,
+arrays become lists and objects with properties become structs, so nested
+fields stay queryable. Fields without a usable type are kept as JSON text
+and input columns as strings.
+"""
+
+import csv
+import json
+import os
+from typing import IO, Any
+
+PARQUET_ROW_GROUP_SIZE = 10_000
+
+
+def _open(path: str | IO[str], newline: str | None = None) -> IO[str]:
+    return open(path, "w", newline=newline, encoding="utf-8") if isinstance(path, str) else path  # noqa: SIM115
+
+
+class CSVWriter:
+    def __init__(self, path: str | IO[str], fieldnames: list[str], schema: dict | None = None):
+        self._file = _open(path, newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, rows: list[dict]) -> None:
+        # Nested values (arrays, objects) are kept as JSON text in their cell
+        self._writer.writerows(
+            {key: json.dumps(value) if isinstance(value, list | dict) else value for key, value in row.items()}
+            for row in rows
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class JSONLWriter:
+    def __init__(self, path: str | IO[str], fieldnames: list[str], schema: dict | None = None):
+        self._file = _open(path)
+
+    def write(self, rows: list[dict]) -> None:
+        for row in rows:
+            self._file.write(json.dumps(row, default=str) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _json_type(schema: dict) -> str | None:
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kinds = [name for name in kind if name != "null"]
+        kind = kinds[0] if len(kinds) == 1 else None
+    return kind
+
+
+def arrow_type(pa: Any, schema: dict) -> Any:
+    """Arrow type for values matching the JSON ``schema``, a string (of JSON) when it has no usable type."""
+    kind = _json_type(schema)
+    if kind in ("string", "integer", "number", "boolean"):
+        return {"string": pa.string(), "integer": pa.int64(), "number": pa.float64(), "boolean": pa.bool_()}[kind]
+    if kind == "array" and isinstance(schema.get("items"), dict):
+        return pa.list_(arrow_type(pa, schema["items"]))
+    if kind == "object" and schema.get("properties"):
+        return pa.struct([(name, arrow_type(pa, field)) for name, field in schema["properties"].items()])
+    return pa.string()
+
+
+def arrow_value(value: Any, schema: dict) -> Any:
+    """``value`` shaped for its ``arrow_type`` column."""
+    if value is None:
+        return None
+    kind = _json_type(schema)
+    if kind == "integer" and isinstance(value, float):
+        return int(value)
+    if kind in ("integer", "number", "boolean"):
+        return value
+    if kind == "array" and isinstance(schema.get("items"), dict) and isinstance(value, list):
+        return [arrow_value(item, schema["items"]) for item in value]
+    if kind == "object" and schema.get("properties") and isinstance(value, dict):
+        return {name: arrow_value(value.get(name), field) for name, field in schema["properties"].items()}
+    if isinstance(value, str):
+        return value
+    if kind == "string" and not isinstance(value, list | dict):
+        # Input columns are typed as strings whatever the file's reader made of them
+        return str(value)
+    return json.dumps(value, default=str)
+
+
+class ParquetWriter:
+    """Buffers rows into row groups.
+
+    With the job's JSON ``schema`` every column is typed up front (see
+    ``arrow_type``), otherwise the column types are fixed by the first row group.
+    """
+
+    def __init__(self, path: str, fieldnames: list[str], schema: dict | None = None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Writing Parquet needs pyarrow, install it with `pip install data_rip[parquet]`") from e
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.fieldnames = fieldnames
+        self._buffer: list[dict] = []
+        self._writer: Any = None
+        self._fields: dict[str, dict] | None = None
+        if schema is not None:
+            properties = schema.get("properties", {})
+            self._fields = {name: properties.get(name, {"type": "string"}) for name in fieldnames}
+            arrow_schema = pa.schema([(name, arrow_type(pa, field)) for name, field in self._fields.items()])
+            self._writer = pq.ParquetWriter(path, arrow_schema)
+
+    def write(self, rows: list[dict]) -> None:
+        self._buffer.extend(rows)
+        if len(self._buffer) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        if self._fields is not None:
+            columns = {
+                name: [arrow_value(row.get(name), field) for row in self._buffer]
+                for name, field in self._fields.items()
+            }
+            table = self._pa.table(columns, schema=self._writer.schema)
+            self._writer.write_table(table)
+            self._buffer = []
+            return
+        columns = {name: [row.get(name) for row in self._buffer] for name in self.fieldnames}
+        if self._writer is None:
+            table = self._pa.table(columns)
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = self._pa.table(columns, schema=self._writer.schema)
+        self._writer.write_table(table)
+        self._buffer = []
+
+    def close(self) -> None:
+        self._flush()
+        if self._writer is None:
+            # Nothing was extracted, still leave a valid (empty) file behind
+            empty = self._pa.schema([(name, self._pa.string()) for name in self.fieldnames])
+            self._writer = self._pq.ParquetWriter(self.path, empty)
+        self._writer.close()
+
+
+WRITERS = {".csv": CSVWriter, ".jsonl": JSONLWriter, ".parquet": ParquetWriter}
+
+
+def open_writer(
+    path: str, fieldnames: list[str], schema: dict | None = None
+) -> CSVWriter | JSONLWriter | ParquetWriter:
+    """Writer for ``path``, picked by its extension. ``schema`` types the columns of Parquet files."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Unsupported output format {extension!r}, use one of {', '.join(WRITERS)}")
+    return WRITERS[extension](path, fieldnames, schema)
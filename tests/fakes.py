@@ -0,0 +1,127 @@
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "f",
+            "parameters": {"type": "object", "properties": {"echo": {"type": "string"}}, "required": ["echo"]},
+        },
+    }
+]
+
+
+class FakeClient:
+    """Stands in for ``openai.Client``, echoing the row text back as a tool call.
+
+    Packed requests get one result per ``<row>``, except rows whose text is
+    ``drop_in_pack`` which are left out of the packed answer. The first
+    ``invalid_times`` answers for ``invalid_on`` don't match the schema. With
+    a ``weak_model`` only that model gets ``invalid_on`` wrong, and it answers
+    ``unsure_on`` with a low confidence. Every call reports ``cached_tokens``
+    of its prompt as cached. Streamed calls send the arguments
+    ``stream_piece`` characters at a time, ``stream_delay`` seconds apart,
+    and count the pieces sent in ``pieces_sent``.
+    """
+
+    def __init__(
+        self,
+        delay=0.0,
+        fail_on=None,
+        drop_in_pack=None,
+        invalid_on=None,
+        invalid_times=float("inf"),
+        weak_model=None,
+        unsure_on=None,
+        cached_tokens=0,
+        stream_piece=8,
+        stream_delay=0.0,
+    ):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.drop_in_pack = drop_in_pack
+        self.invalid_on = invalid_on
+        self.invalid_times = invalid_times
+        self.weak_model = weak_model
+        self.unsure_on = unsure_on
+        self.cached_tokens = cached_tokens
+        self.stream_piece = stream_piece
+        self.stream_delay = stream_delay
+        self.pieces_sent = 0
+        self.requests = []
+        self.models = []
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        text = kwargs["messages"][-1]["content"]
+        with self._lock:
+            self.calls += 1
+            self.models.append(kwargs["model"])
+            self.requests.append(kwargs)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        if text == self.fail_on:
+            raise RuntimeError("boom")
+        if kwargs["tool_choice"]["function"]["name"] == "extract_rows":
+            rows = re.findall(r'<row id="(.*?)">\n(.*?)\n</row>', text, re.DOTALL)
+            arguments = {"results": [{"row_id": i, "echo": t} for i, t in rows if t != self.drop_in_pack]}
+            for result in arguments["results"]:
+                if result["echo"] == self.unsure_on and kwargs["model"] == self.weak_model:
+                    result["confidence"] = 0.2
+        elif self.weak_model is not None and kwargs["model"] != self.weak_model:
+            arguments = {"echo": text, "confidence": 0.9}
+        elif self.weak_model is not None:
+            arguments = {"echo": 42} if text == self.invalid_on else {"echo": text}
+            if text == self.unsure_on:
+                arguments["confidence"] = 0.2
+        elif text == self.invalid_on and self.invalid_times > 0:
+            self.invalid_times -= 1
+            arguments = {"echo": 42}
+        else:
+            arguments = {"echo": text}
+        function = SimpleNamespace(arguments=json.dumps(arguments))
+        message = SimpleNamespace(tool_calls=[SimpleNamespace(function=function)])
+        usage = SimpleNamespace(
+            prompt_tokens=10 + len(text) // 4,
+            completion_tokens=5,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=self.cached_tokens),
+        )
+        if kwargs.get("stream"):
+            return self.stream(kwargs["tool_choice"]["function"]["name"], function.arguments, usage)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    def stream(self, name, arguments, usage):
+        for start in range(0, len(arguments), self.stream_piece):
+            time.sleep(self.stream_delay)
+            with self._lock:
+                self.pieces_sent += 1
+            piece = arguments[start : start + self.stream_piece]
+            function = SimpleNamespace(name=None if start else name, arguments=piece)
+            delta = SimpleNamespace(tool_calls=[SimpleNamespace(function=function)])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+
+def make_queue(texts):
+    return [
+        {"row": {"UID": i, "response": text}, "text_column": "response", "tools": TOOLS, "function_name": "f"}
+        for i, text in enumerate(texts)
+    ]
+
+
+def wait_for(engine, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not engine.store.get_progress(job_id)["done"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert engine.store.get_progress(job_id)["done"]
@@ -0,0 +1,199 @@
+import base64
+import contextvars
+import os
+import subprocess
+import sys
+import time
+
+import dash
+import pytest
+from dash._callback_context import context_value
+from dash._utils import AttributeDict
+from fakes import FakeClient
+
+from data_rip import app
+from data_rip.app import (
+    CALLBACKS,
+    ROW_ID_FIELD,
+    ROW_INDEX_FIELD,
+    AppServices,
+    control_job,
+    create_app,
+    grid_transaction,
+    load_input_rows,
+    process_next_batch,
+    run_finished,
+    services,
+    start_preview,
+)
+from data_rip.backends import make_backend
+from data_rip.engine import ExtractionEngine
+from data_rip.ingest import file_digest, spool_upload, upload_id
+from data_rip.scheduling import CANCELLED, RUNNING
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("pandas", "openai", "dash_ag_grid", "dash_bootstrap_components")
+# Seconds of import time spent outside Dash itself, generous so slow CI machines pass
+IMPORT_BUDGET_SECONDS = 0.5
+
+
+def import_profile(module: str) -> dict[str, float]:
+    """Cumulative seconds to import every module loaded by ``import module`` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+    )
+    seconds = {}
+    for line in result.stderr.splitlines():
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            seconds[name.strip()] = int(cumulative) / 1e6
+    return seconds
+
+
+@pytest.mark.parametrize("module", ["data_rip", "data_rip.prompts", "data_rip.engine", "data_rip.extract"])
+def test_library_imports_stay_light(module):
+    seconds = import_profile(module)
+    assert not [name for name in (*HEAVY_MODULES, "dash") if name in seconds]
+    assert seconds[module] < IMPORT_BUDGET_SECONDS
+
+
+def test_app_import_defers_components_pandas_and_the_client():
+    seconds = import_profile("data_rip.app")
+    assert not [name for name in HEAVY_MODULES if name in seconds]
+    assert seconds["data_rip.app"] - seconds["dash"] < IMPORT_BUDGET_SECONDS
+
+
+def test_create_app_serves_without_a_client():
+    server = create_app().server.test_client()
+
+    assert server.get("/_dash-layout").status_code == 200
+    assert len(server.get("/_dash-dependencies").json) == len(CALLBACKS)
+    assert server.get("/metrics").status_code == 200
+    assert "client" not in services.__dict__ and "engine" not in services.__dict__
+
+
+def test_services_are_built_around_a_replaced_client(monkeypatch):
+    # Keep the stores out of the home directory
+    monkeypatch.setenv("DATA_RIP_JOB_DB", "memory")
+    monkeypatch.setenv("DATA_RIP_CACHE_PATH", "off")
+    app_services = AppServices(make_backend("local"))
+    app_services.client = FakeClient()
+
+    assert app_services.engine.client is app_services.client
+    assert app_services.scheduler is app_services.engine.scheduler
+    assert app_services.engine.metrics is app_services.metrics
+
+
+SCHEMA = {"type": "object", "properties": {"echo": {"type": "string"}}, "required": ["echo"]}
+
+
+@pytest.fixture
+def app_services(monkeypatch, tmp_path):
+    monkeypatch.setenv("DATA_RIP_UPLOAD_DIR", str(tmp_path))
+    app_services = AppServices(make_backend("local"))
+    app_services.client = FakeClient(delay=0.02)
+    app_services.engine = ExtractionEngine(app_services.client, max_workers=4)
+    app_services.work_queue = None
+    monkeypatch.setattr(app, "services", app_services)
+    return app_services
+
+
+def make_upload(tmp_path, rows):
+    text = "UID,response\n" + "".join(f"{i},text {i}\n" for i in range(rows))
+    path = spool_upload("data:text/csv;base64," + base64.b64encode(text.encode()).decode(), "data.csv", str(tmp_path))
+    return {"upload_id": upload_id(path), "sha256": file_digest(path), "total_rows": rows}
+
+
+def poll(processing_state, timeout=5.0):
+    """Run progress ticks until polling stops, returning the grid rows by ID and the last tick's outputs."""
+    grid, deadline = {}, time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        outputs = process_next_batch(1, processing_state)
+        transaction, processing_state = outputs[1], outputs[5]
+        if isinstance(transaction, dict):
+            for row in transaction.get("add", []) + transaction.get("update", []):
+                grid[row[ROW_ID_FIELD]] = row
+            for row in transaction.get("remove", []):
+                grid.pop(row[ROW_ID_FIELD])
+        if outputs[6]:
+            return grid, outputs
+        time.sleep(0.01)
+    raise AssertionError("Progress polling didn't stop")
+
+
+def test_grid_transaction_adds_streamed_rows_then_updates_or_removes_them():
+    transaction, streaming = grid_transaction([], 0, [{"UID": 1, "name": "a"}], set(), "UID", False)
+    assert transaction == {"add": [{"UID": 1, "name": "a", ROW_ID_FIELD: "1"}]} and streaming == {"1"}
+
+    partial = [{"UID": 1, "name": "a", "notes": "b"}, {"UID": 2, "name": "c"}]
+    transaction, streaming = grid_transaction([{"UID": 3, "name": "d"}], 0, partial, streaming, "UID", False)
+    assert [row[ROW_ID_FIELD] for row in transaction["add"]] == ["3", "2"]
+    assert transaction["update"] == [{**partial[0], ROW_ID_FIELD: "1"}] and streaming == {"1", "2"}
+
+    # Row 1 finished, row 2 was still streaming when the run was cancelled
+    transaction, streaming = grid_transaction([{"UID": 1, "name": "e"}], 1, [], streaming, "UID", True)
+    assert transaction == {"update": [{"UID": 1, "name": "e", ROW_ID_FIELD: "1"}], "remove": [{ROW_ID_FIELD: "2"}]}
+    assert streaming == set()
+
+    # Without an ID column rows are numbered by their place in the results, and nothing streams
+    transaction, streaming = grid_transaction([{"name": "f"}, {"name": "g"}], 5, partial, set(), None, False)
+    assert [row[ROW_ID_FIELD] for row in transaction["add"]] == ["#5", "#6"] and streaming == set()
+    assert grid_transaction([], 7, [], set(), None, False) == ({}, set())
+
+
+def test_run_finished_waits_for_every_completed_row_to_be_sent():
+    assert run_finished(RUNNING, False, False, True, 10, 10) == (True, False)
+    assert run_finished(RUNNING, False, False, True, 5, 10) == (False, False)
+    # A preview never finishes the job, it is over once nothing is running
+    assert run_finished(RUNNING, True, True, False, 4, 4) == (False, False)
+    assert run_finished(RUNNING, False, True, False, 4, 4) == (True, False)
+    # A cancelled job is over once its calls in flight have returned
+    assert run_finished(CANCELLED, True, False, False, 3, 3) == (False, False)
+    assert run_finished(CANCELLED, False, False, False, 3, 3) == (True, True)
+
+
+def test_preview_runs_the_sample_and_fills_the_grid(app_services, tmp_path):
+    upload = make_upload(tmp_path, 80)
+    processing_state, disabled, _, column_defs, _ = start_preview(1, SCHEMA, upload, "UID", "response", 1)
+    assert processing_state["mode"] == "preview" and not disabled
+    # Rows are kept in file order rather than sorted by their ID values
+    assert [column.get("sort") for column in column_defs] == ["asc", None, None]
+    assert column_defs[0] == {"field": ROW_INDEX_FIELD, "hide": True, "sort": "asc"}
+
+    grid, outputs = poll(processing_state)
+    assert outputs[3] == "Preview done" and outputs[5]["streaming"] == []
+    assert len(grid) == processing_state["total_rows"] == app_services.client.calls == 50
+    assert all(row["echo"] == row["response"] for row in grid.values())
+    assert all(row[ROW_INDEX_FIELD] == row["UID"] for row in grid.values())
+
+
+def test_cancel_control_stops_the_run(app_services, tmp_path):
+    upload = make_upload(tmp_path, 200)
+    processing_state, *_ = start_preview(1, SCHEMA, upload, "UID", "response", 1)
+
+    context = contextvars.copy_context()
+    context.run(context_value.set, AttributeDict(triggered_inputs=[{"prop_id": "cancel-button.n_clicks", "value": 1}]))
+    assert context.run(control_job, None, None, 1, processing_state) == "Cancel requested"
+    assert app_services.engine.job_state(processing_state["job_id"]) == CANCELLED
+
+    grid, outputs = poll(processing_state)
+    assert outputs[3] == "Cancelled" and len(grid) < 50
+    assert len(grid) == app_services.engine.store.get_progress(processing_state["job_id"])["completed"]
+    assert "work on runs in progress" in control_job(None, None, 1, {**processing_state, "processing": False})
+
+
+def test_uploads_are_only_read_by_their_id(app_services, tmp_path):
+    upload = make_upload(tmp_path, 3)
+    request = {"startRow": 0, "endRow": 2}
+    assert len(load_input_rows(request, upload)["rowData"]) == 2
+
+    outside = tmp_path.parent / "secret.csv"
+    outside.write_text("UID,response\n0,secret\n")
+    # Paths, or ids that don't name a spooled upload, are refused
+    for forged in ({"path": str(outside)}, {"upload_id": "../secret"}, {"upload_id": "0" * 32}):
+        assert load_input_rows(request, {**forged, "total_rows": 1}) is dash.no_update
+        assert "upload" in start_preview(1, SCHEMA, forged, "UID", "response", 1)[4].lower()
@@ -0,0 +1,80 @@
+import json
+
+import httpx
+import pytest
+from fakes import TOOLS, make_queue, wait_for
+
+from data_rip.backends import UNLIMITED, make_backend
+from data_rip.engine import ExtractionEngine
+from data_rip.metrics import MetricsRecorder
+
+
+def chat_completion(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    arguments = json.dumps({"echo": body["messages"][-1]["content"]})
+    return httpx.Response(
+        200,
+        json={
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": [
+                            {"id": "call_1", "type": "function", "function": {"name": "f", "arguments": arguments}}
+                        ],
+                    },
+                }
+            ],
+            "usage": {"prompt_tokens": 20, "completion_tokens": 5, "total_tokens": 25},
+        },
+    )
+
+
+def test_local_backend_preset(monkeypatch):
+    for name in ("DATA_RIP_BASE_URL", "DATA_RIP_CONCURRENCY", "DATA_RIP_RPM", "DATA_RIP_ESCALATION_MODELS"):
+        monkeypatch.delenv(name, raising=False)
+    backend = make_backend("local")
+    assert backend.base_url == "http://127.0.0.1:8080/v1"
+    assert (backend.concurrency, backend.requests_per_minute) == (4, UNLIMITED)
+    assert backend.make_router() is None and not backend.priced
+
+    monkeypatch.setenv("DATA_RIP_BASE_URL", "http://gpu-box:8000/v1")
+    monkeypatch.setenv("DATA_RIP_CONCURRENCY", "2")
+    backend = make_backend("local")
+    assert (backend.base_url, backend.concurrency) == ("http://gpu-box:8000/v1", 2)
+    assert str(backend.make_client().base_url) == "http://gpu-box:8000/v1/"
+
+    with pytest.raises(ValueError, match="Unknown DATA_RIP_BACKEND"):
+        make_backend("elsewhere")
+
+
+def test_engine_extracts_through_a_backend_client():
+    backend = make_backend("local")
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return chat_completion(request)
+
+    client = backend.make_client(transport=httpx.MockTransport(handler))
+    engine = ExtractionEngine(
+        client,
+        max_workers=backend.concurrency,
+        scheduler=backend.make_scheduler(client),
+        metrics=MetricsRecorder(priced=backend.priced),
+    )
+    job_id = engine.submit(make_queue(["a", "b", "c"]), model="gpt-4o-mini")
+    wait_for(engine, job_id)
+
+    assert sorted(row["echo"] for row in engine.store.get_rows(job_id)) == ["a", "b", "c"]
+    assert {request.url.path for request in requests} == {"/v1/chat/completions"}
+    assert json.loads(requests[0].content)["tools"] == TOOLS
+    # A local model costs nothing, whatever name it is served under
+    assert engine.stats[job_id]["cost"] == 0
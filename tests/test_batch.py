@@ -0,0 +1,109 @@
+import json
+from types import SimpleNamespace
+
+from data_rip.batch import BatchRunner, batch_status, parse_batch_output, split_batch_requests
+from data_rip.jobs import MemoryJobStore, SQLiteJobStore
+
+
+class StubBatchClient:
+    """Local stand-in for the OpenAI files and batches endpoints.
+
+    A batch is "run" when it is retrieved: every request line whose text is
+    not ``fail`` gets a tool call echoing the text back. ``uploaded`` holds
+    the request lines of every input file.
+    """
+
+    def __init__(self):
+        self.files_by_id = {}
+        self.batch_files = {}
+        self.uploaded = []
+        self.files = SimpleNamespace(create=self.create_file, content=self.file_content)
+        self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.retrieve_batch)
+
+    def create_file(self, file, purpose):
+        assert purpose == "batch"
+        file_id = f"file-in-{len(self.files_by_id)}"
+        self.files_by_id[file_id] = [json.loads(line) for line in file.read().decode("utf-8").splitlines()]
+        self.uploaded.extend(self.files_by_id[file_id])
+        return SimpleNamespace(id=file_id)
+
+    def file_content(self, file_id):
+        return SimpleNamespace(text=self.files_by_id[file_id])
+
+    def create_batch(self, input_file_id, endpoint, completion_window):
+        assert endpoint == "/v1/chat/completions"
+        batch_id = f"batch-{len(self.batch_files) + 1}"
+        self.batch_files[batch_id] = input_file_id
+        return SimpleNamespace(id=batch_id, status="validating")
+
+    def retrieve_batch(self, batch_id):
+        output, errors = [], []
+        for request in self.files_by_id[self.batch_files[batch_id]]:
+            text = request["body"]["messages"][-1]["content"]
+            if text == "fail":
+                errors.append({"custom_id": request["custom_id"], "response": None, "error": {"message": "bad row"}})
+                continue
+            tool_call = {"function": {"arguments": json.dumps({"echo": text})}}
+            body = {"choices": [{"message": {"tool_calls": [tool_call]}}]}
+            output.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}})
+        self.files_by_id[f"{batch_id}-out"] = "\n".join(json.dumps(line) for line in output)
+        self.files_by_id[f"{batch_id}-err"] = "\n".join(json.dumps(line) for line in errors)
+        return SimpleNamespace(status="completed", output_file_id=f"{batch_id}-out", error_file_id=f"{batch_id}-err")
+
+
+def make_queue(texts):
+    return [
+        {"row": {"UID": 10 + i, "response": text}, "text_column": "response", "tools": [], "function_name": "f"}
+        for i, text in enumerate(texts)
+    ]
+
+
+def test_batch_runner_submits_polls_and_merges_by_id(tmp_path):
+    client = StubBatchClient()
+    store = MemoryJobStore()
+    runner = BatchRunner(client, store, batch_dir=str(tmp_path), poll_seconds=0)
+
+    job_id = runner.submit(make_queue(["a", "fail", "b"]), id_column="UID")
+    assert [request["custom_id"] for request in client.uploaded] == ["10", "11", "12"]
+    assert client.uploaded[0]["body"]["tool_choice"] == {"type": "function", "function": {"name": "f"}}
+    assert (tmp_path / f"{job_id}.jsonl").exists()
+
+    assert runner.poll(job_id) == "completed"
+    assert store.get_rows(job_id) == [{"UID": 10, "response": "a", "echo": "a"}, {"UID": 12, "response": "b", "echo": "b"}]
+    assert store.get_errors(job_id) == [{"index": 1, "row": {"UID": 11, "response": "fail"}, "error": "bad row"}]
+    assert store.get_progress(job_id)["done"]
+
+
+def test_parse_batch_output_reports_unparseable_tool_calls():
+    line = {"custom_id": "1", "response": {"status_code": 200, "body": {"choices": [{"message": {}}]}}}
+    assert "error" in parse_batch_output(json.dumps(line))["1"]
+
+
+def test_batch_runner_polls_batches_submitted_before_a_restart(tmp_path):
+    client = StubBatchClient()
+    path = str(tmp_path / "jobs.db")
+    job_id = BatchRunner(client, SQLiteJobStore(path), batch_dir=str(tmp_path)).submit(
+        make_queue(["a", "fail", "b"]), id_column="UID"
+    )
+
+    store = SQLiteJobStore(path)
+    assert BatchRunner(client, store, batch_dir=str(tmp_path)).poll(job_id) == "completed"
+    assert [row["echo"] for row in store.get_rows(job_id)] == ["a", "b"]
+    assert store.get_progress(job_id)["done"]
+
+
+def test_batch_runner_splits_queues_over_the_batch_limits(tmp_path):
+    client = StubBatchClient()
+    store = MemoryJobStore()
+    runner = BatchRunner(client, store, batch_dir=str(tmp_path), poll_seconds=0, max_requests=2)
+
+    job_id = runner.submit(make_queue(["a", "b", "c", "d", "fail"]), id_column="UID")
+    assert [len(batch["rows"]) for batch in store.get_batches(job_id)] == [2, 2, 1]
+    assert runner.poll(job_id) == "completed"
+    assert [row["UID"] for row in store.get_rows(job_id)] == [10, 11, 12, 13]
+    assert store.get_progress(job_id)["failed"] == 1
+
+    requests = [{"custom_id": str(i), "body": "x" * 100} for i in range(5)]
+    assert [len(part) for part in split_batch_requests(requests, max_bytes=300)] == [2, 2, 1]
+    assert batch_status(["completed", "in_progress"]) == "in_progress"
+    assert batch_status(["completed", "expired"]) == "expired"
@@ -0,0 +1,39 @@
+from data_rip.cache import ResultCache, cache_key, schema_digest
+
+
+def test_cache_key_depends_on_schema_model_and_text():
+    digest = schema_digest([{"type": "function"}], "gpt-4o-mini", "prompt")
+
+    assert cache_key(digest, "a") == cache_key(schema_digest([{"type": "function"}], "gpt-4o-mini", "prompt"), "a")
+    assert cache_key(digest, "a") != cache_key(digest, "b")
+    assert digest != schema_digest([{"type": "function"}], "gpt-4o", "prompt")
+    assert digest != schema_digest([], "gpt-4o-mini", "prompt")
+
+
+def test_cache_persists_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(path, max_entries=3)
+    for key in ["a", "b", "c"]:
+        cache.put(key, {"value": key})
+    assert cache.get("a") == {"value": "a"}  # "b" is now the least recently used
+
+    cache.put("d", {"value": "d"})
+
+    reopened = ResultCache(path, max_entries=3)
+    assert len(reopened) == 3
+    assert reopened.get("b") is None
+    assert reopened.get("a") == {"value": "a"}
+    assert reopened.get("d") == {"value": "d"}
+
+
+def test_cache_looks_up_keys_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr("data_rip.cache.LOOKUP_BATCH", 2)
+    cache = ResultCache(str(tmp_path / "cache.db"), max_entries=4)
+    for key in ["a", "b", "c", "d"]:
+        cache.put(key, {"value": key})
+    assert cache._conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+    # Hits are marked used in the order they were asked for, so "b" is now the least recently used
+    assert cache.get_many(["c", "x", "a", "c"]) == {"c": {"value": "c"}, "a": {"value": "a"}}
+    cache.put("e", {"value": "e"})
+    assert cache.get_many(["a", "b", "c", "d", "e"]).keys() == {"a", "c", "d", "e"}
@@ -0,0 +1,55 @@
+from data_rip.chunking import merge_results, split_text
+from data_rip.packing import estimate_tokens
+
+PARAMETERS = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "people": {"type": "array", "items": {"type": "string"}},
+        "address": {"type": "object", "properties": {"city": {"type": "string"}, "zip": {"type": "string"}}},
+    },
+}
+
+
+def test_split_text_keeps_short_text_whole():
+    assert split_text("short text", max_tokens=100) == ["short text"]
+
+
+def test_split_text_overlaps_chunks_at_word_boundaries():
+    text = " ".join(f"word{i}" for i in range(500))
+    chunks = split_text(text, max_tokens=100, overlap_tokens=10)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 101 for chunk in chunks)
+    # Every chunk but the last ends on a word boundary, and the next one repeats its tail
+    for chunk, following in zip(chunks, chunks[1:]):
+        assert chunk.endswith(" ")
+        assert following.split()[0] in chunk.split()[-10:]
+    assert chunks[-1].endswith("word499")
+    assert set(text.split()) == {word for chunk in chunks for word in chunk.split()}
+
+
+def test_merge_results_concatenates_arrays_and_keeps_first_scalars():
+    partials = [
+        {"title": None, "people": ["Ann", "Bob"], "address": {"city": "Oslo", "zip": None}},
+        {"title": "Minutes", "people": ["Bob", "Cid"], "address": {"city": "Bergen", "zip": "0150"}},
+        {"title": "Other", "people": None, "extra": 1},
+    ]
+
+    assert merge_results(PARAMETERS, partials) == {
+        "title": "Minutes",
+        "people": ["Ann", "Bob", "Cid"],
+        "address": {"city": "Oslo", "zip": "0150"},
+        "extra": 1,
+    }
+
+
+def test_merge_results_keeps_repeats_outside_the_overlap():
+    partials = [
+        {"people": ["Ann", "Bob", "Ann", "Cid"]},
+        {"people": ["Cid", "Ann", "Dan"]},
+        {"people": ["Bob"]},
+    ]
+
+    # Only the "Cid" at the end of the first chunk and the start of the second is the same mention
+    assert merge_results(PARAMETERS, partials)["people"] == ["Ann", "Bob", "Ann", "Cid", "Ann", "Dan", "Bob"]
@@ -0,0 +1,133 @@
+from fakes import FakeClient, make_queue, wait_for
+
+from data_rip.cache import ResultCache
+from data_rip.engine import ExtractionEngine
+from data_rip.jobs import SQLiteJobStore
+
+
+def test_engine_runs_rows_concurrently():
+    client = FakeClient(delay=0.05)
+    engine = ExtractionEngine(client, max_workers=4)
+    job_id = engine.submit(make_queue([f"text {i}" for i in range(12)]))
+    wait_for(engine, job_id)
+
+    rows = engine.store.get_rows(job_id)
+    assert client.max_in_flight == 4
+    assert sorted(row["UID"] for row in rows) == list(range(12))
+    assert {"UID": 3, "response": "text 3", "echo": "text 3"} in rows
+    assert engine.store.get_progress(job_id)["extracted_keys"] == ["echo"]
+
+
+def test_engine_records_failed_rows():
+    engine = ExtractionEngine(FakeClient(fail_on="bad"), max_workers=2)
+    job_id = engine.submit(make_queue(["ok", "bad", "ok"]))
+    wait_for(engine, job_id)
+
+    assert len(engine.store.get_rows(job_id)) == 2
+    assert [error["index"] for error in engine.store.get_errors(job_id)] == [1]
+
+
+def test_engine_deduplicates_rows_and_serves_cached_results(tmp_path):
+    client = FakeClient()
+    engine = ExtractionEngine(client, max_workers=2, cache=ResultCache(str(tmp_path / "cache.db")))
+    calls = []
+    create = client.chat.completions.create
+    client.chat.completions.create = lambda **kwargs: calls.append(kwargs) or create(**kwargs)
+
+    job_id = engine.submit(make_queue(["same", "other", "same"]))
+    wait_for(engine, job_id)
+    assert len(calls) == 2
+    assert len(engine.store.get_rows(job_id)) == 3
+    assert engine.stats[job_id].items() >= {"cache_hits": 0, "cache_misses": 2, "duplicates": 1}.items()
+
+    job_id = engine.submit(make_queue(["same", "other", "new"]))
+    wait_for(engine, job_id)
+    assert len(calls) == 3
+    assert engine.stats[job_id].items() >= {"cache_hits": 2, "cache_misses": 1, "duplicates": 0}.items()
+
+
+def test_engine_packs_rows_and_falls_back_for_missing_results():
+    client = FakeClient(drop_in_pack="text 2")
+    engine = ExtractionEngine(client, max_workers=1)
+    job_id = engine.submit(make_queue([f"text {i}" for i in range(5)]), pack_size=3)
+    wait_for(engine, job_id)
+
+    rows = sorted(engine.store.get_rows(job_id), key=lambda row: row["UID"])
+    assert [row["echo"] for row in rows] == [f"text {i}" for i in range(5)]
+    # Two packed calls plus one single-row retry for the dropped row
+    assert engine.stats[job_id]["requests"] == 3
+    assert engine.stats[job_id]["pack_fallbacks"] == 1
+    assert engine.throughput(job_id)["requests_per_row"] == 3 / 5
+
+
+def test_engine_resumes_job_skipping_checkpointed_rows(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    texts = ["ok", "bad", "ok too"]
+    engine = ExtractionEngine(FakeClient(fail_on="bad"), store=store, max_workers=2)
+    job_id = engine.submit(make_queue(texts), job_id="job", id_column="UID")
+    wait_for(engine, job_id)
+    assert store.get_progress(job_id)["failed"] == 1
+
+    # A fresh engine, as after a server restart, only re-runs the failed row
+    client = FakeClient()
+    restarted = ExtractionEngine(client, store=SQLiteJobStore(str(tmp_path / "jobs.db")), max_workers=2)
+    assert restarted.submit(make_queue(texts), job_id="job", id_column="UID") == "job"
+    wait_for(restarted, "job")
+
+    assert restarted.stats["job"]["resumed"] == 2
+    assert client.calls == 1
+    assert sorted(row["UID"] for row in restarted.store.get_rows("job")) == [0, 1, 2]
+    assert restarted.store.get_errors("job") == []
+
+
+def test_engine_sends_invalid_answers_again_then_fails_them():
+    client = FakeClient(invalid_on="flaky", invalid_times=1)
+    engine = ExtractionEngine(client, max_workers=1)
+    job_id = engine.submit(make_queue(["flaky", "ok"]))
+    wait_for(engine, job_id)
+    assert {"UID": 0, "response": "flaky", "echo": "flaky"} in engine.store.get_rows(job_id)
+    assert engine.stats[job_id]["invalid"] == 1
+
+    engine = ExtractionEngine(FakeClient(invalid_on="bad"), max_workers=1)
+    job_id = engine.submit(make_queue(["bad", "ok"]))
+    wait_for(engine, job_id)
+    assert [row["UID"] for row in engine.store.get_rows(job_id)] == [1]
+    [error] = engine.store.get_errors(job_id)
+    assert error["index"] == 0
+    assert "did not match the schema" in error["error"]
+    assert engine.stats[job_id]["invalid"] == 2
+
+
+def test_engine_extracts_long_rows_in_chunks_and_merges_them():
+    client = FakeClient(delay=0.01)
+    engine = ExtractionEngine(client, max_workers=4)
+    long_text = " ".join(f"word{i}" for i in range(400))
+    job_id = engine.submit(make_queue(["short", long_text]), chunk_tokens=100)
+    wait_for(engine, job_id)
+
+    rows = {row["UID"]: row for row in engine.store.get_rows(job_id)}
+    stats = engine.stats[job_id]
+    assert stats["chunked_rows"] == 1
+    assert client.calls == 1 + stats["chunks"] > 2
+    # Scalars keep the first chunk's value
+    assert rows[1]["echo"].startswith("word0 ") and not rows[1]["echo"].endswith("word399")
+    assert rows[0]["echo"] == "short"
+
+
+def test_engine_forgets_the_oldest_finished_jobs():
+    engine = ExtractionEngine(FakeClient(delay=0.01), max_workers=2, job_history=2)
+    running = engine.submit(make_queue([f"row {i}" for i in range(10)]))
+    engine.pause(running)
+    finished = []
+    for i in range(3):
+        finished.append(engine.submit(make_queue([f"text {i}"])))
+        wait_for(engine, finished[-1])
+
+    # The paused job is still running and kept, the older finished ones are forgotten
+    assert set(engine.stats) == {running, finished[2]}
+    assert engine.job_state(finished[0]) is None and engine.trace(finished[0])["calls"] == []
+    assert not engine.store.has_job(finished[0]) and not engine.store.has_job(finished[1])
+    assert engine.store.get_progress(finished[2])["done"]
+    engine.resume(running)
+    wait_for(engine, running)
+    assert engine.trace(running)["calls"]
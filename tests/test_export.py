@@ -0,0 +1,57 @@
+import csv
+import io
+import json
+
+import pytest
+
+from data_rip.export import export_fieldnames, stream_export
+from data_rip.jobs import SQLiteJobStore
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "age": {"type": "integer"},
+        "friends": {"type": "array", "items": {"type": "object", "properties": {"name": {"type": "string"}}}},
+    },
+    "required": ["name"],
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    store.create_job("job", total_rows=3, model="gpt-4o-mini", id_column="UID", schema=SCHEMA)
+    store.add_result("job", 1, {"UID": 1, "response": "b"}, {"age": 30, "name": "Bo", "friends": [{"name": "Al"}]})
+    store.add_result("job", 0, {"UID": 0, "response": "a"}, {"name": "Al", "age": None, "friends": []})
+    return store
+
+
+def test_export_streams_csv_and_jsonl_pages(store):
+    assert export_fieldnames(store, "job", store.get_rows("job")) == ["UID", "response", "name", "age", "friends"]
+
+    chunks = list(stream_export(store, "job", "csv", page_size=1))
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode())))
+    assert [row["name"] for row in rows] == ["Bo", "Al"]
+    assert json.loads(rows[0]["friends"]) == [{"name": "Al"}]
+
+    lines = b"".join(stream_export(store, "job", "jsonl")).decode().splitlines()
+    assert json.loads(lines[1]) == {"UID": 0, "response": "a", "name": "Al", "age": None, "friends": []}
+
+
+def test_export_of_a_job_without_rows_is_only_the_header(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    store.create_job("job", total_rows=1, model="gpt-4o-mini", schema=SCHEMA)
+    assert b"".join(stream_export(store, "job", "csv")) == b"name,age,friends\r\n"
+
+
+def test_export_types_parquet_columns_from_the_schema(store):
+    pq = pytest.importorskip("pyarrow.parquet")
+    pa = pytest.importorskip("pyarrow")
+
+    table = pq.read_table(io.BytesIO(b"".join(stream_export(store, "job", "parquet"))))
+    assert table.schema.field("UID").type == pa.string()
+    assert table.schema.field("age").type == pa.int64()
+    assert table.schema.field("friends").type == pa.list_(pa.struct([("name", pa.string())]))
+    assert table.to_pylist()[0] == {"UID": "1", "response": "b", "name": "Bo", "age": 30, "friends": [{"name": "Al"}]}
@@ -0,0 +1,82 @@
+import json
+import subprocess
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from fakes import FakeClient, make_queue  # noqa: E402
+
+from data_rip import extract_file  # noqa: E402
+from data_rip.cli import parse_args  # noqa: E402
+from data_rip.engine import ExtractionEngine  # noqa: E402
+from data_rip.jobs import MemoryJobStore  # noqa: E402
+
+SCHEMA = {"properties": {"echo": {"type": "string"}}, "required": ["echo"]}
+
+
+@pytest.fixture
+def input_csv(tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_text('UID,response,other\n0,first,x\n1,"second\nline",y\n2,first,z\n')
+    return str(path)
+
+
+@pytest.mark.parametrize("extension", [".csv", ".jsonl"])
+def test_extract_file_streams_results(input_csv, tmp_path, extension):
+    output = str(tmp_path / f"output{extension}")
+    progress = []
+    result = extract_file(
+        input_csv,
+        output,
+        "UID",
+        "response",
+        SCHEMA,
+        client=FakeClient(),
+        use_cache=False,
+        store=MemoryJobStore(),
+        on_progress=progress.append,
+        poll_seconds=0.01,
+    )
+
+    assert result["completed"] == 3
+    assert result["errors"] == []
+    assert progress[-1]["done"]
+    with open(output) as f:
+        if extension == ".jsonl":
+            rows = [json.loads(line) for line in f]
+            assert sorted(row["UID"] for row in rows) == [0, 1, 2]
+            assert {"UID": 1, "response": "second\nline", "echo": "second\nline"} in rows
+        else:
+            assert f.readline().strip() == "UID,response,echo"
+
+
+def test_cli_requires_a_schema_source():
+    args = parse_args(["in.csv", "-o", "out.parquet", "--id-column", "UID", "--text-column", "response", "--schema", "s.json"])
+    assert (args.schema, args.instruction, args.pack_size) == ("s.json", None, 1)
+    with pytest.raises(SystemExit):
+        parse_args(["in.csv", "-o", "out.csv", "--id-column", "UID", "--text-column", "response"])
+
+
+def test_library_import_does_not_load_dash():
+    code = "import sys, data_rip; assert not any(name.startswith('dash') for name in sys.modules)"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_extract_file_stops_its_threads_and_closes_what_it_opened(input_csv, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_RIP_JOB_DB", str(tmp_path / "jobs.db"))
+    monkeypatch.setenv("DATA_RIP_CACHE_PATH", str(tmp_path / "cache.db"))
+    client = FakeClient()
+    started = threading.active_count()
+    for run in range(3):
+        extract_file(input_csv, str(tmp_path / f"output{run}.csv"), "UID", "response", SCHEMA, client=client)
+        assert threading.active_count() == started
+
+    engine = ExtractionEngine(client, max_workers=2)
+    engine.submit(make_queue(["a"]))
+    engine.close()
+    assert threading.active_count() == started
+    with pytest.raises(RuntimeError):
+        engine.submit(make_queue(["b"]))
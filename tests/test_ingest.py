@@ -0,0 +1,73 @@
+import base64
+import os
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from data_rip.ingest import (  # noqa: E402
+    count_rows,
+    iter_rows,
+    prune_uploads,
+    range_offsets,
+    read_columns,
+    read_page,
+    resolve_upload,
+    spool_upload,
+    upload_id,
+)
+
+CSV = 'UID,response,other\n0,"multi\nline text",x\n1,short,y\n2,last,z\n'
+
+
+@pytest.fixture
+def spooled(tmp_path, monkeypatch):
+    monkeypatch.setattr("data_rip.ingest.DECODE_BLOCK_CHARS", 8)
+    contents = "data:text/csv;base64," + base64.b64encode(CSV.encode()).decode()
+    return spool_upload(contents, "data.csv", upload_dir=str(tmp_path))
+
+
+def test_spool_upload_decodes_in_blocks(spooled):
+    with open(spooled) as f:
+        assert f.read() == CSV
+    assert spool_upload("data:,", "notes.txt") is None
+
+
+def test_spooled_upload_reads(spooled):
+    assert read_columns(spooled) == ["UID", "response", "other"]
+    assert count_rows(spooled) == 3
+    assert read_page(spooled, 1, 3) == [{"UID": 1, "response": "short", "other": "y"}, {"UID": 2, "response": "last", "other": "z"}]
+    assert list(iter_rows(spooled, ["UID", "response"], chunksize=2))[0] == {"UID": 0, "response": "multi\nline text"}
+
+
+def test_uploads_resolve_by_id_and_expire(spooled, tmp_path):
+    upload = upload_id(spooled)
+    assert resolve_upload(upload, str(tmp_path)) == spooled
+    for forged in ("../" + upload, spooled, None):
+        with pytest.raises(ValueError):
+            resolve_upload(forged, str(tmp_path))
+
+    (tmp_path / "notes.csv").write_text("kept")
+    assert prune_uploads(str(tmp_path), max_age_hours=1) == 0
+    os.utime(spooled, (0, 0))
+    assert prune_uploads(str(tmp_path), max_age_hours=1) == 1
+    assert os.listdir(tmp_path) == ["notes.csv"]
+    with pytest.raises(ValueError):
+        resolve_upload(upload, str(tmp_path))
+
+
+def test_ranges_are_read_from_their_byte_offset(tmp_path):
+    import pandas as pd
+
+    path = str(tmp_path / "rows.csv")
+    texts = ['plain', 'with "quotes"', 'spans\n\nlines, "quoted"', '"', 'ends with a quote"', "a,b"]
+    pd.DataFrame({"UID": range(30), "response": [texts[i % len(texts)] for i in range(30)]}).to_csv(path, index=False)
+    with open(path, "a") as f:
+        f.write("\n30,after a blank line\n")
+
+    offsets = range_offsets(path, 4)
+    assert len(offsets) == 8
+    for start, offset in zip(range(0, 31, 4), offsets):
+        end = min(start + 4, 31)
+        expected = read_page(path, start, end, ["UID", "response"])
+        assert read_page(path, start, end, ["UID", "response"], offset=offset) == expected
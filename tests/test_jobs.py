@@ -0,0 +1,99 @@
+import pytest
+
+from data_rip.jobs import MemoryJobStore, SQLiteJobStore, job_key
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / "jobs.db"))
+
+
+def test_store_pages_results_in_completion_order(store):
+    store.create_job("job", total_rows=3, model="gpt-4o-mini")
+    store.add_result("job", 2, {"UID": 2}, {"name": "c"})
+    store.add_result("job", 0, {"UID": 0}, {"name": "a", "age": 1})
+    store.add_error("job", 1, {"UID": 1}, "boom")
+
+    assert store.get_rows("job", offset=0, limit=1) == [{"UID": 2, "name": "c"}]
+    assert store.get_rows("job", offset=1) == [{"UID": 0, "name": "a", "age": 1}]
+    assert [row["_index"] for row in store.get_rows("job", index_field="_index")] == [2, 0]
+    assert store.get_errors("job") == [{"index": 1, "row": {"UID": 1}, "error": "boom"}]
+    assert store.get_progress("job") == {
+        "total_rows": 3,
+        "completed": 2,
+        "failed": 1,
+        "extracted_keys": ["name", "age"],
+        "id_column": None,
+        "done": True,
+    }
+
+
+def test_store_unknown_job(store):
+    assert store.get_progress("missing") is None
+    assert not store.has_job(None)
+
+
+def test_sqlite_store_survives_reopen(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    SQLiteJobStore(path).create_job("job", total_rows=1, model="gpt-4o-mini")
+    SQLiteJobStore(path).add_result("job", 0, {"UID": 0}, {"name": "a"})
+
+    assert SQLiteJobStore(path).get_rows("job") == [{"UID": 0, "name": "a"}]
+
+
+def test_store_checkpoints_rows_by_id(store):
+    store.create_job("job", total_rows=2, model="gpt-4o-mini", id_column="UID")
+    store.add_result("job", 0, {"UID": "a-1"}, {"name": "a"})
+    store.add_error("job", 1, {"UID": "a-2"}, "boom")
+    store.clear_errors("job")
+
+    assert store.completed_row_keys("job") == {"a-1"}
+    assert store.get_progress("job")["failed"] == 0
+
+
+def test_store_keeps_the_first_result_of_a_row_added_twice(store):
+    store.create_job("job", total_rows=3, model="gpt-4o-mini", id_column="UID")
+    for uid in ("a", "b", "a", "c"):
+        store.add_result("job", 0, {"UID": uid}, {"name": uid})
+
+    assert [row["UID"] for row in store.get_rows("job")] == ["a", "b", "c"]
+    assert [row["UID"] for row in store.get_rows("job", offset=2)] == ["c"]
+    assert store.get_progress("job")["completed"] == 3
+
+def test_store_prunes_all_but_the_latest_jobs(store):
+    for job_id in ("a", "b", "c", "d"):
+        store.create_job(job_id, total_rows=1, model="gpt-4o-mini")
+        store.add_result(job_id, 0, {"UID": 0}, {"name": job_id})
+        store.add_error(job_id, 0, {"UID": 0}, "boom")
+
+    # "a" is still running, so it is kept and counts as the most recently used
+    assert store.prune(2, keep=["a"]) == ["b", "c"]
+    assert [job_id for job_id in "abcd" if store.has_job(job_id)] == ["a", "d"]
+    assert store.get_rows("d") == [{"UID": 0, "name": "d"}]
+    # A pruned job starts over when it is run again
+    store.create_job("b", total_rows=1, model="gpt-4o-mini")
+    assert store.get_rows("b") == [] and store.get_errors("b") == []
+    assert store.prune(1) == ["d", "a"]
+    assert store.prune(1) == []
+
+
+def test_job_key_is_stable_per_file_and_schema():
+    tools = [{"type": "function"}]
+
+    assert job_key("abc", tools, "gpt-4o-mini", "UID", "response") == job_key("abc", tools, "gpt-4o-mini", "UID", "response")
+    assert job_key("abc", tools, "gpt-4o-mini", "UID", "response") != job_key("abd", tools, "gpt-4o-mini", "UID", "response")
+    assert job_key("abc", tools, "gpt-4o-mini", "UID", "response") != job_key("abc", [], "gpt-4o-mini", "UID", "response")
+
+
+def test_store_keeps_job_schema_and_iterates_results_in_pages(store):
+    schema = {"type": "object", "properties": {"name": {"type": "string"}}, "required": []}
+    store.create_job("job", total_rows=5, model="gpt-4o-mini", schema=schema)
+    for index in range(5):
+        store.add_result("job", index, {"UID": index}, {"name": str(index)})
+
+    assert store.get_schema("job") == schema
+    pages = list(store.iter_results("job", page_size=2))
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [row["UID"] for page in pages for row in page] == [0, 1, 2, 3, 4]
@@ -0,0 +1,43 @@
+from fakes import FakeClient, make_queue, wait_for
+
+from data_rip.engine import ExtractionEngine
+from data_rip.metrics import MetricsRecorder, estimate_cost
+
+
+def test_estimate_cost_matches_longest_model_prefix():
+    assert estimate_cost("gpt-4o-mini-2024-07-18", 1_000_000, 0) == 0.15
+    assert estimate_cost("gpt-4o", 0, 1_000_000) == 10.0
+    assert estimate_cost("local-llama", 1000, 1000) == 0.0
+
+
+def test_recorder_renders_prometheus_text():
+    metrics = MetricsRecorder(trace_limit=2)
+    metrics.record_call("job", "gpt-4o-mini", "single", 0.3, prompt_tokens=100, completion_tokens=20, retries=1)
+    metrics.record_call("job", "gpt-4o-mini", "single", 7.0, error="boom")
+    metrics.record_call("job", "gpt-4o-mini", "pack", 0.01, rows=4)
+
+    # Only the most recent calls are kept for the trace
+    assert [call["kind"] for call in metrics.trace("job")] == ["single", "pack"]
+    text = metrics.render_prometheus()
+    assert 'data_rip_requests_total{model="gpt-4o-mini",status="ok"} 2' in text
+    assert 'data_rip_requests_total{model="gpt-4o-mini",status="error"} 1' in text
+    assert 'data_rip_retries_total{model="gpt-4o-mini"} 1' in text
+    assert 'data_rip_tokens_total{model="gpt-4o-mini",type="prompt"} 100' in text
+    assert 'data_rip_request_latency_seconds_bucket{model="gpt-4o-mini",le="0.05"} 1' in text
+    assert 'data_rip_request_latency_seconds_bucket{model="gpt-4o-mini",le="0.5"} 2' in text
+    assert 'data_rip_request_latency_seconds_bucket{model="gpt-4o-mini",le="+Inf"} 3' in text
+    assert 'data_rip_request_latency_seconds_count{model="gpt-4o-mini"} 3' in text
+
+
+def test_engine_records_every_call_in_the_job_trace():
+    engine = ExtractionEngine(FakeClient(fail_on="bad"), max_workers=2)
+    job_id = engine.submit(make_queue(["a", "b", "bad"]), model="gpt-4o-mini")
+    wait_for(engine, job_id)
+
+    trace = engine.trace(job_id)
+    calls = trace["calls"]
+    assert len(calls) == 3
+    assert sorted(call["error"] or "" for call in calls) == ["", "", "boom"]
+    assert trace["stats"]["cost"] == sum(call["cost"] for call in calls) > 0
+    assert trace["throughput"]["eta_seconds"] == 0
+    assert trace["progress"]["failed"] == 1
@@ -0,0 +1,36 @@
+from fakes import FakeClient, make_queue, wait_for
+
+from data_rip.engine import ExtractionEngine
+from data_rip.near_duplicates import NearDuplicateFinder
+
+TEMPLATE = "Customer {} called about their order, the parcel arrived damaged and they would like a full refund."
+
+
+def test_finder_clusters_only_close_texts():
+    texts = [
+        TEMPLATE.format("Jane Doe"),
+        TEMPLATE.format("jane  doe").upper(),
+        TEMPLATE.format("Jane Do"),
+        TEMPLATE.format("Alexander Hamilton-Smythe"),
+        "The weather was lovely today and nobody called.",
+        "",
+    ]
+    assert NearDuplicateFinder(0.9).representatives(texts) == [0, 0, 0, 3, 4, 5]
+    # A lower minimum similarity takes in the looser match too
+    assert NearDuplicateFinder(0.6).representatives(texts)[3] == 0
+    assert NearDuplicateFinder(0.9).representatives([]) == []
+
+
+def test_engine_extracts_once_per_cluster():
+    client = FakeClient()
+    engine = ExtractionEngine(client, max_workers=2, near_duplicates=NearDuplicateFinder(0.9))
+    texts = [TEMPLATE.format("Jane Doe"), TEMPLATE.format("Jane Do"), TEMPLATE.format("Jane Doe"), "Something else"]
+    job_id = engine.submit(make_queue(texts))
+    wait_for(engine, job_id)
+
+    assert client.calls == 2
+    rows = {row["UID"]: row for row in engine.store.get_rows(job_id)}
+    assert rows[1]["echo"] == texts[0] and rows[3]["echo"] == "Something else"
+    stats = engine.stats[job_id]
+    assert (stats["duplicates"], stats["near_duplicates"]) == (1, 1)
+    assert engine.throughput(job_id)["reduction_factor"] == 2
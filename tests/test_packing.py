@@ -0,0 +1,34 @@
+from data_rip.packing import build_packed_tools, pack_rows, parse_packed_results
+
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "extraction_function",
+            "parameters": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}},
+                "required": ["name"],
+            },
+        },
+    }
+]
+
+
+def test_packed_tools_wrap_the_row_schema():
+    items = build_packed_tools(TOOLS)[0]["function"]["parameters"]["properties"]["results"]["items"]
+
+    assert items["properties"] == {"row_id": {"type": "string"}, "name": {"type": "string"}}
+    assert items["required"] == ["row_id", "name"]
+
+
+def test_pack_rows_respects_row_and_token_limits():
+    assert pack_rows([1, 2, 3, 4, 5], ["a"] * 5, max_rows=2) == [[1, 2], [3, 4], [5]]
+    assert pack_rows([1, 2, 3], ["a" * 40, "a" * 40, "a"], max_rows=10, max_tokens=15) == [[1], [2, 3]]
+
+
+def test_parse_packed_results_skips_unknown_and_malformed_rows():
+    arguments = '{"results": [{"row_id": "1", "name": "a"}, {"row_id": "9", "name": "b"}, "junk"]}'
+
+    assert parse_packed_results(arguments, ["1", "2"]) == {"1": {"name": "a"}}
+    assert parse_packed_results("not json", ["1"]) == {}
@@ -0,0 +1,77 @@
+import time
+
+from fakes import FakeClient, make_queue, wait_for
+
+from data_rip.cache import ResultCache
+from data_rip.engine import ExtractionEngine
+from data_rip.jobs import SQLiteJobStore
+from data_rip.preview import project_run, stratified_sample
+from data_rip.ratelimit import RequestScheduler
+
+
+def test_stratified_sample_spreads_over_text_lengths():
+    texts = ["x" * length for length in range(1, 101)]
+    sample = stratified_sample(texts, size=10, bands=5)
+
+    assert len(sample) == 10 and sample == sorted(set(sample))
+    # Two rows from each fifth of the length range
+    assert [sum(band * 20 <= index < (band + 1) * 20 for index in sample) for band in range(5)] == [2] * 5
+    assert stratified_sample(texts, size=10, bands=5) == sample
+    assert stratified_sample(texts[:3], size=10) == [0, 1, 2]
+
+
+def test_preview_projects_the_full_run_and_is_reused_by_it():
+    client = FakeClient(delay=0.01)
+    engine = ExtractionEngine(client, max_workers=4, scheduler=RequestScheduler(client, 60, 1_000_000))
+    queue = make_queue([f"row {i}" for i in range(40)])
+    sample = [0, 10, 20, 30]
+    job_id = engine.submit(queue, job_id="job", only_rows=sample)
+    while engine.running(job_id):
+        time.sleep(0.01)
+
+    assert sorted(row["UID"] for row in engine.store.get_rows(job_id)) == sample
+    projection = project_run(engine, job_id, len(sample))
+    assert (projection["rows"], projection["remaining_rows"]) == (4, 36)
+    assert projection["tokens_per_row"] == 16
+    # 36 more calls at 60 a minute
+    assert projection["limited_by"] == "requests per minute"
+    assert round(projection["projected_seconds"]) == 36
+
+    engine.submit(queue, job_id="job")
+    wait_for(engine, job_id)
+    assert client.calls == 40
+    assert engine.stats[job_id]["resumed"] == 4
+
+
+def test_full_run_submitted_while_the_preview_runs_queues_the_rest():
+    client = FakeClient(delay=0.1)
+    engine = ExtractionEngine(client, max_workers=2)
+    queue = make_queue([f"row {i}" for i in range(20)])
+    engine.submit(queue, job_id="job", only_rows=[0, 5, 10, 15])
+    time.sleep(0.02)
+    engine.submit(queue, job_id="job")
+    wait_for(engine, "job")
+
+    assert engine.store.get_progress("job")["completed"] == 20
+    # The sampled rows still in flight aren't sent twice
+    assert client.calls == 20
+
+
+def test_preview_projection_counts_cache_hits_apart_and_survives_a_restart(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    cache = ResultCache(str(tmp_path / "cache.db"))
+    engine = ExtractionEngine(FakeClient(delay=0.01), store=store, max_workers=4, cache=cache)
+    wait_for(engine, engine.submit(make_queue(["row 0", "row 10"])))
+    queue = make_queue([f"row {i}" for i in range(40)])
+    job_id = engine.submit(queue, job_id="job", only_rows=[0, 10, 20, 30])
+    while engine.running(job_id):
+        time.sleep(0.01)
+
+    projection = project_run(engine, job_id, 4)
+    assert (projection["rows"], projection["cache_hits"], projection["remaining_rows"]) == (2, 2, 36)
+    assert projection["tokens_per_row"] == 16
+
+    # A new engine on the same store has no measurements of the preview, only its progress
+    restarted = project_run(ExtractionEngine(FakeClient(), store=store), job_id, 4)
+    assert (restarted["rows"], restarted["remaining_rows"], restarted["mean_latency"]) == (4, 36, None)
+    assert project_run(ExtractionEngine(FakeClient(), store=store), "missing", 4) is None
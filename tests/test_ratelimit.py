@@ -0,0 +1,70 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from data_rip.ratelimit import RequestScheduler, TokenBucket, parse_reset
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FlakyClient:
+    """Raises the queued errors in turn before answering."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "response"
+
+
+def make_scheduler(client, **kwargs):
+    return RequestScheduler(client, base_delay=0.001, max_delay=0.01, **kwargs)
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(limit=600)  # ten per second
+    bucket.acquire(600)
+    start = time.monotonic()
+    bucket.acquire(2)
+    assert 0.15 < time.monotonic() - start < 1.0
+
+
+def test_token_bucket_follows_reported_budget():
+    bucket = TokenBucket(limit=100)
+    bucket.update(limit=1000, remaining=5)
+    assert bucket.limit == 1000
+    assert bucket.level == pytest.approx(5, abs=1)
+
+
+def test_parse_reset():
+    assert parse_reset("6m0s") == 360
+    assert parse_reset("1.5s") == 1.5
+    assert parse_reset("20ms") == pytest.approx(0.02)
+
+
+def test_scheduler_retries_transient_errors():
+    client = FlakyClient([StatusError(429), StatusError(503)])
+    retries = []
+
+    assert make_scheduler(client).create(on_retry=lambda: retries.append(1), model="m", messages=[]) == "response"
+    assert client.calls == 3
+    assert len(retries) == 2
+
+
+def test_scheduler_gives_up():
+    with pytest.raises(StatusError):
+        make_scheduler(FlakyClient([StatusError(400)])).create(model="m", messages=[])
+    client = FlakyClient([StatusError(500)] * 3)
+    with pytest.raises(StatusError):
+        make_scheduler(client, max_retries=2).create(model="m", messages=[])
+    assert client.calls == 3
@@ -0,0 +1,77 @@
+import inspect
+import json
+
+import httpx
+import openai
+from fakes import TOOLS, FakeClient, make_queue, wait_for
+from openai.resources.chat.completions import Completions
+
+from data_rip.engine import ExtractionEngine, build_request
+from data_rip.ratelimit import RequestScheduler
+from data_rip.request_builder import RequestBuilder
+
+
+def test_requests_share_one_frozen_prefix():
+    builder = RequestBuilder(TOOLS, "f", "gpt-4o-mini", prompt_cache_key=True)
+    first, second = builder.single("row one", "gpt-4o-mini"), builder.single("row two", "gpt-4o")
+
+    assert first["messages"][0] is second["messages"][0]
+    assert first["tools"] is second["tools"] and first["tool_choice"] is second["tool_choice"]
+    # The row text comes last, after everything the rows have in common
+    assert first["messages"][-1] == {"role": "user", "content": "row one"}
+    assert second["model"] == "gpt-4o"
+    assert first["extra_body"] == second["extra_body"] == {"prompt_cache_key": first["extra_body"]["prompt_cache_key"]}
+    item = make_queue(["row one"])[0]
+    assert RequestBuilder(TOOLS, "f", "gpt-4o-mini").single("row one", "gpt-4o-mini") == build_request(item)
+
+    packed = builder.packed(["a", "b"], ["0", "1"], "gpt-4o-mini")
+    assert packed["tools"] is builder.packed(["c"], ["2"], "gpt-4o-mini")["tools"]
+    assert packed["messages"][-1]["content"] == '<row id="0">\na\n</row>\n<row id="1">\nb\n</row>'
+    assert packed["extra_body"] != first["extra_body"]
+
+
+def test_engine_records_cached_prompt_tokens():
+    client = FakeClient(cached_tokens=8)
+    engine = ExtractionEngine(client, max_workers=2, prompt_cache_key=True)
+    job_id = engine.submit(make_queue(["a", "b", "c"]))
+    wait_for(engine, job_id)
+
+    assert len({request["extra_body"]["prompt_cache_key"] for request in client.requests}) == 1
+    stats = engine.stats[job_id]
+    assert (stats["cached_tokens"], stats["prompt_tokens"]) == (24, 30)
+    assert engine.throughput(job_id)["cached_share"] == 0.8
+    assert engine.metrics.trace(job_id)[0]["cached_tokens"] == 8
+    assert 'data_rip_tokens_total{model="gpt-4o-mini",type="cached"} 24' in engine.metrics.render_prometheus()
+
+
+def test_scheduler_estimates_shared_tools_once():
+    scheduler = RequestScheduler(FakeClient())
+    builder = RequestBuilder(TOOLS, "f", "gpt-4o-mini")
+    for text in ("a", "b", "c"):
+        scheduler.create(**builder.single(text, "gpt-4o-mini"))
+    assert list(scheduler._tools_tokens) == [id(TOOLS)]
+
+
+def test_requests_match_the_openai_client_signature():
+    builder = RequestBuilder(TOOLS, "f", "gpt-4o-mini", prompt_cache_key=True)
+    single = builder.single("row one", "gpt-4o-mini")
+    streamed = {**single, "stream": True, "stream_options": {"include_usage": True}}
+    packed = builder.packed(["a", "b"], ["0", "1"], "gpt-4o-mini")
+    parameters = inspect.signature(Completions.create).parameters
+    # The key is sent in the body, so clients from before the keyword existed accept it too
+    for request in (single, streamed, packed):
+        assert "prompt_cache_key" not in request and set(request) <= set(parameters)
+
+    sent = []
+
+    def handler(request):
+        sent.append(json.loads(request.content))
+        message = {"role": "assistant", "content": None, "tool_calls": []}
+        choice = {"index": 0, "message": message, "finish_reason": "stop"}
+        return httpx.Response(
+            200, json={"id": "1", "object": "chat.completion", "created": 0, "model": "m", "choices": [choice]}
+        )
+
+    client = openai.OpenAI(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    client.chat.completions.create(**single)
+    assert sent[0]["prompt_cache_key"] == single["extra_body"]["prompt_cache_key"]
@@ -0,0 +1,55 @@
+from fakes import FakeClient, make_queue, wait_for
+
+from data_rip.engine import ExtractionEngine
+from data_rip.routing import ModelRouter
+
+
+def test_router_ladder_and_confidence():
+    router = ModelRouter(["gpt-4o-mini", "gpt-4o"], min_confidence=0.5)
+    assert router.ladder("gpt-4o-mini") == ["gpt-4o-mini", "gpt-4o"]
+    assert router.ladder("gpt-4.1-nano") == ["gpt-4.1-nano", "gpt-4o-mini", "gpt-4o"]
+    assert router.top_model("gpt-4o") == "gpt-4o"
+    assert router.low_confidence({"confidence": 0.2})
+    assert not router.low_confidence({"confidence": 0.5})
+    assert not router.low_confidence({"confidence": True})
+    assert not router.low_confidence({"echo": "no confidence field"})
+
+
+def test_engine_escalates_bad_answers_to_the_stronger_model():
+    client = FakeClient(weak_model="gpt-4o-mini", invalid_on="hard", unsure_on="vague")
+    engine = ExtractionEngine(client, max_workers=1, router=ModelRouter(["gpt-4o"]))
+    job_id = engine.submit(make_queue(["easy", "hard", "vague"]), model="gpt-4o-mini")
+    wait_for(engine, job_id)
+
+    rows = {row["UID"]: row for row in engine.store.get_rows(job_id)}
+    assert engine.store.get_errors(job_id) == []
+    assert rows[0] == {"UID": 0, "response": "easy", "echo": "easy"}
+    assert rows[1]["echo"] == "hard" and rows[2]["confidence"] == 0.9
+    assert client.models.count("gpt-4o") == 2
+    assert engine.escalations[job_id] == {"gpt-4o": 2}
+    stats = engine.stats[job_id]
+    assert (stats["escalated"], stats["invalid"], stats["low_confidence"]) == (2, 1, 1)
+    assert engine.throughput(job_id)["cost_saved"] > 0
+    assert 'data_rip_escalations_total{model="gpt-4o",reason="invalid"} 1' in engine.metrics.render_prometheus()
+
+
+def test_engine_escalates_unsure_packed_rows_directly():
+    client = FakeClient(weak_model="gpt-4o-mini", unsure_on="vague")
+    engine = ExtractionEngine(client, max_workers=1, router=ModelRouter(["gpt-4o"]))
+    job_id = engine.submit(make_queue(["a", "vague", "c"]), model="gpt-4o-mini", pack_size=3)
+    wait_for(engine, job_id)
+
+    assert client.models == ["gpt-4o-mini", "gpt-4o"]
+    assert len(engine.store.get_rows(job_id)) == 3
+    assert engine.escalations[job_id] == {"gpt-4o": 1}
+
+
+def test_engine_keeps_low_confidence_answers_of_the_last_model():
+    client = FakeClient(weak_model="gpt-4o-mini", unsure_on="vague")
+    engine = ExtractionEngine(client, max_workers=1, router=ModelRouter([]))
+    job_id = engine.submit(make_queue(["vague"]), model="gpt-4o-mini")
+    wait_for(engine, job_id)
+
+    assert client.models == ["gpt-4o-mini"]
+    assert engine.store.get_rows(job_id)[0]["confidence"] == 0.2
+    assert engine.stats[job_id]["escalated"] == 0
@@ -0,0 +1,125 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from fakes import FakeClient, make_queue, wait_for
+
+from data_rip.engine import ExtractionEngine
+from data_rip.ratelimit import RequestCancelled, RequestScheduler
+from data_rip.scheduling import CANCELLED, PAUSED, RUNNING, JobQueue, dispatch_order
+
+
+def take(queue, count):
+    return [queue.get()[0] for _ in range(count)]
+
+
+def test_jobs_share_by_weight_and_priority_goes_first():
+    queue = JobQueue()
+    queue.extend("big", list(range(100)), weight=3)
+    queue.extend("small", list(range(100)))
+    assert take(queue, 8).count("big") == 6
+
+    queue.extend("preview", list(range(3)), priority=1)
+    assert take(queue, 3) == ["preview"] * 3
+    assert queue.waiting("preview") == 0
+
+
+def test_idle_job_gets_no_saved_up_credit():
+    queue = JobQueue()
+    queue.extend("big", list(range(100)))
+    take(queue, 50)
+    queue.extend("late", list(range(100)))
+    assert sorted(take(queue, 10)) == ["big"] * 5 + ["late"] * 5
+
+
+def test_paused_job_is_skipped_until_resumed():
+    queue = JobQueue()
+    queue.extend("a", [1, 2])
+    queue.extend("b", [3])
+    queue.pause("a")
+    assert queue.get() == ("b", 3)
+    assert queue.state("a") == PAUSED
+    queue.resume("a")
+    assert queue.get() == ("a", 1)
+
+    assert queue.cancel("a") == 1
+    assert (queue.state("a"), queue.waiting("a")) == (CANCELLED, 0)
+    queue.extend("a", [4])
+    assert (queue.state("a"), queue.get()) == (RUNNING, ("a", 4))
+
+
+def test_cancelled_job_keeps_rows_unfinished_and_resumes():
+    client = FakeClient(delay=0.05)
+    engine = ExtractionEngine(client, max_workers=2)
+    texts = [f"text {i}" for i in range(40)]
+    job_id = engine.submit(make_queue(texts))
+    time.sleep(0.12)
+    engine.cancel(job_id)
+    deadline = time.monotonic() + 5
+    while engine.running(job_id) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    progress = engine.store.get_progress(job_id)
+    assert not engine.running(job_id) and client.calls < len(texts)
+    # Answers of the calls in flight when the job was cancelled are discarded
+    assert progress["failed"] == 0 and progress["completed"] <= client.calls
+    discarded = client.calls - progress["completed"]
+
+    engine.submit(make_queue(texts), job_id=job_id)
+    wait_for(engine, job_id)
+    assert client.calls == len(texts) + discarded and engine.job_state(job_id) == RUNNING
+
+
+def test_cancelled_pack_in_flight_is_discarded():
+    client = FakeClient(delay=0.2)
+    engine = ExtractionEngine(client, max_workers=2)
+    texts = [f"text {i}" for i in range(8)]
+    job_id = engine.submit(make_queue(texts), pack_size=4)
+    deadline = time.monotonic() + 5
+    while client.in_flight < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    engine.cancel(job_id)
+    while engine.running(job_id) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # Both packs were sent and are recorded, but none of their rows was checkpointed or failed
+    progress = engine.store.get_progress(job_id)
+    assert client.calls == 2 and len(engine.trace(job_id)["calls"]) == 2
+    assert (progress["completed"], progress["failed"]) == (0, 0)
+
+    engine.submit(make_queue(texts), job_id=job_id, pack_size=4)
+    wait_for(engine, job_id)
+    assert engine.store.get_progress(job_id)["completed"] == len(texts)
+
+def test_scheduler_gives_up_on_a_cancelled_call_waiting_for_budget():
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: "response")))
+    scheduler = RequestScheduler(client, requests_per_minute=6)
+    scheduler.requests.acquire(6)
+    start = time.monotonic()
+    with pytest.raises(RequestCancelled):
+        scheduler.create(cancelled=lambda: time.monotonic() - start > 0.2, model="m", messages=[])
+    assert time.monotonic() - start < 2
+
+
+def test_dispatch_orders_by_estimated_length():
+    sizes = [5, 100, 3, 7, 80, 2, 9, 1, 50, 4]
+    assert dispatch_order(sizes, "file") == list(range(10))
+    assert dispatch_order(sizes, "shortest") == [7, 5, 2, 9, 0, 3, 6, 8, 4, 1]
+    bucketed = dispatch_order(sizes, "bucketed")
+    # The longest calls start early and short ones are sent between them
+    assert sorted(bucketed) == list(range(10)) and bucketed[:4] == [1, 5, 4, 7]
+    assert dispatch_order([], "bucketed") == []
+    with pytest.raises(ValueError):
+        dispatch_order(sizes, "random")
+
+
+def test_engine_sends_calls_in_dispatch_order():
+    client = FakeClient()
+    engine = ExtractionEngine(client, max_workers=1, dispatch="shortest")
+    texts = ["a much longer text than the others " * 20, "short", "a medium length text"]
+    job_id = engine.submit(make_queue(texts))
+    wait_for(engine, job_id)
+
+    assert [request["messages"][-1]["content"] for request in client.requests] == sorted(texts, key=len)
+    with pytest.raises(ValueError):
+        ExtractionEngine(client, dispatch="random")
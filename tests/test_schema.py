@@ -0,0 +1,66 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from data_rip.cache import ResultCache
+from data_rip.prompts import FUNCTION_CALLING_FEW_SHOTS_DICT
+from data_rip.schema import build_tools, clean_schema, generate_schema
+from data_rip.validation import SchemaValidator
+
+SCHEMA_TEXT = '```json\n{"properties": {"note": {"type": "string", "description": "The writer\'s note"}}}\n```'
+
+
+class StubScheduler:
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    def create(self, **request):
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+
+def test_clean_schema_keeps_apostrophes_and_fills_required():
+    schema = clean_schema(SCHEMA_TEXT)
+    assert schema["properties"]["note"]["description"] == "The writer's note"
+    assert schema["required"] == []
+    assert clean_schema("{'properties': {'a': {'type': 'string'}}, 'required': ['a']}")["required"] == ["a"]
+
+    with pytest.raises(ValueError):
+        clean_schema('{"type": "object"}')
+    with pytest.raises(json.JSONDecodeError):
+        clean_schema("not a schema")
+
+
+def test_clean_schema_parses_the_few_shot_answers():
+    answers = [message["content"] for message in FUNCTION_CALLING_FEW_SHOTS_DICT if message["role"] == "assistant"]
+    schemas = [clean_schema(answer) for answer in answers]
+
+    assert [schema["title"] for schema in schemas] == ["CountryPopulation", "User", "SurveyResponse"]
+    # Python literals become their JSON values, so the defaults are kept
+    assert schemas[1]["properties"]["signup_ts"]["default"] is None
+    assert schemas[1]["properties"]["friends"]["default"] == []
+    assert SchemaValidator.for_tools(build_tools(schemas[1])).validate({"id": 1}) == {
+        "id": 1,
+        "name": "John Doe",
+        "signup_ts": None,
+        "friends": [],
+    }
+    assert clean_schema("{'properties': {'ok': {'type': 'boolean', 'default': True}}}")["properties"]["ok"]["default"]
+    assert clean_schema("{'properties': {'ok': {'type': 'boolean', 'default': true}}}")["properties"]["ok"]["default"]
+
+def test_generate_schema_is_memoized_by_normalized_instruction(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.db"))
+    scheduler = StubScheduler(SCHEMA_TEXT)
+
+    assert generate_schema(scheduler, "Extract the  note", cache=cache) == SCHEMA_TEXT
+    assert generate_schema(scheduler, "  extract the note\n", cache=cache) == SCHEMA_TEXT
+    assert scheduler.calls == 1
+
+    # Another model, or an answer that isn't a schema, isn't served from the memo
+    generate_schema(scheduler, "Extract the note", model="other-model", cache=cache)
+    broken = StubScheduler("Sorry, I can't help with that")
+    generate_schema(broken, "Something else", cache=cache)
+    generate_schema(broken, "Something else", cache=cache)
+    assert (scheduler.calls, broken.calls) == (2, 2)
@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from fakes import FakeClient, make_queue, wait_for
+
+from data_rip.engine import ExtractionEngine
+from data_rip.streaming import FieldParser, read_stream
+
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "f",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "criticisms": {"type": "array", "items": {"type": "string"}},
+                    "notes": {"type": "string"},
+                },
+                "required": ["name", "criticisms"],
+            },
+        },
+    }
+]
+ANSWER = {"name": 'Jane "JD", Doe', "criticisms": ["slow {shipping}", "no [refund]"], "notes": "called twice"}
+
+
+def chunks(arguments, size=4, last=True):
+    for start in range(0, len(arguments), size):
+        function = SimpleNamespace(name="f" if not start else None, arguments=arguments[start : start + size])
+        delta = SimpleNamespace(tool_calls=[SimpleNamespace(function=function)])
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+    if last:
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=50, completion_tokens=20))
+
+
+class GatedClient:
+    """Streams ``ANSWER``, holding the stream after its first field until ``gate`` is set."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.closed = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        assert kwargs["stream"]
+        return self.stream()
+
+    def stream(self):
+        first, rest = json.dumps(ANSWER).split(', "criticisms"', 1)
+        try:
+            yield from chunks(first + ",", last=False)
+            self.gate.wait(5)
+            yield from chunks(' "criticisms"' + rest)
+        except GeneratorExit:
+            self.closed = True
+            raise
+
+
+def test_parser_returns_fields_as_they_close():
+    parser = FieldParser()
+    text = json.dumps(ANSWER)
+    closed = [parser.feed(text[start : start + 3]) for start in range(0, len(text), 3)]
+
+    assert [field for field in closed if field] == [{key: value} for key, value in ANSWER.items()]
+    assert parser.fields == ANSWER and parser.text == text
+
+
+def test_read_stream_stops_once_required_fields_close():
+    seen = []
+    message, usage, first_field = read_stream(chunks(json.dumps(ANSWER)), seen.append, required=["name", "criticisms"])
+
+    arguments = json.loads(message.tool_calls[0].function.arguments)
+    assert arguments == {"name": ANSWER["name"], "criticisms": ANSWER["criticisms"]}
+    assert usage is None and first_field is not None
+    assert seen == [{"name": ANSWER["name"]}, {"criticisms": ANSWER["criticisms"]}]
+
+    message, usage, _ = read_stream(chunks(json.dumps(ANSWER)))
+    assert json.loads(message.tool_calls[0].function.arguments) == ANSWER and usage.completion_tokens == 20
+
+
+def test_engine_shows_streamed_fields_before_the_row_finishes():
+    client = GatedClient()
+    engine = ExtractionEngine(client, max_workers=1, stream="on")
+    queue = [{**item, "tools": TOOLS} for item in make_queue(["complaint"])]
+    job_id = engine.submit(queue, id_column="UID")
+
+    for _ in range(500):
+        if engine.partial_rows(job_id):
+            break
+        time.sleep(0.01)
+    assert engine.partial_rows(job_id) == [{"UID": 0, "response": "complaint", "name": ANSWER["name"]}]
+    client.gate.set()
+    wait_for(engine, job_id)
+
+    assert engine.partial_rows(job_id) == []
+    assert engine.store.get_rows(job_id)[0]["notes"] == "called twice"
+    assert engine.trace(job_id)["calls"][0]["first_field"] is not None
+    assert engine.throughput(job_id)["mean_first_field"] is not None
+
+
+def test_early_stop_leaves_out_the_optional_fields():
+    client = GatedClient()
+    client.gate.set()
+    engine = ExtractionEngine(client, max_workers=1, stream="early")
+    job_id = engine.submit([{**item, "tools": TOOLS} for item in make_queue(["complaint"])])
+    wait_for(engine, job_id)
+
+    row = engine.store.get_rows(job_id)[0]
+    assert row["criticisms"] == ANSWER["criticisms"] and "notes" not in row
+    assert client.closed and engine.stats[job_id]["early_stops"] == 1
+    # Usage wasn't reported, so tokens are estimated
+    assert engine.stats[job_id]["completion_tokens"] > 0
+
+
+def test_streamed_answers_match_whole_answers():
+    texts = [f"text {i}" for i in range(5)]
+    results = {}
+    for stream in ("off", "on"):
+        client = FakeClient(stream_piece=2)
+        engine = ExtractionEngine(client, max_workers=2, stream=stream)
+        job_id = engine.submit(make_queue(texts))
+        wait_for(engine, job_id)
+        results[stream] = sorted(row["echo"] for row in engine.store.get_rows(job_id))
+        assert (client.pieces_sent > 0) == (stream == "on")
+    assert results["on"] == results["off"] == texts
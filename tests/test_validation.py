@@ -0,0 +1,51 @@
+import pytest
+
+from data_rip.validation import SchemaValidationError, SchemaValidator
+
+SCHEMA = {
+    "properties": {
+        "name": {"type": "string"},
+        "age": {"type": "integer"},
+        "status": {"type": "string", "enum": ["open", "closed"], "default": "open"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "address": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]},
+        "score": {"type": ["number", "null"]},
+    },
+    "required": ["name", "age"],
+}
+
+
+def test_validator_accepts_matching_arguments_and_applies_defaults():
+    validator = SchemaValidator(SCHEMA)
+
+    assert validator.validate({"name": "Ann", "age": 3.0, "tags": ["a"], "address": {"city": "Oslo"}}) == {
+        "name": "Ann",
+        "age": 3.0,
+        "status": "open",
+        "tags": ["a"],
+        "address": {"city": "Oslo"},
+    }
+    # Null for an optional field is left alone rather than rejected
+    assert validator.validate({"name": "Ann", "age": 1, "tags": None, "status": None})["status"] == "open"
+
+
+def test_validator_reports_every_problem():
+    validator = SchemaValidator(SCHEMA)
+
+    with pytest.raises(SchemaValidationError) as error:
+        validator.validate({"age": True, "status": "pending", "tags": ["a", 2], "address": {}})
+    assert error.value.problems == [
+        "$.name is required",
+        "$.age should be integer, got bool",
+        "$.status should be one of ['open', 'closed'], got 'pending'",
+        "$.tags[1] should be string, got int",
+        "$.address.city is required",
+    ]
+
+    with pytest.raises(SchemaValidationError):
+        validator.validate(["not", "an", "object"])
+
+
+def test_validator_for_tools_uses_the_function_parameters():
+    tools = [{"type": "function", "function": {"name": "f", "parameters": {"type": "object", **SCHEMA}}}]
+    assert SchemaValidator.for_tools(tools).validate({"name": "Ann", "age": 1})["status"] == "open"
@@ -0,0 +1,71 @@
+import csv
+import threading
+
+import pytest
+from fakes import TOOLS, FakeClient
+
+from data_rip.engine import ExtractionEngine
+from data_rip.jobs import SQLiteJobStore
+from data_rip.worker import Worker, enqueue_extraction
+from data_rip.workqueue import WorkQueue
+
+
+def test_work_queue_leases_ranges_and_reclaims_expired_ones(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"))
+    queue.enqueue_job("job", {"model": "m"}, total_rows=5, range_rows=2)
+
+    first = queue.claim("a")
+    second = queue.claim("b", lease_seconds=0)
+    assert (first["start_row"], first["end_row"], first["spec"]) == (0, 2, {"model": "m"})
+    assert (second["start_row"], second["end_row"]) == (2, 4)
+    assert not queue.renew(first["task_id"], "b")
+    assert queue.renew(first["task_id"], "a")
+
+    # b's lease has run out, so its range is handed out again before the last one
+    reclaimed = queue.claim("c")
+    assert (reclaimed["task_id"], reclaimed["attempt"]) == (second["task_id"], 2)
+    assert not queue.renew(second["task_id"], "b")
+
+    queue.complete(first["task_id"], "a")
+    assert queue.counts("job") == {"pending": 1, "leased": 1, "done": 1}
+    assert queue.is_running("job")
+
+
+def test_workers_share_a_job_through_the_queue(tmp_path):
+    pytest.importorskip("pandas")
+    path = tmp_path / "rows.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["UID", "response"])
+        writer.writerows([i, f"text {i}"] for i in range(23))
+
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    queue = WorkQueue(str(tmp_path / "queue.db"))
+    spec = {
+        "path": str(path),
+        "columns": ["UID", "response"],
+        "text_column": "response",
+        "tools": TOOLS,
+        "function_name": "f",
+        "model": "m",
+        "pack_size": 1,
+    }
+    enqueue_extraction(queue, store, "job", spec, total_rows=23, range_rows=5)
+    # A worker that claimed a range and died before doing anything
+    queue.claim("dead", lease_seconds=0)
+
+    workers = [
+        Worker(queue, ExtractionEngine(FakeClient(delay=0.01), store=store, max_workers=2), poll_seconds=0.05)
+        for _ in range(2)
+    ]
+    threads = [threading.Thread(target=worker.run, kwargs={"stop_when_idle": True}) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    progress = store.get_progress("job")
+    assert (progress["completed"], progress["failed"], progress["done"]) == (23, 0, True)
+    assert sorted(row["UID"] for row in store.get_rows("job", limit=100)) == list(range(23))
+    assert queue.counts("job")["done"] == 5
+    assert not queue.is_running("job")